@@ -0,0 +1,6 @@
+def __getattr__(name):
+    # imported on first use, so that importing a submodule stays cheap
+    if name == "solve_async":
+        from geosolver.asyncsolve import solve_async
+        return solve_async
+    raise AttributeError("module 'geosolver' has no attribute " + repr(name))
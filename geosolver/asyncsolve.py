@@ -0,0 +1,111 @@
+"""Solving problems from asyncio code.
+
+solve_async runs the structural solving and propagation of a new
+GeometricSolver in an executor, so that the event loop is not blocked.
+Progress is reported through an async iterator, and cancellation is
+cooperative: when the awaiting task is cancelled (or cancel is called),
+the solver stops at its next search step or method execution, instead of
+running to completion.
+
+Example:
+
+    task = geosolver.solve_async(problem)
+    async for progress in task.progress():
+        print(progress.merges, progress.toplevel)
+    solver = await task
+    result = solver.get_result()
+
+The problem must not be changed while it is being solved.
+"""
+
+import time
+import asyncio
+import threading
+from collections import namedtuple
+
+from geosolver.geometric import GeometricSolver
+from geosolver.method import Cancelled
+
+Progress = namedtuple("Progress", ["merges", "toplevel"])
+Progress.__doc__ = """Progress of solving: number of merges done and
+number of top-level clusters"""
+
+
+def solve_async(problem, executor=None, interval=0.1, **options):
+    """Start solving a problem in an executor (None for the default
+       executor of the running event loop). Returns a SolveTask, which
+       can be awaited for the GeometricSolver. Options are passed to
+       GeometricSolver (e.g. max_time, max_merges, single_branch).
+       Progress is reported at most once per interval seconds."""
+    return SolveTask(problem, executor, interval, options)
+
+
+class SolveTask:
+    """A problem being solved in an executor. Awaiting it returns the
+       GeometricSolver, or raises asyncio.CancelledError if cancelled."""
+
+    def __init__(self, problem, executor, interval, options):
+        self._problem = problem
+        self._options = options
+        self._interval = interval
+        self._next = 0.0
+        self._event = threading.Event()
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._future = self._loop.run_in_executor(executor, self._solve)
+
+    def cancel(self):
+        """Stop solving. Awaiting the task then raises CancelledError."""
+        self._event.set()
+
+    def cancelled(self):
+        return self._event.is_set()
+
+    def done(self):
+        return self._future.done()
+
+    def __await__(self):
+        return self._result().__await__()
+
+    async def _result(self):
+        try:
+            # shielded, so the future is done only when the solver has
+            # stopped
+            return await asyncio.shield(self._future)
+        except asyncio.CancelledError:
+            # the awaiting task was cancelled: stop the solver too
+            self._event.set()
+            raise
+        except Cancelled:
+            raise asyncio.CancelledError()
+
+    async def progress(self):
+        """Generate Progress reports until solving has finished."""
+        while True:
+            report = await self._queue.get()
+            if report is None:
+                return
+            yield report
+
+    # executed in the executor
+
+    def _solve(self):
+        try:
+            solver = GeometricSolver(self._problem, cancel=self._event,
+                                     progress=self._report, **self._options)
+            # final report; later changes are not part of this task
+            self._next = 0.0
+            self._report(solver.dr)
+            solver.dr.set_progress(None)
+            solver.dr.set_cancel(None)
+            return solver
+        finally:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+
+    def _report(self, solver):
+        now = time.time()
+        if now < self._next:
+            return
+        self._next = now + self._interval
+        report = Progress(solver.merge_count(), len(solver.top_level()))
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, report)
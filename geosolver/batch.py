@@ -0,0 +1,206 @@
+"""Solve many problems from the command line.
+
+Reads problems from a file or standard input, in the JSON or binary
+format of geosolver.io (detected automatically), solves them in a pool of
+worker processes, and writes a JSON object per problem to the output, one
+per line, as soon as it is available:
+
+    index            - position of the problem in the input
+    status           - "ok", "timeout" or "error"
+    constrainedness  - see GeometricSolver.get_constrainedness
+    flag             - flag of the top-level result cluster
+    incomplete       - True iff solving stopped on the budget
+    variables        - the point variables of the problem
+    solutions        - solutions of the top-level cluster, each a list of
+                       coordinates in the order of variables
+    time             - seconds spent on reading, solving and the result
+    error            - error message, if status is "error"
+
+Usage:
+
+    python -m geosolver.batch problems.jsonl -o results.jsonl -j 8 -t 10
+
+Results are written in input order, unless --unordered is given, in which
+case they are written as they complete. The number of problems in
+progress is bounded, so inputs of any size are streamed.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+from io import TextIOWrapper
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from geosolver.io import MAGIC, read_binary, problem_to_dict, \
+    problem_from_dict
+from geosolver.geometric import GeometricSolver
+
+
+class _Timeout(Exception):
+    pass
+
+
+def _alarm(signum, frame):
+    raise _Timeout()
+
+
+def solve_record(index, data, options):
+    """Solve a problem, given as a line of JSON or a dictionary (see
+       io.problem_to_dict), and return a result dictionary (see module
+       documentation). Options is a dictionary with keys timeout,
+       max_solutions, single_branch and numeric_fallback."""
+    result = {"index": index}
+    start = time.time()
+    timeout = options.get("timeout")
+    timer = timeout is not None and hasattr(signal, "setitimer")
+    if timer:
+        signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        if isinstance(data, str):
+            data = json.loads(data)
+        (problem, solutions) = problem_from_dict(data)
+        read = time.time()
+        solver = GeometricSolver(problem,
+                                 single_branch=options.get("single_branch",
+                                                           False))
+        if options.get("max_solutions") is not None:
+            solver.set_max_solutions(options["max_solutions"])
+        if options.get("numeric_fallback"):
+            solver.set_numeric_fallback(True)
+        solved = time.time()
+        cluster = solver.get_result()
+        variables = list(problem.prototype)
+        result["status"] = "ok"
+        result["constrainedness"] = solver.get_constrainedness()
+        result["flag"] = cluster.flag
+        result["incomplete"] = cluster.incomplete
+        result["variables"] = variables
+        result["solutions"] = [[[float(x) for x in solution[v]]
+                                for v in variables]
+                               for solution in cluster.solutions]
+        done = time.time()
+        result["time"] = {"read": read - start, "solve": solved - read,
+                          "result": done - solved, "total": done - start}
+    except _Timeout:
+        result["status"] = "timeout"
+        result["time"] = {"total": time.time() - start}
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+        result["time"] = {"total": time.time() - start}
+    finally:
+        if timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return result
+
+
+def read_records(stream):
+    """Generate problems from a binary stream (e.g. sys.stdin.buffer), in
+       the JSON or binary format of geosolver.io: lines of JSON, which are
+       parsed by the workers, or dictionaries."""
+    if stream.peek(len(MAGIC))[:len(MAGIC)] == MAGIC:
+        for (problem, solutions) in read_binary(stream):
+            yield problem_to_dict(problem)
+    else:
+        for line in TextIOWrapper(stream, encoding="utf-8"):
+            if line.strip():
+                yield line
+
+
+def solve_all(records, output, jobs=None, options=None, ordered=True,
+              window=None):
+    """Solve problems from an iterable of records (see read_records) in a
+       pool of jobs worker processes (None for the number of processors),
+       and write results to a text stream, one line of JSON per problem.
+       At most window problems (default 4 per worker) are in progress at
+       any time. Returns the number of problems solved."""
+    if options is None:
+        options = {}
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if window is None:
+        window = 4 * jobs
+    with ProcessPoolExecutor(jobs) as executor:
+        pending = deque()
+        count = 0
+        for data in records:
+            pending.append(executor.submit(solve_record, count, data,
+                                           options))
+            count += 1
+            while len(pending) >= window:
+                _write_done(pending, output, ordered)
+        while len(pending) > 0:
+            _write_done(pending, output, ordered)
+    return count
+
+
+def _write_done(pending, output, ordered):
+    """write the first result in order, or all completed results"""
+    if ordered:
+        done = [pending.popleft()]
+    else:
+        (done, not_done) = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.remove(future)
+    for future in done:
+        output.write(json.dumps(future.result(), separators=(",", ":")))
+        output.write("\n")
+    output.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m geosolver.batch",
+        description="Solve problems in the JSON or binary format of "
+                    "geosolver.io, and write results as JSON lines.")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="input file, or - for standard input (default)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="output file, or - for standard output (default)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes "
+                             "(default: number of processors)")
+    parser.add_argument("-t", "--timeout", type=float, default=None,
+                        help="maximum time in seconds per problem")
+    parser.add_argument("--unordered", action="store_true",
+                        help="write results as they complete, "
+                             "instead of in input order")
+    parser.add_argument("--max-solutions", type=int, default=None,
+                        help="maximum number of solutions per cluster")
+    parser.add_argument("--single-branch", action="store_true",
+                        help="keep only the solution closest to the "
+                             "prototype")
+    parser.add_argument("--numeric-fallback", action="store_true",
+                        help="solve rigid, non-decomposable problems "
+                             "numerically")
+    args = parser.parse_args(argv)
+    options = {"timeout": args.timeout,
+               "max_solutions": args.max_solutions,
+               "single_branch": args.single_branch,
+               "numeric_fallback": args.numeric_fallback}
+    if args.input == "-":
+        input_ = sys.stdin.buffer
+    else:
+        input_ = open(args.input, "rb")
+    if args.output == "-":
+        output = sys.stdout
+    else:
+        output = open(args.output, "w")
+    try:
+        solve_all(read_records(input_), output, args.jobs, options,
+                  not args.unordered)
+    finally:
+        if input_ is not sys.stdin.buffer:
+            input_.close()
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,858 @@
+"""Batched solving of a GeometricProblem for many parameter vectors.
+
+A BatchSolver decomposes a problem once, using a GeometricSolver, and
+compiles the resulting plan (the methods of the ClusterSolver, in
+topological order) into a function that evaluates the plan for N parameter
+vectors at once. Compiled plans are cached by structural fingerprint. Configurations are
+represented by numpy arrays of shape (N, dimension) per point variable,
+and the merge methods of ClusterSolver3D are executed by vectorized kernels.
+
+Where a method has more than one solution, the configurations of a cluster
+are split into branches. Each branch has a validity mask, indicating for
+which samples the branch is a solution. Branches are compacted after each
+method, so that valid branches come first and branches that are not valid
+for any sample are dropped.
+
+Methods without a vectorized kernel are executed per sample, using their
+multi_execute method.
+
+Example:
+
+    batch = BatchSolver(problem, [con1, con2])
+    result = batch.solve(values)      # values is an N x 2 array
+    result.count                      # number of solutions per sample
+    result.solution(i, 0)             # first solution of sample i
+"""
+
+import itertools
+import numpy
+
+from geosolver.geometric import GeometricSolver, DistanceConstraint, \
+    AngleConstraint, FixConstraint
+from geosolver.clsolver import PrototypeMethod
+from geosolver.clsolver3D import MergePR, MergeDR, MergeRR, MergeDDD, \
+    MergeTTD, MergeDAD, MergeADD, MergeAA, MergeSD
+from geosolver.cluster import Rigid, Hedgehog
+from geosolver.configuration import Configuration
+from geosolver.intersections import is_left_handed, is_right_handed
+from geosolver.vector import vector
+from geosolver.diagnostic import diag_print
+from geosolver.notify import Listener
+import geosolver.tolerance as tolerance
+
+
+class BatchResult:
+    """Solutions of a BatchSolver for N samples.
+
+       instance attributes:
+        variables   - list of V point variables
+        solutions   - array (N, B, V, dimension) of point coordinates, where
+                      B is the maximum number of solutions of any sample
+        valid       - boolean array (N, B); valid[i, b] iff solutions[i, b]
+                      is a solution of sample i
+        count       - array (N,) with the number of solutions per sample
+        feasible    - boolean array (N,); True iff sample has a solution
+    """
+
+    def __init__(self, variables, solutions, valid):
+        self.variables = variables
+        self.solutions = solutions
+        self.valid = valid
+        self.count = valid.sum(axis=1)
+        self.feasible = self.count > 0
+
+    def solution(self, sample, branch=0):
+        """return solution as a dictionary mapping variables to vectors,
+           or None if there is no such solution"""
+        if branch >= self.valid.shape[1] or not self.valid[sample, branch]:
+            return None
+        points = self.solutions[sample, branch]
+        solution = {}
+        for i in range(len(self.variables)):
+            solution[self.variables[i]] = vector(points[i].tolist())
+        return solution
+
+    def __len__(self):
+        return len(self.count)
+
+
+class BatchSolver(Listener):
+    """Solves a GeometricProblem for many values of its parameters at once.
+
+       The plan of the problem is compiled into a straight-line function
+       (see compile_plan). Compiled plans are cached by the structural
+       fingerprint of the problem, so the problem is only decomposed when a
+       structure is seen for the first time. When the structure of the
+       problem changes, the plan is invalidated and a new one is obtained on
+       the next call to solve. Only 3D problems are supported.
+
+       instance attributes:
+        problem     - the GeometricProblem
+        parameters  - list of ParametricConstraints, one per column of the
+                      values passed to solve
+    """
+
+    def __init__(self, problem, parameters=None):
+        """Create a batch solver for a problem.
+
+           keyword args:
+            problem     - a GeometricProblem
+            parameters  - a list of DistanceConstraints and AngleConstraints
+                          in the problem, default all of them
+        """
+        Listener.__init__(self)
+        if problem.dimension != 3:
+            raise Exception("batch solving supports 3D problems only")
+        self.problem = problem
+        if parameters is None:
+            parameters = _parametric(problem)
+        self.parameters = list(parameters)
+        self._plan = None
+        self._constraints = None
+        problem.cg.add_listener(self)
+
+    def solve(self, values):
+        """Solve for each row in values, an (N x len(parameters)) array of
+           parameter values. Returns a BatchResult."""
+        values = numpy.asarray(values, dtype=float)
+        if values.ndim != 2 or values.shape[1] != len(self.parameters):
+            raise Exception("values must be an array of N x "
+                            + str(len(self.parameters)) + " parameters")
+        plan = self.get_plan()
+        n = values.shape[0]
+        given = {}
+        for i in range(len(self.parameters)):
+            given[self.parameters[i]] = values[:, i]
+        columns = []
+        for con in self._constraints:
+            if con in given:
+                columns.append(given[con])
+            else:
+                columns.append(numpy.full(n, float(con.get_parameter())))
+        branches = plan.function(columns, self.problem.prototype, n)
+        (coords, valid) = _stack(branches, n)
+        solutions = numpy.full((n, valid.shape[0], len(plan.variables), 3),
+                               numpy.nan)
+        for i in range(len(plan.variables)):
+            solutions[:, :, i, :] = coords[plan.variables[i]].transpose(1, 0, 2)
+        return BatchResult(list(plan.variables), solutions, valid.transpose())
+
+    def get_plan(self):
+        """the CompiledPlan for the current structure of the problem"""
+        if self._plan is None:
+            key = fingerprint(self.problem)
+            plan = _plans.get(key)
+            if plan is None:
+                solver = GeometricSolver(self.problem)
+                try:
+                    plan = compile_plan(solver)
+                finally:
+                    self.problem.rem_listener(solver)
+                    self.problem.cg.rem_listener(solver)
+                if len(_plans) >= _max_plans:
+                    del _plans[next(iter(_plans))]
+                _plans[key] = plan
+            else:
+                diag_print("batch plan found in cache", "batchsolve")
+            self._constraints = _parametric(self.problem)
+            self._plan = plan
+        return self._plan
+
+    def receive_notify(self, object, message):
+        (type, data) = message
+        if type in ("add_constraint", "rem_constraint", "add_constraints",
+                    "rem_constraints", "add_variable", "rem_variable"):
+            self._plan = None
+            self._constraints = None
+
+
+class CompiledPlan:
+    """A plan compiled into a Python function.
+
+       instance attributes:
+        variables   - list of point variables, in the order of solutions
+        source      - the source code of the function
+        function    - function(columns, prototype, n) returning a list of
+                      (coordinates, valid) branches of the top-level cluster,
+                      where columns is a list of (n,) arrays with the
+                      parameters of the distance and angle constraints, in
+                      the order of fingerprint, and prototype maps
+                      variables to points
+    """
+
+    def __init__(self, variables, source, function):
+        self.variables = variables
+        self.source = source
+        self.function = function
+
+
+# structural fingerprint -> CompiledPlan
+_plans = {}
+_max_plans = 32
+
+
+def fingerprint(problem):
+    """The structural fingerprint of a problem: its dimension, variables and
+       the types and variables of its constraints, but not the values of
+       parameters or prototype points."""
+    variables = sorted(map(repr, problem.cg.variables()))
+    constraints = sorted(map(_constraint_key, problem.cg.constraints()))
+    return (problem.dimension, tuple(variables), tuple(constraints))
+
+
+def _constraint_key(con):
+    return (con.__class__.__name__, tuple(map(repr, con.variables())))
+
+
+def _parametric(problem):
+    """distance and angle constraints of a problem, in fingerprint order"""
+    constraints = list(filter(
+        lambda c: isinstance(c, (DistanceConstraint, AngleConstraint)),
+        problem.cg.constraints()))
+    constraints.sort(key=_constraint_key)
+    return constraints
+
+
+def compile_plan(solver):
+    """Compile the plan of a GeometricSolver into a straight-line function.
+
+       The function creates the configurations of the leaf clusters from
+       parameter columns and prototype points, and then calls the kernel of
+       each method in topological order. Returns a CompiledPlan.
+    """
+    dr = solver.dr
+    if not dr.is_complete():
+        raise Exception("problem has not been solved completely")
+    variables = sorted(solver.problem.cg.variables(), key=repr)
+    rigids = list(filter(lambda c: isinstance(c, Rigid), dr.top_level()))
+    if len(rigids) != 1 or len(dr.top_level()) != 1 \
+            or set(rigids[0].vars) != set(variables):
+        raise Exception("batch solving requires a well-constrained problem")
+    (leaves, plan) = _order(solver)
+    column = {}
+    parametric = _parametric(solver.problem)
+    for i in range(len(parametric)):
+        column[parametric[i]] = i
+    namespace = {"numpy": numpy, "_points": _points, "_step": _step}
+    names = {}
+
+    def name(obj, prefix):
+        if obj not in names:
+            names[obj] = prefix + str(len(names))
+            namespace[names[obj]] = obj
+        return names[obj]
+
+    lines = ["def _evaluate(columns, prototype, n):",
+             "    ones = numpy.ones(n, dtype=bool)"]
+    branches = {}
+    for cluster in leaves:
+        branches[cluster] = "b" + str(len(branches))
+        obj = solver._map[cluster]
+        if isinstance(obj, DistanceConstraint):
+            (v0, v1) = [name(v, "v") for v in obj.variables()]
+            coords = "{%s: _points(n, 0.0, 0.0, 0.0), " \
+                     "%s: _points(n, columns[%d], 0.0, 0.0)}" \
+                     % (v0, v1, column[obj])
+        elif isinstance(obj, AngleConstraint):
+            (v0, v1, v2) = [name(v, "v") for v in obj.variables()]
+            coords = "{%s: _points(n, 1.0, 0.0, 0.0), " \
+                     "%s: _points(n, 0.0, 0.0, 0.0), " \
+                     "%s: _points(n, numpy.cos(columns[%d]), " \
+                     "numpy.sin(columns[%d]), 0.0)}" \
+                     % (v0, v1, v2, column[obj], column[obj])
+        elif isinstance(cluster, Rigid) and len(cluster.vars) == 1:
+            v = name(obj, "v")
+            coords = "{%s: _points(n, prototype[%s][0], prototype[%s][1], " \
+                     "prototype[%s][2])}" % (v, v, v, v)
+        else:
+            raise Exception("cannot compile leaf cluster " + str(cluster))
+        lines.append("    %s = [(%s, ones)]" % (branches[cluster], coords))
+    for method in plan:
+        inputs = method.inputs()
+        kernel = _kernels.get(type(method), _execute_per_sample)
+        output = "b" + str(len(branches))
+        branches[method.outputs()[0]] = output
+        lines.append("    %s = _step(%s, %s, (%s,), (%s,), n)" % (
+            output, name(kernel, "f"), name(method, "m"),
+            ", ".join([name(c, "k") for c in inputs]),
+            ", ".join([branches[c] for c in inputs])))
+    lines.append("    return " + branches[rigids[0]])
+    source = "\n".join(lines) + "\n"
+    exec(compile(source, "<batch plan>", "exec"), namespace)
+    diag_print("compiled batch plan: %d leaves, %d methods", "batchsolve",
+               len(leaves), len(plan))
+    return CompiledPlan(variables, source, namespace["_evaluate"])
+
+
+def _order(solver):
+    """leaf clusters and a topological ordering of the methods of a solver"""
+    dr = solver.dr
+    determined = {}
+    for method in dr.methods():
+        for cluster in method.outputs():
+            determined[cluster] = method
+    leaves = []
+    for cluster in solver._map:
+        if isinstance(cluster, (Rigid, Hedgehog)) \
+                and cluster not in determined:
+            leaves.append(cluster)
+    return (leaves, dr.plan())
+
+
+def _step(kernel, method, clusters, inputs, n):
+    """execute a method for each combination of input branches"""
+    outputs = []
+    for combination in itertools.product(*inputs):
+        valid = combination[0][1]
+        confs = {clusters[0]: combination[0][0]}
+        for i in range(1, len(clusters)):
+            confs[clusters[i]] = combination[i][0]
+            valid = valid & combination[i][1]
+        outputs.extend(kernel(method, confs, valid))
+    return _compact(outputs, n)
+
+
+class BatchVerifier:
+    """Verifies many solutions of a GeometricProblem at once.
+
+       Distance, angle and fix constraints are compiled into index arrays
+       when the verifier is created, so it must be created again when the
+       structure of the problem changes (see GeometricProblem.verify_all).
+       Parameter values are read when verifying. Other constraints are
+       checked for each solution with their satisfied method.
+
+       instance attributes:
+        problem     - the GeometricProblem
+        variables   - the problem's variables, the default order of points
+                      in solution arrays
+    """
+
+    def __init__(self, problem):
+        self.problem = problem
+        self.variables = list(problem.cg.variables())
+        index = {}
+        for i in range(len(self.variables)):
+            index[self.variables[i]] = i
+        self._index = index
+        self._distances = []
+        self._angles = []
+        self._fixes = []
+        self._others = []
+        for con in problem.cg.constraints():
+            if isinstance(con, DistanceConstraint):
+                self._distances.append(con)
+            elif isinstance(con, AngleConstraint):
+                self._angles.append(con)
+            elif isinstance(con, FixConstraint):
+                self._fixes.append(con)
+            else:
+                self._others.append(con)
+        self._distance_index = _index_array(self._distances, index, 2)
+        self._angle_index = _index_array(self._angles, index, 3)
+        self._fix_index = _index_array(self._fixes, index, 1)[:, 0]
+
+    def verify(self, solutions, variables=None, tol=None):
+        """Verify solutions, given as a list of dictionaries mapping
+           variables to points, or as an (N x V x dimension) array with
+           points in the order of variables (default self.variables).
+
+           Returns a tuple (passed, worst) of arrays of length N: passed[i]
+           is True iff solution i satisfies all constraints within tol
+           (default tolerance.default_tol), and worst[i] is its largest
+           residual (inf if a point is missing or an angle is degenerate).
+        """
+        if tol is None:
+            tol = tolerance.default_tol
+        if isinstance(solutions, numpy.ndarray):
+            points = self._reorder(solutions, variables)
+            maps = None
+        else:
+            maps = list(solutions)
+            points = self._to_array(maps)
+        n = points.shape[0]
+        worst = numpy.zeros(n)
+        if len(self._distances) > 0:
+            values = numpy.array([c.get_parameter() for c in self._distances])
+            a = points[:, self._distance_index[:, 0]]
+            b = points[:, self._distance_index[:, 1]]
+            residual = numpy.abs(_norm(b - a) - values)
+            worst = numpy.maximum(worst, _worst(residual))
+        if len(self._angles) > 0:
+            values = numpy.array([c.get_parameter() for c in self._angles])
+            a = points[:, self._angle_index[:, 0]]
+            b = points[:, self._angle_index[:, 1]]
+            c = points[:, self._angle_index[:, 2]]
+            angle = _angle(a, b, c)
+            if points.shape[2] == 2:
+                ccw = (b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1]) \
+                    - (b[..., 1] - a[..., 1]) * (c[..., 0] - a[..., 0]) > tol
+                angle = numpy.where(ccw, -angle, angle)
+            else:
+                values = numpy.abs(values)
+            residual = numpy.abs(angle - values)
+            worst = numpy.maximum(worst, _worst(residual))
+        if len(self._fixes) > 0:
+            values = numpy.array([list(c.get_parameter())
+                                  for c in self._fixes], dtype=float)
+            dim = min(values.shape[1], points.shape[2])
+            a = points[:, self._fix_index, :dim]
+            residual = numpy.abs(a - values[:, :dim]).max(axis=2)
+            worst = numpy.maximum(worst, _worst(residual))
+        passed = worst <= tol
+        if len(self._others) > 0:
+            if maps is None:
+                maps = self._to_maps(points)
+            for i in numpy.nonzero(passed)[0]:
+                for con in self._others:
+                    if not con.satisfied(maps[i]):
+                        passed[i] = False
+                        break
+        return (passed, worst)
+
+    def _reorder(self, solutions, variables):
+        points = numpy.asarray(solutions, dtype=float)
+        if variables is None or list(variables) == self.variables:
+            return points
+        result = numpy.full((points.shape[0], len(self.variables),
+                             points.shape[2]), numpy.nan)
+        for i in range(len(variables)):
+            if variables[i] in self._index:
+                result[:, self._index[variables[i]]] = points[:, i]
+        return result
+
+    def _to_array(self, maps):
+        points = numpy.full((len(maps), len(self.variables),
+                             self.problem.dimension), numpy.nan)
+        for i in range(len(maps)):
+            for var in maps[i]:
+                if var in self._index:
+                    points[i, self._index[var]] = list(maps[i][var])
+        return points
+
+    def _to_maps(self, points):
+        maps = []
+        for i in range(points.shape[0]):
+            solution = {}
+            for j in range(len(self.variables)):
+                if not numpy.isnan(points[i, j]).any():
+                    solution[self.variables[j]] = vector(points[i, j].tolist())
+            maps.append(solution)
+        return maps
+
+
+def _index_array(constraints, index, size):
+    """array (len(constraints), size) of indices of constrained variables"""
+    array = numpy.zeros((len(constraints), size), dtype=int)
+    for i in range(len(constraints)):
+        variables = constraints[i].variables()
+        for j in range(size):
+            array[i, j] = index[variables[j]]
+    return array
+
+
+def _worst(residual):
+    """largest residual per solution, inf where not a number"""
+    residual = numpy.where(numpy.isnan(residual), numpy.inf, residual)
+    return residual.max(axis=1)
+
+
+# ----------- array helpers -----------
+
+def _points(n, x, y, z):
+    """an (n, 3) array of points; x, y, z are numbers or (n,) arrays"""
+    points = numpy.empty((n, 3))
+    points[:, 0] = x
+    points[:, 1] = y
+    points[:, 2] = z
+    return points
+
+
+def _norm(a):
+    return numpy.sqrt((a * a).sum(axis=-1))
+
+
+def _dot(a, b):
+    return (a * b).sum(axis=-1)
+
+
+def _safe(a):
+    """replace zeros in a by ones, to avoid division by zero"""
+    return numpy.where(a == 0.0, 1.0, a)
+
+
+def _angle(p1, p2, p3):
+    """vectorized angle_3p (3D, unsigned); nan if degenerate"""
+    d21 = _norm(p1 - p2)
+    d23 = _norm(p3 - p2)
+    tol = tolerance.default_tol
+    degenerate = (d21 <= tol) | (d23 <= tol)
+    t = _dot(p1 - p2, p3 - p2) / _safe(d21 * d23)
+    angle = numpy.arccos(numpy.clip(t, -1.0, 1.0))
+    return numpy.where(degenerate, numpy.nan, angle)
+
+
+def _stack(branches, n):
+    """stack branches into arrays (B, N, 3) per variable and (B, N)"""
+    variables = branches[0][0].keys()
+    coords = {}
+    for var in variables:
+        coords[var] = numpy.stack(
+            [numpy.broadcast_to(b[0][var], (n, 3)) for b in branches])
+    valid = numpy.stack([b[1] for b in branches])
+    return (coords, valid)
+
+
+def _compact(branches, n):
+    """reorder branches per sample so that valid branches come first,
+       and remove branches that are not valid for any sample"""
+    if len(branches) == 0:
+        return []
+    for (coords, valid) in branches:
+        for var in coords:
+            coords[var] = numpy.where(valid[:, None], coords[var], numpy.nan)
+    if len(branches) == 1:
+        return branches
+    (coords, valid) = _stack(branches, n)
+    order = numpy.argsort(~valid, axis=0, kind="stable")
+    valid = numpy.take_along_axis(valid, order, axis=0)
+    keep = valid.any(axis=1)
+    if not keep.any():
+        keep[0] = True
+    result = []
+    for b in numpy.nonzero(keep)[0]:
+        bcoords = {}
+        for var in coords:
+            bcoords[var] = numpy.take_along_axis(
+                coords[var], order[:, :, None], axis=0)[b]
+        result.append((bcoords, valid[b]))
+    return result
+
+
+# ----------- kernels -----------
+# A kernel executes a method for all samples at once. It is passed the
+# method, a dictionary mapping input clusters to coordinates (a dictionary
+# mapping variables to (N, 3) arrays) and the validity mask of the inputs.
+# It returns a list of (coordinates, valid) branches for the output cluster.
+
+def _kernel_copy_pr(method, confs, valid):
+    (c1, c2) = method.inputs()
+    if len(c1.vars) == 1:
+        return [(dict(confs[c2]), valid)]
+    else:
+        return [(dict(confs[c1]), valid)]
+
+
+def _kernel_copy_dr(method, confs, valid):
+    (c1, c2) = method.inputs()
+    if len(c1.vars) == 2:
+        return [(dict(confs[c2]), valid)]
+    else:
+        return [(dict(confs[c1]), valid)]
+
+
+def _kernel_merge(method, confs, valid):
+    (c1, c2) = method.inputs()
+    return [(_merge(confs[c1], confs[c2], False), valid)]
+
+
+def _kernel_merge_scale(method, confs, valid):
+    (c1, c2) = method.inputs()
+    return [(_merge(confs[c1], confs[c2], True), valid)]
+
+
+def _merge(conf1, conf2, scale):
+    """vectorized Configuration.merge and merge_scale: conf1 plus conf2
+       transformed such that shared points overlap"""
+    shared = sorted(set(conf1).intersection(conf2), key=str)
+    n = len(next(iter(conf1.values())))
+    result = dict(conf1)
+    if len(shared) == 0:
+        for var in conf2:
+            result.setdefault(var, conf2[var])
+        return result
+    p1s = conf1[shared[0]]
+    p1o = conf2[shared[0]]
+    if len(shared) == 1:
+        p2s = p1s + _points(n, 1.0, 0.0, 0.0)
+        p2o = p1o + _points(n, 1.0, 0.0, 0.0)
+        p3s = p1s + _points(n, 0.0, 1.0, 0.0)
+        p3o = p1o + _points(n, 0.0, 1.0, 0.0)
+        factor = None
+    else:
+        p2s = conf1[shared[1]]
+        p2o = conf2[shared[1]]
+        if scale:
+            factor = _norm(p2s - p1s) / _safe(_norm(p2o - p1o))
+        else:
+            factor = None
+        if len(shared) == 2:
+            # like Configuration._merge_transform_3D, using perp2D
+            d = p2s - p1s
+            perp = numpy.stack([-d[:, 1], d[:, 0], d[:, 2]], axis=1)
+            p3s = p1s + numpy.cross(p2s - p1s, perp)
+            p3o = p1o + numpy.cross(p2o - p1o, perp)
+        else:
+            p3s = conf1[shared[2]]
+            p3o = conf2[shared[2]]
+    fs = _frame(p1s, p2s, p3s)
+    fo = _frame(p1o, p2o, p3o)
+    rotation = numpy.matmul(fs, fo.transpose(0, 2, 1))
+    for var in conf2:
+        if var not in result:
+            p = conf2[var] - p1o
+            if factor is not None:
+                p = p * factor[:, None]
+            result[var] = p1s + numpy.matmul(rotation, p[:, :, None])[:, :, 0]
+    return result
+
+
+def _frame(a, b, c):
+    """orthonormal frames (N, 3, 3) with columns u, v, w as make_hcs_3d"""
+    u = b - a
+    u = u / _safe(_norm(u))[:, None]
+    v = c - a
+    w = numpy.cross(u, v)
+    w = w / _safe(_norm(w))[:, None]
+    v = numpy.cross(w, u)
+    return numpy.stack([u, v, w], axis=2)
+
+
+def _kernel_ddd(method, confs, valid):
+    c12 = confs[method.d_ab]
+    c13 = confs[method.d_ac]
+    c23 = confs[method.d_bc]
+    (a, b, c) = (method.a, method.b, method.c)
+    d12 = _norm(c12[a] - c12[b])
+    d31 = _norm(c13[a] - c13[c])
+    d23 = _norm(c23[b] - c23[c])
+    n = len(d12)
+    (x, y, ok) = _cc_first(d31, d12, d23)
+    coords = {a: _points(n, 0.0, 0.0, 0.0),
+              b: _points(n, d12, 0.0, 0.0),
+              c: _points(n, x, y, 0.0)}
+    return [(coords, valid & ok)]
+
+
+def _cc_first(r1, d, r2):
+    """first solution of cc_int for circles (0,0),r1 and (d,0),r2"""
+    tol = tolerance.default_tol
+    ok = d > tol
+    ds = _safe(d)
+    u = ((r1 * r1 - r2 * r2) / ds + ds) / 2
+    ok = ok & ~(u * u - r1 * r1 > tol)
+    v = numpy.sqrt(numpy.maximum(r1 * r1 - u * u, 0.0))
+    small = numpy.abs(u) <= tol
+    x = numpy.where(small, 0.0, u)
+    y = numpy.where(small, -r1, numpy.where(u > 0, -v, v))
+    return (x, y, ok)
+
+
+def _kernel_ttd(method, confs, valid):
+    c123 = confs[method.t_abc]
+    c124 = confs[method.t_abd]
+    c34 = confs[method.d_cd]
+    (a, b, c, d) = (method.a, method.b, method.c, method.d)
+    p1 = c123[a]
+    p2 = c123[b]
+    p3 = c123[c]
+    d14 = _norm(c124[a] - c124[d])
+    d24 = _norm(c124[b] - c124[d])
+    d34 = _norm(c34[c] - c34[d])
+    result = []
+    for (p4, ok) in _sss(p1, d14, p2, d24, p3, d34):
+        coords = {a: p1, b: p2, c: p3, d: p4}
+        result.append((coords, valid & ok))
+    return result
+
+
+def _sss(p1, r1, p2, r2, p3, r3):
+    """vectorized sss_int; returns two (points, valid) solutions"""
+    tol = tolerance.default_tol
+    normal = numpy.cross(p2 - p1, p3 - p1)
+    normal = normal / _safe(_norm(normal))[:, None]
+    d12 = _norm(p2 - p1)
+    (x1, y1, ok) = _cc_first(r1, d12, r2)
+    nx = (p2 - p1) / _safe(d12)[:, None]
+    px = p1 + nx * x1[:, None]
+    rx = numpy.abs(y1)
+    dy3 = _dot(p3 - px, nx)
+    py = p3 - nx * dy3[:, None]
+    ok = ok & ~(numpy.abs(dy3) - r3 > tol)
+    ry = numpy.sqrt(numpy.maximum(r3 * r3 - dy3 * dy3, 0.0))
+    dxy = _norm(py - px)
+    ok = ok & (dxy > tol)
+    dxys = _safe(dxy)
+    u = ((rx * rx - ry * ry) / dxys + dxys) / 2
+    ok = ok & ~(u * u - rx * rx > tol)
+    v = numpy.sqrt(numpy.maximum(rx * rx - u * u, 0.0))
+    small = numpy.abs(u) <= tol
+    sgn = numpy.where(u > 0, 1.0, -1.0)
+    xa = numpy.where(small, 0.0, u)
+    ya = numpy.where(small, -rx, -sgn * v)
+    yb = numpy.where(small, rx, sgn * v)
+    single = numpy.where(small, rx / dxys <= tol,
+                         v / _safe(numpy.abs(u)) <= tol)
+    dirx = (py - px) / dxys[:, None]
+    pa = px + dirx * xa[:, None] + normal * ya[:, None]
+    pb = px + dirx * xa[:, None] + normal * yb[:, None]
+    finite = numpy.isfinite(pa).all(axis=1) & numpy.isfinite(pb).all(axis=1)
+    return [(pa, ok & finite), (pb, ok & finite & ~single)]
+
+
+def _kernel_dad(method, confs, valid):
+    c12 = confs[method.d_ab]
+    c123 = confs[method.a_abc]
+    c23 = confs[method.d_bc]
+    (a, b, c) = (method.a, method.b, method.c)
+    d12 = _norm(c12[a] - c12[b])
+    a123 = _angle(c123[a], c123[b], c123[c])
+    d23 = _norm(c23[b] - c23[c])
+    n = len(d12)
+    coords = {a: _points(n, d12, 0.0, 0.0),
+              b: _points(n, 0.0, 0.0, 0.0),
+              c: _points(n, d23 * numpy.cos(a123), d23 * numpy.sin(a123), 0.0)}
+    return [(coords, valid & numpy.isfinite(a123))]
+
+
+def _kernel_add(method, confs, valid):
+    c312 = confs[method.a_cab]
+    c12 = confs[method.d_ab]
+    c23 = confs[method.d_bc]
+    (a, b, c) = (method.a, method.b, method.c)
+    a312 = _angle(c312[c], c312[a], c312[b])
+    d12 = _norm(c12[a] - c12[b])
+    d23 = _norm(c23[b] - c23[c])
+    n = len(d12)
+    tol = tolerance.default_tol
+    # cr_int((d_ab,0), d_bc, (0,0), dir), with |dir| = 1
+    v0 = numpy.cos(-a312)
+    v1 = numpy.sin(-a312)
+    dd = -d12 * v1
+    e = d23 * d23 - dd * dd
+    se = numpy.sqrt(numpy.maximum(e, 0.0))
+    sgn = numpy.where(v1 > 0, 1.0, -1.0)
+    result = []
+    for (s, ok) in [(1.0, e >= -tol), (-1.0, e > tol)]:
+        x = d12 + (dd * v1 + s * sgn * v0 * se)
+        y = -dd * v0 + s * numpy.abs(v1) * se
+        ray = x * v0 + y * v1 >= -tol
+        coords = {a: _points(n, 0.0, 0.0, 0.0),
+                  b: _points(n, d12, 0.0, 0.0),
+                  c: _points(n, x, y, 0.0)}
+        result.append((coords, valid & ok & ray & numpy.isfinite(a312)))
+    return result
+
+
+def _kernel_aa(method, confs, valid):
+    c312 = confs[method.a_cab]
+    c123 = confs[method.a_abc]
+    (a, b, c) = (method.a, method.b, method.c)
+    a312 = _angle(c312[c], c312[a], c312[b])
+    a123 = _angle(c123[a], c123[b], c123[c])
+    n = len(a312)
+    tol = tolerance.default_tol
+    # solve_ada_3D with d_ab = 1, rr_int of rays from (0,0) and (1,0)
+    d = 1.0
+    v1x = numpy.cos(-a312)
+    v1y = numpy.abs(numpy.sin(-a312))
+    v2x = numpy.cos(numpy.pi - a123)
+    v2y = numpy.abs(numpy.sin(numpy.pi - a123))
+    degenerate = (numpy.abs(numpy.sin(a312)) <= tol) \
+        & (numpy.abs(numpy.sin(a123)) <= tol)
+    ok = numpy.abs(v1x * v2y - v1y * v2x) > tol
+    f = v1x + v1y * (-v2x / _safe(v2y))
+    t1 = numpy.where(numpy.abs(v2y) > tol, d / _safe(f), 0.0)
+    x = v1x * t1
+    y = v1y * t1
+    ok = ok & ((x - d) * v2x + y * v2y >= -tol) & (x * v1x + y * v1y >= -tol)
+    m = d / 2 + numpy.cos(-a312) * d - numpy.cos(-a123) * d
+    x = numpy.where(degenerate, m, x)
+    y = numpy.where(degenerate, 0.0, y)
+    ok = (ok | degenerate) & numpy.isfinite(a312) & numpy.isfinite(a123)
+    coords = {a: _points(n, 0.0, 0.0, 0.0),
+              b: _points(n, d, 0.0, 0.0),
+              c: _points(n, x, y, 0.0)}
+    return [(coords, valid & ok)]
+
+
+def _kernel_prototype(method, confs, valid):
+    inputs = method.inputs()
+    incluster = inputs[0]
+    coords = confs[incluster]
+    protomap = {}
+    for cluster in inputs[1:]:
+        (var,) = cluster.vars
+        protomap[var] = vector(confs[cluster][var][0].tolist())
+    sat = valid.copy()
+    for con in method._constraints:
+        expected = con.satisfied(protomap)
+        sat = sat & (_satisfied(con, coords, valid) == expected)
+    return [(dict(coords), sat)]
+
+
+def _satisfied(con, coords, valid):
+    """vectorized con.satisfied for the selection constraints used by
+       prototype selection; other constraints are evaluated per sample"""
+    function = getattr(con, "_function", None)
+    negate = False
+    if hasattr(function, "negated"):
+        function = function.negated
+        negate = True
+    if function in (is_left_handed, is_right_handed):
+        (p1, p2, p3, p4) = [coords[v] for v in con.variables()]
+        det = _dot(numpy.cross(p2 - p1, p3 - p1), p4 - p1)
+        if function is is_left_handed:
+            result = det < 0
+        else:
+            result = det > 0
+        return result != negate
+    result = numpy.zeros(len(valid), dtype=bool)
+    for i in numpy.nonzero(valid)[0]:
+        solution = {}
+        for var in coords:
+            solution[var] = vector(coords[var][i].tolist())
+        result[i] = con.satisfied(solution)
+    return result
+
+
+def _execute_per_sample(method, confs, valid):
+    """execute a method without a kernel for each valid sample"""
+    n = len(valid)
+    output = method.outputs()[0]
+    solutions = {}
+    for i in numpy.nonzero(valid)[0]:
+        inmap = {}
+        for cluster in confs:
+            cmap = {}
+            for var in confs[cluster]:
+                cmap[var] = vector(confs[cluster][var][i].tolist())
+            inmap[cluster] = Configuration(cmap)
+        solutions[i] = list(method.multi_execute(inmap))
+    nbranches = max([len(s) for s in solutions.values()] + [1])
+    result = []
+    for b in range(nbranches):
+        coords = {}
+        for var in output.vars:
+            coords[var] = numpy.full((n, 3), numpy.nan)
+        bvalid = numpy.zeros(n, dtype=bool)
+        for i in solutions:
+            if b < len(solutions[i]):
+                for var in output.vars:
+                    coords[var][i] = solutions[i][b].get(var)
+                bvalid[i] = True
+        result.append((coords, bvalid))
+    return result
+
+
+_kernels = {
+    MergePR: _kernel_copy_pr,
+    MergeDR: _kernel_copy_dr,
+    MergeRR: _kernel_merge,
+    MergeSD: _kernel_merge_scale,
+    MergeDDD: _kernel_ddd,
+    MergeTTD: _kernel_ttd,
+    MergeDAD: _kernel_dad,
+    MergeADD: _kernel_add,
+    MergeAA: _kernel_aa,
+    PrototypeMethod: _kernel_prototype,
+}
@@ -14,13 +14,21 @@ and solutions are represented by a Configuration for each cluster.
 
 # import sys
 
+import time
+import copy
+import itertools
+
 from geosolver.graph import Graph
-from geosolver.method import Method, MethodGraph
-from geosolver.diagnostic import diag_print
+from geosolver.method import Method, MethodGraph, Cancelled
+from geosolver.diagnostic import diag_print, diag_flag
 from geosolver.notify import Notifier
 from geosolver.multimethod import MultiVariable, MultiMethod
 from geosolver.cluster import *
 from geosolver.configuration import Configuration
+from geosolver.intersections import distance_2p
+from geosolver.vector import vector
+from geosolver.tolerance import tol_eq
+import geosolver.tolerance as tolerance
 
 # if sys.version_info[0] > 2:
 #     py2 = False
@@ -33,6 +41,12 @@ from geosolver.configuration import Configuration
 #     pass
 
 
+# diagnostic flags, checked in hot code before building any messages
+_diag_clsolver = diag_flag("clsolver")
+_diag_clmethods = diag_flag("clmethods")
+_diag_prototype = diag_flag("PrototypeMethod.multi_execute")
+
+
 # Basic methods
 
 class ClusterMethod(MultiMethod):
@@ -63,24 +77,112 @@ class ClusterMethod(MultiMethod):
 class PrototypeMethod(MultiMethod):
     """A PrototypeMethod selects those solutions of a cluster for which
        the prototype and the solution satisfy the same constraints.
+
+       In single branch mode (attribute single is True) only the solution
+       that best matches the prototype is selected: the solution that 
+       satisfies the most constraints in the same way as the prototype, 
+       and then the solution closest to the prototype. If the best 
+       solutions cannot be distinguished within tolerance, all matching 
+       solutions are selected, as in normal mode.
+
+       When tracking (attribute tracking is a distance), the method 
+       remembers the solution it selected last (attribute previous). If 
+       a solution is within the tracking distance of that solution, the 
+       closest one is selected, regardless of the prototype. Otherwise 
+       solutions are selected as above.
     """
 
     def __init__(self, incluster, selclusters, outcluster, constraints):
         self._inputs = [incluster] + selclusters
         self._outputs = [outcluster]
         self._constraints = constraints
+        self.single = False
+        self.tracking = None
+        self.previous = None
         MultiMethod.__init__(self)
 
+    def execute(self, inmap):
+        outvar = self._outputs[0]
+        selected = None
+        if self.tracking is not None and self.previous is not None:
+            selected = self._select_previous(inmap)
+        if selected is None and self.single:
+            selected = self._select_single(inmap)
+        if selected is None:
+            selected = MultiMethod.execute(self, inmap)[outvar]
+        if self.tracking is not None:
+            if len(selected) == 1:
+                self.previous = list(selected)[0]
+            else:
+                self.previous = None
+        return {outvar: selected}
+
+    def _select_previous(self, inmap):
+        """the solution closest to the previous solution, if within the
+           tracking distance, else None"""
+        closest = None
+        for conf in inmap[self._inputs[0]]:
+            distance = aligned_distance(conf, self.previous)
+            if distance <= self.tracking:
+                if closest is None or distance < closest[0]:
+                    closest = (distance, conf)
+        if closest is None:
+            if _diag_prototype.on:
+                diag_print("lost track of previous solution",
+                           "PrototypeMethod.multi_execute")
+            return None
+        return set([closest[1]])
+
+    def _select_single(self, inmap):
+        """the solution that best matches the prototype, or None if there 
+           is at most one solution or the best is ambiguous"""
+        candidates = list(inmap[self._inputs[0]])
+        if len(candidates) <= 1:
+            return None
+        selmap = {}
+        for cluster in self._inputs[1:]:
+            (conf,) = inmap[cluster]
+            var = conf.vars()[0]
+            selmap[var] = conf.map[var]
+        best = []
+        most = -1
+        for conf in candidates:
+            agree = 0
+            for con in self._constraints:
+                if con.satisfied(conf.map) == con.satisfied(selmap):
+                    agree += 1
+            if agree > most:
+                best = [conf]
+                most = agree
+            elif agree == most:
+                best.append(conf)
+        if len(best) > 1:
+            selconf = Configuration(selmap)
+            scored = []
+            for conf in best:
+                scored.append((aligned_distance(conf, selconf), conf))
+            scored.sort(key=lambda s: s[0])
+            if tol_eq(scored[0][0], scored[1][0]):
+                if _diag_prototype.on:
+                    diag_print("ambiguous, selecting all matching solutions",
+                               "PrototypeMethod.multi_execute")
+                return None
+            best = [scored[0][1]]
+        return set(best)
+
     def multi_execute(self, inmap):
-        diag_print("PrototypeMethod.multi_execute called", "clmethods")
+        if _diag_clmethods.on:
+            diag_print("PrototypeMethod.multi_execute called", "clmethods")
         incluster = self._inputs[0]
         selclusters = []
         for i in range(1, len(self._inputs)):
             selclusters.append(self._inputs[i])
-        diag_print("input clusters" + str(incluster),
-                   "PrototypeMethod.multi_execute")
-        diag_print("selection clusters" + str(selclusters),
-                   "PrototypeMethod.multi_execute")
+        trace = _diag_prototype.on
+        if trace:
+            diag_print("input clusters%s", "PrototypeMethod.multi_execute",
+                       incluster)
+            diag_print("selection clusters%s", "PrototypeMethod.multi_execute",
+                       selclusters)
         # get confs
         inconf = inmap[incluster]
         selmap = {}
@@ -91,28 +193,168 @@ class PrototypeMethod(MultiMethod):
             selmap[var] = conf.map[var]
         selconf = Configuration(selmap)
         sat = True
-        diag_print("input configuration = " + str(inconf),
-                   "PrototypeMethod.multi_execute")
-        diag_print("selection configuration = " + str(selconf),
-                   "PrototypeMethod.multi_execute")
+        if trace:
+            diag_print("input configuration = %s",
+                       "PrototypeMethod.multi_execute", inconf)
+            diag_print("selection configuration = %s",
+                       "PrototypeMethod.multi_execute", selconf)
         for con in self._constraints:
-            satcon = con.satisfied(inconf.map) != con.satisfied(selconf.map)
-            diag_print("constraint = " + str(con),
-                       "PrototypeMethod.multi_execute")
-            diag_print("constraint satisfied? " + str(satcon),
-                       "PrototypeMethod.multi_execute")
+            satcon = con.satisfied(inconf.map) == con.satisfied(selconf.map)
+            if trace:
+                diag_print("constraint = %s",
+                           "PrototypeMethod.multi_execute", con)
+                diag_print("constraint satisfied? %s",
+                           "PrototypeMethod.multi_execute", satcon)
             sat = sat and satcon
-        diag_print("prototype satisfied? " + str(sat),
-                   "PrototypeMethod.multi_execute")
+        if trace:
+            diag_print("prototype satisfied? %s",
+                       "PrototypeMethod.multi_execute", sat)
         if sat:
             return [inconf]
         else:
             return []
 
 
+class NumericMerge(ClusterMethod):
+    """A NumericMerge merges clusters that together are rigid, but that
+       cannot be merged by the decomposition rules, e.g. the double banana
+       with an extra distance between the bananas. The rigids are placed as
+       rigid bodies, starting from the prototype, and the constraints 
+       between them are solved numerically (see refine.place_bodies). At 
+       most one solution is found, close to the prototype. 
+
+       The point clusters of the prototype are inputs, so that the merge is
+       executed again when the prototype changes. The output is in the 
+       coordinates of the given fixed rigid. Requires numpy.
+
+       If the iteration from the prototype does not converge, it is 
+       started again from the last solution found (attribute previous), 
+       and then from up to restarts random perturbations of the 
+       prototype. If none converges, there is no solution and attribute
+       converged is False.
+    """
+
+    restarts = 8
+    previous = None
+    converged = True
+
+    def __init__(self, clusters, prototypes, fixed=None):
+        """arguments:
+              clusters: list of Rigids, Hedgehogs and Balloons to merge
+              prototypes: dictionary mapping each variable to its point
+                          cluster, a Rigid with a single variable
+              fixed: the Rigid that keeps its position, or None
+        """
+        self.clusters = list(clusters)
+        self.prototypes = dict(prototypes)
+        self.fixed = fixed
+        vars_ = set()
+        for cluster in self.clusters:
+            vars_.update(cluster.vars)
+        self._inputs = list(self.clusters)
+        for var in self.prototypes:
+            if self.prototypes[var] not in self._inputs:
+                self._inputs.append(self.prototypes[var])
+        self._outputs = [Rigid(vars_)]
+        ClusterMethod.__init__(self)
+
+    def __str__(self):
+        s = "NumericMerge(" + "+".join(map(str, self.clusters))
+        s += "->" + str(self._outputs[0]) + ")"
+        s += "[" + self.status_str() + "]"
+        return s
+
+    def multi_execute(self, inmap):
+        from geosolver.refine import place_bodies
+        if _diag_clmethods.on:
+            diag_print("NumericMerge.multi_execute called", "clmethods")
+        configurations = {}
+        dimension = None
+        for cluster in self.clusters:
+            configurations[cluster] = inmap[cluster].map
+            dimension = inmap[cluster].dimension
+        prototype = {}
+        for var in self.prototypes:
+            prototype[var] = inmap[self.prototypes[var]].get(var)
+        starts = [prototype]
+        if self.previous is not None \
+                and set(self.previous).issuperset(prototype):
+            starts.append(self.previous)
+        starts = itertools.chain(starts,
+                                 _perturbed(prototype, self.restarts))
+        for start in starts:
+            (solution, residual) = place_bodies(self.clusters, 
+                configurations, start, dimension, self.fixed)
+            diag_print("NumericMerge residual %s", "clmethods", residual)
+            if residual <= tolerance.default_tol:
+                self.previous = solution
+                self.converged = True
+                return [Configuration(solution)]
+        self.converged = False
+        return []
+
+
+def _perturbed(prototype, count):
+    """count random perturbations of a prototype (a dictionary mapping 
+       variables to points), by about the size of the prototype"""
+    import numpy
+    variables = list(prototype)
+    points = numpy.array([list(prototype[v]) for v in variables], 
+                         dtype=float)
+    size = numpy.sqrt(((points - points.mean(axis=0)) ** 2).sum(axis=1)
+                      .mean()) or 1.0
+    random = numpy.random.RandomState(0)
+    for i in range(count):
+        moved = points + random.normal(0.0, size, points.shape)
+        yield dict((variables[j], vector(moved[j].tolist()))
+                   for j in range(len(variables)))
+
+
+def aligned_distance(conf, reference):
+    """the largest distance between a point of a configuration and the 
+       same point in a reference configuration, after a rigid
+       transformation mapping the configuration onto the reference"""
+    conf = conf.select(reference.vars())
+    transformed = conf.transform(reference.merge_transform(conf))
+    distance = 0.0
+    for var in reference.vars():
+        distance = max(distance,
+                       distance_2p(transformed.get(var), reference.get(var)))
+    return distance
+
+
+def _clone(obj, clusters, variables):
+    """a copy of a method or cluster with its clusters and variables 
+       renamed, see ClusterSolver.add_instance"""
+    clone = copy.copy(obj)
+    for (name, value) in obj.__dict__.items():
+        setattr(clone, name, _renamed(value, clusters, variables))
+    return clone
+
+
+def _renamed(value, clusters, variables):
+    if isinstance(value, MultiVariable):
+        if value not in clusters:
+            clusters[value] = _clone(value, clusters, variables)
+        return clusters[value]
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        return type(value)([_renamed(v, clusters, variables) for v in value])
+    elif isinstance(value, dict):
+        return dict([(_renamed(k, clusters, variables),
+                      _renamed(v, clusters, variables))
+                     for (k, v) in value.items()])
+    elif isinstance(value, bool) or value is None:
+        return value
+    try:
+        return variables.get(value, value)
+    except TypeError:
+        # not hashable, so not a variable
+        return value
+
+
 def is_information_increasing(method):
     infinc = True
-    connected = Set()
+    connected = set()
     output = method.outputs()[0]
     for cluster in method.inputs():
         if num_constraints(cluster.intersection(output)) >= num_constraints(
@@ -128,6 +370,19 @@ class ClusterSolver(Notifier):
     """Constraints are Clusters: Rigids, Hedgehogs and Balloons. 
        After adding each cluster, the solver tries to merge
        clusters, adding new clusters and methods between clusters. 
+
+       Solving may be bounded by a budget (see set_budget). When the 
+       budget runs out, the solver stops searching for merges, leaving
+       a consistent but incomplete decomposition. Solving can be continued 
+       later with resume.
+
+       Changes may be batched between begin_batch and end_batch. Clusters
+       added or removed in a batch are solved incrementally, as usual, but
+       configurations are propagated only once, at the end of the batch.
+
+       In single branch mode (see set_single_branch), only the solution
+       closest to the prototype is kept after each merge, so the number 
+       of solutions does not grow with the depth of the decomposition.
     """
 
     # ------- PUBLIC METHODS --------
@@ -150,6 +405,25 @@ class ClusterSolver(Notifier):
         self._new = []
         # methodgraph
         self._mg = MethodGraph()
+        # budget: limits, and deadline and merge count of current window
+        self._max_time = None
+        self._max_merges = None
+        self._deadline = None
+        self._merges = 0
+        # open batches (True for those deferring structural solving), and
+        # whether to propagate immediately
+        self._batches = []
+        self._prop = True
+        # prototype selection keeps a single solution
+        self._single = False
+        # tolerance for tracking solutions, or None
+        self._tracking = None
+        # maximum number of configurations per cluster, and ranking
+        self._max_solutions = None
+        self._rank = None
+        # cancellation event and progress callback, or None
+        self._cancel = None
+        self._progress = None
 
     def variables(self):
         """get list of variables"""
@@ -192,7 +466,7 @@ class ClusterSolver(Notifier):
            arguments:
               cluster: A Rigid
            """
-        diag_print("add_cluster " + str(cluster), "clsolver")
+        diag_print("add_cluster %s", "clsolver", cluster)
         self._add_cluster(cluster)
         self._process_new()
 
@@ -203,9 +477,204 @@ class ClusterSolver(Notifier):
         self._remove(cluster)
         self._process_new()
 
+    def set_budget(self, max_time=None, max_merges=None):
+        """Limit the effort spent on structural solving, and start a new 
+           budget window. When the budget is exhausted, solving stops at 
+           a consistent state; see is_complete and resume.
+        
+           arguments:
+              max_time: maximum wall-clock time in seconds, or None
+              max_merges: maximum number of merges, or None 
+        """
+        self._max_time = max_time
+        self._max_merges = max_merges
+        self.reset_budget()
+
+    def reset_budget(self):
+        """Start a new budget window, with the limits given to set_budget"""
+        if self._max_time is not None:
+            self._deadline = time.time() + self._max_time
+        else:
+            self._deadline = None
+        self._merges = 0
+
+    def is_complete(self):
+        """False iff solving was stopped because the budget was exhausted"""
+        return len(self._new) == 0
+
+    def resume(self):
+        """Continue solving in a new budget window. 
+           Returns True iff solving is complete."""
+        self.reset_budget()
+        self._process_new()
+        return self.is_complete()
+
+    def begin_batch(self, defer_search=False):
+        """Defer propagation until end_batch. Structural solving is 
+           incremental, unless defer_search is True: then new clusters
+           are not searched until the batch ends (e.g. to add the methods
+           of a plan first, see add_instance). Batches may be nested."""
+        self._batches.append(defer_search)
+        self._prop = False
+
+    def end_batch(self):
+        """End a batch. When the outermost batch ends, all configurations
+           are propagated at once."""
+        if len(self._batches) == 0:
+            raise Exception("end_batch without begin_batch")
+        self._batches.pop()
+        self._process_new()
+        if len(self._batches) == 0:
+            self._prop = True
+            self._mg.propagate()
+
+    def in_batch(self):
+        """True iff between begin_batch and end_batch"""
+        return len(self._batches) > 0
+
+    def fork(self):
+        """Return a snapshot of the solver, that can be changed 
+           independently, e.g. to try a change speculatively. Clusters,
+           methods and configurations are shared with the snapshot, and 
+           the graphs are copied-on-write, so forking is cheap. Settings 
+           (e.g. single branch mode) and the state of methods (e.g. for
+           tracking) are copied, and can be changed independently. The 
+           fork has no listeners."""
+        fork = copy.copy(self)
+        Notifier.__init__(fork)
+        fork._graph = self._graph.fork()
+        fork._new = list(self._new)
+        fork._batches = list(self._batches)
+        fork._mg = self._mg.fork()
+        fork._bind_rankings()
+        return fork
+
+    def set_cancel(self, event):
+        """Cancel solving when the given event (a threading.Event, or any
+           object with an is_set method) is set. It is checked before each
+           search step and before each method is executed in propagation,
+           and Cancelled (from geosolver.method) is raised when set. The
+           solver should not be used after that. None disables 
+           cancellation."""
+        self._cancel = event
+        self._mg.set_cancel(event)
+
+    def set_progress(self, callback):
+        """Call callback(solver) after each search step, e.g. to report 
+           merge_count and the number of top-level clusters. None disables
+           progress reports."""
+        self._progress = callback
+
+    def merge_count(self):
+        """number of merges in the current budget window"""
+        return self._merges
+
+    def set_single_branch(self, single):
+        """Iff single is True, prototype selection keeps only the solution
+           that best matches the prototype, instead of all solutions that
+           satisfy the prototype constraints. Where the best solution is 
+           ambiguous, all solutions are kept. See PrototypeMethod."""
+        if single == self._single:
+            return
+        self._single = single
+        for method in self.methods():
+            if isinstance(method, PrototypeMethod):
+                self._mg.set_attributes(method, single=single)
+                self._mg.execute(method, False)
+        if self._prop:
+            self._mg.propagate()
+
+    def is_single_branch(self):
+        """True iff in single branch mode, see set_single_branch"""
+        return self._single
+
+    def set_tracking(self, tolerance):
+        """Track solutions through changes: when configurations change,
+           prototype selection keeps the solution closest to the previously
+           selected solution, if the largest displacement of a point 
+           (modulo rigid transformations) is at most tolerance. 
+           If tolerance is None, tracking is disabled."""
+        self._tracking = tolerance
+        for method in self.methods():
+            if isinstance(method, PrototypeMethod):
+                self._set_tracking(method)
+
+    def get_tracking(self):
+        """the tracking tolerance, or None, see set_tracking"""
+        return self._tracking
+
+    def set_max_solutions(self, max_solutions, rank=None):
+        """Limit the number of configurations of each cluster to 
+           max_solutions (None means no limit). The limit is applied while
+           methods are executed, so no more than max_solutions 
+           configurations are propagated. Configurations are ranked by
+           rank(cluster, configuration), lowest first; by default by 
+           prototype_distance(configuration)."""
+        self._max_solutions = max_solutions
+        self._rank = rank
+        for method in self.methods():
+            if isinstance(method, MultiMethod):
+                self._set_max_values(method)
+                self._mg.execute(method, False)
+        if self._prop:
+            self._mg.propagate()
+
+    def get_max_solutions(self):
+        """the maximum number of configurations per cluster, or None"""
+        return self._max_solutions
+
+    def prototype_distance(self, configuration):
+        """The largest distance between a point in the configuration and 
+           its prototype, modulo rigid transformations, or 0.0 if there 
+           is no prototype for some point."""
+        protomap = {}
+        for var in configuration.vars():
+            clusters = self._graph.outgoing_vertices(var)
+            clusters = list(filter(
+                lambda c: isinstance(c, Rigid) and len(c.vars) == 1, clusters))
+            if len(clusters) != 1:
+                return 0.0
+            prototypes = self._mg.get(clusters[0])
+            if prototypes is None or len(prototypes) != 1:
+                return 0.0
+            protomap[var] = list(prototypes)[0].get(var)
+        return aligned_distance(configuration, Configuration(protomap))
+
+    # method settings and state are attributes of the methods in the method 
+    # graph of this solver (see MethodGraph.set_attributes), because methods 
+    # are shared with forks
+
+    def _set_max_values(self, method):
+        if self._max_solutions is None:
+            rank = None
+        elif self._rank is None:
+            rank = self.prototype_distance
+        else:
+            output = method.outputs()[0]
+            rank = lambda configuration: self._rank(output, configuration)
+        self._mg.set_attributes(method, max_values=self._max_solutions, 
+                                rank=rank)
+
+    def _bind_rankings(self):
+        """rank the configurations of all methods with this solver, e.g. 
+           after forking"""
+        for method in self.methods():
+            if isinstance(method, MultiMethod):
+                self._set_max_values(method)
+
+    def _set_tracking(self, method):
+        previous = None
+        if self._tracking is not None:
+            # start tracking the current solution, if unique
+            selected = self._mg.get(method.outputs()[0])
+            if selected is not None and len(selected) == 1:
+                previous = list(selected)[0]
+        self._mg.set_attributes(method, tracking=self._tracking, 
+                                previous=previous)
+
     def set(self, cluster, configurations):
         """Associate a list of configurations with a cluster"""
-        self._mg.set(cluster, configurations)
+        self._mg.set(cluster, configurations, self._prop)
 
     def get(self, cluster):
         """Return a set of configurations associated with a cluster"""
@@ -220,16 +689,164 @@ class ClusterSolver(Notifier):
         self._graph.rem_vertex("_root")
         self._graph.add_edge("_root", rigid)
 
+    def merge_numeric(self, previous=None):
+        """If there are several top-level clusters, and together they are
+           rigid (i.e. the problem is rigid, but could not be decomposed),
+           merge them with a NumericMerge. Every variable must have a point
+           cluster (a Rigid with only that variable) giving its prototype.
+           When the merge is removed, the merged clusters are top-level
+           again. Previous is an earlier solution (a dictionary mapping 
+           variables to points) to start from if starting from the 
+           prototype does not converge. Requires numpy.
+
+           Returns the merged Rigid, or None if no merge was added.
+        """
+        if self.in_batch() or not self.is_complete():
+            return None
+        toplevel = self.top_level()
+        rigids = list(filter(lambda c: isinstance(c, Rigid), toplevel))
+        if len(toplevel) < 2 or len(rigids) == 0:
+            return None
+        prototypes = {}
+        for cluster in toplevel:
+            for var in cluster.vars:
+                points = filter(lambda c: isinstance(c, Rigid)
+                                and len(c.vars) == 1,
+                                self._graph.outgoing_vertices(var))
+                points = list(points)
+                if len(points) != 1:
+                    return None
+                prototypes[var] = points[0]
+        covered = set()
+        for rigid in rigids:
+            covered.update(rigid.vars)
+        if len(covered) != len(prototypes):
+            return None
+        from geosolver.refine import is_rigid
+        if not is_rigid(toplevel, self.dimension):
+            return None
+        # the rigid containing the root keeps its position
+        fixed = None
+        for root in self._graph.outgoing_vertices("_root"):
+            for rigid in rigids:
+                if set(root.vars).issubset(rigid.vars):
+                    fixed = rigid
+        merge = NumericMerge(toplevel, prototypes, fixed)
+        diag_print("numeric merge %s", "clsolver", merge)
+        merge.consistent = True
+        merge.overconstrained = False
+        self._mg.set_attributes(merge, previous=previous, converged=True)
+        output = merge.outputs()[0]
+        output.overconstrained = False
+        for cluster in toplevel:
+            output.overconstrained = output.overconstrained \
+                or cluster.overconstrained
+        self._merges += 1
+        self._add_cluster(output)
+        self._add_method(merge)
+        for cluster in toplevel:
+            self._rem_top_level(cluster)
+        merge.restore_toplevel = toplevel
+        self._process_new()
+        return output
+
+    def is_converged(self, merge):
+        """False iff the last execution of a NumericMerge in this solver
+           did not converge, see NumericMerge"""
+        return self._mg.get_attribute(merge, "converged")
+
+    def plan(self):
+        """Return the methods in a topological order, i.e. each method
+           after the methods determining its inputs."""
+        determined = {}
+        for method in self.methods():
+            for cluster in method.outputs():
+                determined[cluster] = method
+        plan = []
+        done = {}
+        for method in self.methods():
+            stack = [method]
+            while len(stack) > 0:
+                met = stack[-1]
+                if met in done:
+                    stack.pop()
+                    continue
+                todo = []
+                for cluster in met.inputs():
+                    if cluster in determined \
+                            and determined[cluster] not in done:
+                        todo.append(determined[cluster])
+                if len(todo) > 0:
+                    stack.extend(todo)
+                else:
+                    done[met] = True
+                    plan.append(met)
+                    stack.pop()
+        return plan
+
+    def add_instance(self, plan, clusters, variables):
+        """Add an instance of the plan of another solver (see plan), by
+           cloning its methods and clusters, without searching. 
+
+           arguments:
+              plan: a list of methods in topological order
+              clusters: a dictionary mapping clusters of the plan to 
+                 clusters in this solver, at least for the clusters that 
+                 are not determined by a method of the plan. Clones of 
+                 the other clusters are added to it.
+              variables: a dictionary mapping the variables of the plan to
+                 variables of this solver
+
+           Merges whose inputs are not all in this solver or not top-level
+           (e.g. because points are shared with other clusters) are not
+           added, nor are methods depending on them. The solver then
+           searches from the remaining top-level clusters, as usual.
+        """
+        self.begin_batch(True)
+        try:
+            for method in plan:
+                inputs = method.inputs()
+                output = method.outputs()[0]
+                if False in [c in clusters for c in inputs]:
+                    continue
+                if isinstance(method, PrototypeMethod):
+                    # added with the merge, see _add_prototype_selector
+                    clusters[output] = self._selected(clusters[inputs[0]])
+                    continue
+                if False in [self.is_top_level(clusters[c]) for c in inputs]:
+                    # a merge adding shared points to a rigid is not needed
+                    others = [c for c in inputs
+                              if not self.is_top_level(clusters[c])]
+                    rigids = [c for c in inputs if c not in others 
+                              and c.vars == output.vars]
+                    if len(rigids) > 0 and False not in \
+                            [len(c.vars) == 1 for c in others]:
+                        clusters[output] = clusters[rigids[0]]
+                    continue
+                clone = _clone(method, clusters, variables)
+                if not self._add_method_complete(clone):
+                    del clusters[output]
+        finally:
+            self.end_batch()
+
+    def _selected(self, cluster):
+        """the output of the prototype selector of a cluster, if any, or
+           the cluster itself"""
+        for method in self.find_dependend(cluster):
+            if isinstance(method, PrototypeMethod):
+                return method.outputs()[0]
+        return cluster
+
     def find_dependend(self, object_):
         """Return a list of objects that depend on given object_ directly."""
         l = self._graph.outgoing_vertices(object_)
-        return filter(lambda x: self._graph.get(object_, x) == "dependency", l)
+        return list(filter(lambda x: self._graph.get(object_, x) == "dependency", l))
 
     def find_depends(self, object_):
         """Return a list of objects that the given object_
         depends on directly"""
         l = self._graph.ingoing_vertices(object_)
-        return filter(lambda x: self._graph.get(x, object_) == "dependency", l)
+        return list(filter(lambda x: self._graph.get(x, object_) == "dependency", l))
 
     def contains(self, obj):
         return self._graph.has_vertex(obj)
@@ -272,7 +889,7 @@ class ClusterSolver(Notifier):
     def _remove(self, object_):
         # find all indirectly dependend objects
         todelete = [object_] + self._find_descendend(object_)
-        torestore = Set()
+        torestore = set()
         # remove all objects
         for item in todelete:
             # if merge removed items from toplevel
@@ -281,7 +898,7 @@ class ClusterSolver(Notifier):
                 for cluster in item.restore_toplevel:
                     torestore.add(cluster)
             # delete it from graph
-            diag_print("deleting " + str(item), "clsolver.remove")
+            diag_print("deleting %s", "clsolver.remove", item)
             self._graph.rem_vertex(item)
             # remove from _new list
             if item in self._new:
@@ -330,7 +947,7 @@ class ClusterSolver(Notifier):
               var: any hashable object
         """
         if not self._graph.has_vertex(var):
-            diag_print("_add_variable " + str(var), "clsolver")
+            diag_print("_add_variable %s", "clsolver", var)
             self._add_to_group("_variables", var)
 
     def _add_cluster(self, cluster):
@@ -345,7 +962,7 @@ class ClusterSolver(Notifier):
 
     def _add_rigid(self, newcluster):
         """add a rigid cluster if not already in system"""
-        diag_print("_add_rigid " + str(newcluster), "clsolver")
+        diag_print("_add_rigid %s", "clsolver", newcluster)
         # check if not already exists
         if self._graph.has_vertex(newcluster):
             raise Exception("rigid already in clsolver")
@@ -367,7 +984,7 @@ class ClusterSolver(Notifier):
     # end def _add_rigid
 
     def _add_hog(self, hog):
-        diag_print("_add_hog:" + str(hog), "clsolver")
+        diag_print("_add_hog:%s", "clsolver", hog)
         # check if not already exists
         if self._graph.has_vertex(hog):
             raise Exception("hedgehog already in clsolver")
@@ -385,7 +1002,7 @@ class ClusterSolver(Notifier):
 
     def _add_balloon(self, newballoon):
         """add a cluster if not already in system"""
-        diag_print("_add_balloon " + str(newballoon), "clsolver")
+        diag_print("_add_balloon %s", "clsolver", newballoon)
         # check if not already exists
         if self._graph.has_vertex(newballoon):
             raise Exception("balloon already in clsolver")
@@ -403,6 +1020,19 @@ class ClusterSolver(Notifier):
 
     # end def _add_balloon
 
+    def _add_method_complete(self, merge):
+        """add a merge, unless it is redundant, i.e. its output is
+           contained in a top-level rigid other than its inputs (e.g. a
+           cloned merge, see add_instance); returns True iff added"""
+        output = merge.outputs()[0]
+        for cluster in self.top_level():
+            if isinstance(cluster, Rigid) and cluster not in merge.inputs() \
+                    and set(output.vars).issubset(cluster.vars):
+                diag_print("method is redundant", "clsolver")
+                return False
+        self._add_merge(merge)
+        return True
+
     def _add_merge(self, merge):
         # structural check that method has one output
         if len(merge.outputs()) != 1:
@@ -427,6 +1057,8 @@ class ClusterSolver(Notifier):
         for cluster in merge.inputs():
             overconstrained = overconstrained and cluster.overconstrained
         output.overconstrained = overconstrained
+        # count merges for budget
+        self._merges += 1
         # add to graph
         self._add_cluster(output)
         self._add_method(merge)
@@ -461,6 +1093,8 @@ class ClusterSolver(Notifier):
                                    selclusters,
                                    outcluster,
                                    constraints)
+        self._mg.set_attributes(selector, single=self._single, 
+                                tracking=self._tracking, previous=None)
         self._add_cluster(outcluster)
         self._add_method(selector)
         self._rem_top_level(incluster)
@@ -470,28 +1104,49 @@ class ClusterSolver(Notifier):
         return
 
     def _add_method(self, method):
-        diag_print("new " + str(method), "clsolver")
+        diag_print("new %s", "clsolver", method)
         self._add_to_group("_methods", method)
         for obj in method.inputs():
             self._add_dependency(obj, method)
         for obj in method.outputs():
             self._add_dependency(method, obj)
             self._add_dependency(obj, method)
-        self._mg.add_method(method)
+        if isinstance(method, MultiMethod):
+            self._set_max_values(method)
+        self._mg.add_method(method, self._prop)
         self.send_notify(("add", method))
 
     # --------------
     # search methods
     # --------------
 
+    def _budget_exhausted(self):
+        if self._max_merges is not None and self._merges >= self._max_merges:
+            return True
+        if self._deadline is not None and time.time() >= self._deadline:
+            return True
+        return False
+
     def _process_new(self):
+        if True in self._batches:
+            # deferred until end_batch
+            return
         while len(self._new) > 0:
+            if self._budget_exhausted():
+                diag_print("budget exhausted, %d objects not searched",
+                           "clsolver", len(self._new))
+                break
+            if self._cancel is not None and self._cancel.is_set():
+                raise Cancelled("solving cancelled")
             newobject = self._new.pop()
-            diag_print("search from " + str(newobject), "clsolver")
+            if _diag_clsolver.on:
+                diag_print("search from %s", "clsolver", newobject)
             succes = self._search(newobject)
             if succes and self.is_top_level(newobject):
                 # maybe more rules applicable.... push back on stack
                 self._new.append(newobject)
+            if self._progress is not None:
+                self._progress(self)
                 # while
 
     # end def
@@ -518,13 +1173,18 @@ class ClusterSolver(Notifier):
             if cluster is input_cluster:
                 return True
             fr = self._graph.outgoing_vertices(cluster)
-            me = filter(lambda x: isinstance(x, Merge), fr)
-            me = filter(lambda x: cluster in x.outputs(), me)
-            if len(list(me)) > 1:
+            # merges (and prototype selection) of the cluster
+            me = filter(lambda x: isinstance(x, (ClusterMethod,
+                                                 PrototypeMethod)), fr)
+            me = list(filter(lambda x: cluster in x.inputs()
+                             and isinstance(x.outputs()[0], Rigid)
+                             and x.outputs()[0].vars.issuperset(cluster.vars),
+                             me))
+            if len(me) > 1:
                 raise Exception("root cluster merged more than once")
-            elif len(list(me)) == 0:
+            elif len(me) == 0:
                 cluster = None
-            elif len(list(me)[0].outputs()) != 1:
+            elif len(me[0].outputs()) != 1:
                 raise Exception("a merge with number of outputs != 1")
             else:
                 cluster = me[0].outputs()[0]
@@ -534,21 +1194,28 @@ class ClusterSolver(Notifier):
     # def
 
     def _is_consistent_pair(self, object1, object2):
-        diag_print("in is_consistent_pair " + str(object1) + " " + str(object2),
-                   "clsolver")
+        trace = _diag_clsolver.on
+        if trace:
+            diag_print("in is_consistent_pair %s %s", "clsolver",
+                       object1, object2)
         oc = over_constraints(object1, object2)
-        diag_print("over_constraints: " + str(map(str, oc)), "clsolver")
+        if trace:
+            diag_print("over_constraints: %s", "clsolver",
+                       list(map(str, oc)))
         consistent = True
         for con in oc:
             consistent = consistent and self._consistent_overconstraint_in_pair(
                 con, object1, object2)
-        diag_print("global consistent? " + str(consistent), "clsolver")
+        if trace:
+            diag_print("global consistent? %s", "clsolver", consistent)
         return consistent
 
     def _consistent_overconstraint_in_pair(self, overconstraint, object1,
                                            object2):
-        diag_print("consistent " + str(overconstraint) + " in " + str(
-            object1) + " and " + str(object2) + " ?", "clsolver")
+        trace = _diag_clsolver.on
+        if trace:
+            diag_print("consistent %s in %s and %s ?", "clsolver",
+                       overconstraint, object1, object2)
 
         # get sources for constraint in given clusters
         s1 = self._source_constraint_in_cluster(overconstraint, object1)
@@ -573,7 +1240,8 @@ class ClusterSolver(Notifier):
                 # if solve(c2to1) contains overconstraint then consistent
                 # raise Exception, "not yet implemented"
 
-        diag_print("consistent? " + str(consistent), "clsolver")
+        if trace:
+            diag_print("consistent? %s", "clsolver", consistent)
         return consistent
 
     def _source_constraint_in_cluster(self, constraint, cluster):
@@ -164,7 +164,7 @@ class ClusterSolver2D(ClusterSolver):
         return balloons
 
     def _make_balloon(self, var1, var2, var3, hog1, hog2):
-        diag_print("_make_balloon "+str(var1)+","+str(var2)+","+str(var3),"clsolver")
+        diag_print("_make_balloon %s,%s,%s", "clsolver", var1, var2, var3)
         # derive sub-hogs if nessecairy
         vars = Set([var1, var2, var3])
         subvars1 = vars.intersection(hog1.xvars)
@@ -394,7 +394,7 @@ class ClusterSolver2D(ClusterSolver):
     # end def
 
     def _merge_hogs(self, hog1, hog2):
-        diag_print("merging "+str(hog1)+"+"+str(hog2), "clsolver")
+        diag_print("merging %s+%s", "clsolver", hog1, hog2)
         # create new hog and method
         xvars = Set(hog1.xvars).union(hog2.xvars)
         mergedhog = Hedgehog(hog1.cvar, xvars)
@@ -442,7 +442,7 @@ class ClusterSolver2D(ClusterSolver):
 
 
     def _search_merge_from_cluster(self, newcluster):
-        diag_print ("_search_merge "+str(newcluster), "clsolver")
+        diag_print("_search_merge %s", "clsolver", newcluster)
         # find clusters overlapping with new cluster
         overlap = {}
         for var in newcluster.vars:
@@ -549,7 +549,7 @@ class ClusterSolver2D(ClusterSolver):
     # end def _search_merge
 
     def _merge_point_cluster(self, pointc, cluster):
-        diag_print("_merge_point_cluster "+str(pointc)+","+str(cluster),"clsolver")
+        diag_print("_merge_point_cluster %s,%s", "clsolver", pointc, cluster)
         #create new cluster and method
         allvars = Set(pointc.vars).union(cluster.vars)
         newcluster = Rigid(allvars)
@@ -563,7 +563,7 @@ class ClusterSolver2D(ClusterSolver):
            Rigid which contains root is used as origin.
            Returns resulting cluster. 
         """
-        diag_print("_merge_cluster_pair "+str(c1)+","+str(c2),"clsolver")
+        diag_print("_merge_cluster_pair %s,%s", "clsolver", c1, c2)
         # always use root cluster as first cluster, swap if needed
         if not self._contains_root(c1) and not self._contains_root(c2):
             #raise "StandardError", "no root cluster"
@@ -583,7 +583,7 @@ class ClusterSolver2D(ClusterSolver):
 
     def _merge_cluster_hog(self, cluster, hog):
         """merge cluster and hog (absorb hog, overconstrained)"""
-        diag_print("_merge_cluster_hog "+str(cluster)+","+str(hog),"clsolver")
+        diag_print("_merge_cluster_hog %s,%s", "clsolver", cluster, hog)
         #create new cluster and merge
         newcluster = Rigid(cluster.vars)
         merge = MergeCH(cluster,hog, newcluster)
@@ -592,7 +592,7 @@ class ClusterSolver2D(ClusterSolver):
 
     def _merge_balloon_hog(self, balloon, hog):
         """merge balloon and hog (absorb hog, overconstrained)"""
-        diag_print("_merge_balloon_hog "+str(balloon)+","+str(hog),"clsolver")
+        diag_print("_merge_balloon_hog %s,%s", "clsolver", balloon, hog)
         #create new balloon and merge
         newballoon = Balloon(balloon.vars)
         merge = MergeBH(balloon, hog, newballoon)
@@ -604,7 +604,7 @@ class ClusterSolver2D(ClusterSolver):
            Rigid which contains root is used as origin.
            Returns resulting cluster. 
         """
-        diag_print("_merge_cluster_triple "+str(c1)+","+str(c2)+","+str(c3),"clsolver")
+        diag_print("_merge_cluster_triple %s,%s,%s", "clsolver", c1, c2, c3)
         # always use root cluster as first cluster, swap if needed
         if self._contains_root(c2):
             diag_print("swap cluster order","clsolver")
@@ -622,7 +622,8 @@ class ClusterSolver2D(ClusterSolver):
 
     def _merge_cluster_hog_cluster(self, c1, hog, c2):
         """merge c1 and c2 with a hog, with hog center in c1 and c2"""
-        diag_print("_merge_cluster_hog_cluster "+str(c1)+","+str(hog)+","+str(c2),"clsolver")
+        diag_print("_merge_cluster_hog_cluster %s,%s,%s", "clsolver",
+                   c1, hog, c2)
         # always use root cluster as first cluster, swap if needed
         if self._contains_root(c2):
             diag_print("swap cluster order","clsolver")
@@ -651,7 +652,8 @@ class ClusterSolver2D(ClusterSolver):
 
     def _merge_cluster_cluster_hog(self, c1, c2, hog):
         """merge c1 and c2 with a hog, with hog center only in c1"""
-        diag_print("_merge_cluster_cluster_hog "+str(c1)+","+str(c2)+","+str(hog),"clsolver")
+        diag_print("_merge_cluster_cluster_hog %s,%s,%s", "clsolver",
+                   c1, c2, hog)
         # always use root cluster as first cluster, swap if needed
         if self._contains_root(c1) and self._contains_root(c2):
             raise StandardError("two root clusters!")
@@ -894,7 +896,8 @@ class Merge3C(Merge):
         return constraints
 
 def solve_ddd(v1,v2,v3,d12,d23,d31):
-    diag_print("solve_ddd: %s %s %s %f %f %f"%(v1,v2,v3,d12,d23,d31),"clmethods")
+    diag_print("solve_ddd: %s %s %s %f %f %f", "clmethods",
+               v1, v2, v3, d12, d23, d31)
     p1 = vector.vector([0.0,0.0])
     p2 = vector.vector([d12,0.0])
     p3s = cc_int(p1,d31,p2,d23)
@@ -998,7 +1001,8 @@ class MergeCHC(Merge):
         return solutions
 
 def solve_dad(v1,v2,v3,d12,a123,d23):
-    diag_print("solve_dad: %s %s %s %f %f %f"%(v1,v2,v3,d12,a123,d23),"clmethods")
+    diag_print("solve_dad: %s %s %s %f %f %f", "clmethods",
+               v1, v2, v3, d12, a123, d23)
     p2 = vector.vector([0.0, 0.0])
     p1 = vector.vector([d12, 0.0])
     p3s = [ vector.vector([d23*math.cos(a123), d23*math.sin(a123)]) ]
@@ -1146,7 +1150,8 @@ class MergeCCH(Merge):
         return constraints
 
 def solve_add(a,b,c, a_cab, d_ab, d_bc):
-    diag_print("solve_dad: %s %s %s %f %f %f"%(a,b,c,a_cab,d_ab,d_bc),"clmethods")
+    diag_print("solve_dad: %s %s %s %f %f %f", "clmethods",
+               a, b, c, a_cab, d_ab, d_bc)
     p_a = vector.vector([0.0,0.0])
     p_b = vector.vector([d_ab,0.0])
     dir = vector.vector([math.cos(-a_cab),math.sin(-a_cab)])
@@ -1217,7 +1222,8 @@ class BalloonFromHogs(Merge):
         return solve_ada(v1,v2,v3, a312, d12, a123)
 
 def solve_ada(a, b, c, a_cab, d_ab, a_abc):
-        diag_print("solve_ada: %s %s %s %f %f %f"%(a,b,c,a_cab,d_ab,a_abc),"clmethods")
+        diag_print("solve_ada: %s %s %s %f %f %f", "clmethods",
+                   a, b, c, a_cab, d_ab, a_abc)
         p_a = vector.vector([0.0,0.0])
         p_b = vector.vector([d_ab, 0.0])
         dir_ac = vector.vector([math.cos(-a_cab),math.sin(-a_cab)])
@@ -1292,7 +1298,8 @@ class BalloonRigidMerge(Merge):
         if len(shared) < 2:
             raise Exception("underconstrained balloon-cluster merge")
         elif len(shared) > 2:
-            diag_print("overconstrained merge "+str(balloon)+"&"+str(cluster), "clmethods")
+            diag_print("overconstrained merge %s&%s", "clmethods",
+                       balloon, cluster)
             self.overconstrained = True
 
     def __str__(self):
@@ -1326,7 +1333,7 @@ class MergeHogs(Merge):
         if len(shared) < 1:
             raise Exception("underconstrained balloon-cluster merge")
         elif len(shared) > 1:
-            diag_print("overconstrained merge "+str(hog1)+"&"+str(hog2), "clmethods")
+            diag_print("overconstrained merge %s&%s", "clmethods", hog1, hog2)
             self.overconstrained = True
 
     def __str__(self):
@@ -99,14 +99,14 @@ class ClusterSolver3D(ClusterSolver):
 
     def _all_sources_constraint_in_cluster(self, constraint, cluster):
         if not self._contains_constraint(cluster, constraint):
-            return Set()
+            return set()
         elif self._is_atomic(cluster):
-            return Set([cluster])
+            return set([cluster])
         else:
             method = self._determining_method(cluster)
-            sources = Set()
+            sources = set()
             for inp in method.inputs():
-                sources.union_update(self._all_sources_constraint_in_cluster(constraint, inp))
+                sources.update(self._all_sources_constraint_in_cluster(constraint, inp))
             return sources
 
     # --------------
@@ -114,7 +114,7 @@ class ClusterSolver3D(ClusterSolver):
     # --------------
 
     def _search(self, newcluster):
-        print("search from:", newcluster)
+        diag_print("search from: %s", "clsolver3D", newcluster)
         # find all toplevel clusters connected to newcluster
         # via one or more variables
         connected = set()
@@ -122,7 +122,7 @@ class ClusterSolver3D(ClusterSolver):
             dependend = self.find_dependend(var)
             dependend = filter(lambda x: self.is_top_level(x), dependend)
             connected.update(dependend)
-        diag_print("search: connected clusters="+str(connected), "clsolver3D")
+        diag_print("search: connected clusters=%s", "clsolver3D", connected)
         # try applying methods
         if self._try_method(connected):
             return True
@@ -134,17 +134,17 @@ class ClusterSolver3D(ClusterSolver):
         # print "search:", newcluster
         # find all toplevel clusters connected to newcluster
         # via one or more variables
-        connected = Set()
+        connected = set()
         for var in newcluster.vars:
             dependend = self.find_dependend(var)
             dependend = filter(lambda x: self.is_top_level(x), dependend)
-            connected.union_update(dependend)
+            connected.update(dependend)
         connected.remove(newcluster)
         #print "connected:", connected
         # make pairs
-        pairs = Set()
+        pairs = set()
         for cluster in connected:
-            pair = Set([newcluster, cluster])
+            pair = set([newcluster, cluster])
             pairs.add(pair)
         #print "pairs:",pairs
         # try merging pairs
@@ -152,7 +152,7 @@ class ClusterSolver3D(ClusterSolver):
             if self._try_method(pair):
                 return True
         # make triplets
-        triplets = Set()
+        triplets = set()
         for pair in pairs:
             for cluster in connected:
                 allconnected = True
@@ -160,7 +160,7 @@ class ClusterSolver3D(ClusterSolver):
                     if c is cluster:
                         allconnected = False
                         break
-                    shared = Set(cluster.vars).intersection(c.vars)
+                    shared = set(cluster.vars).intersection(c.vars)
                     if len(shared) == 0:
                         allconnected = False
                         break
@@ -205,7 +205,8 @@ class ClusterSolver3D(ClusterSolver):
         for methodclass in reversed([MergePR, MergeDR, MergeDDD, MergeADD, MergeDAD, MergeAA, MergeSD, MergeTTD, MergeRR]):
             matches = gmatch(methodclass.patterngraph, refgraph)
             if len(matches) > 0:
-                diag_print("number of matches = " + str(len(matches)), "clsolver3D")
+                diag_print("number of matches = %s", "clsolver3D",
+                           len(matches))
             for s in matches:
                 # diag_print("try match: "+str(s),"clsolver3D")
 
@@ -246,7 +247,7 @@ class ClusterSolver3D(ClusterSolver):
                 # print "#overconstraint=",len(oc), "#constraints"=num_constraints(cluster)
                 infinc = False
                 break
-        diag_print("information increasing:"+str(infinc),"clsolver3D")
+        diag_print("information increasing:%s", "clsolver3D", infinc)
 
         # check if method reduces number of clusters (reduc)
         nremove = 0
@@ -255,7 +256,7 @@ class ClusterSolver3D(ClusterSolver):
                # will be removed from toplevel
                nremove += 1
         reduc = (nremove > 1)
-        diag_print("reduce # clusters:"+str(reduc),"clsolver3D")
+        diag_print("reduce # clusters:%s", "clsolver3D", reduc)
 
         # check if the method is redundant
         if not infinc and not reduc:
@@ -279,6 +280,8 @@ class ClusterSolver3D(ClusterSolver):
         for cluster in merge.inputs():
             overconstrained = overconstrained or cluster.overconstrained
         output.overconstrained = overconstrained
+        # count merges for budget
+        self._merges += 1
         # add to graph
         self._add_cluster(output)
         self._add_method(merge)
@@ -286,11 +289,11 @@ class ClusterSolver3D(ClusterSolver):
         merge.restore_toplevel = []    # make restore list in method
         for cluster in merge.inputs():
             if num_constraints(cluster.intersection(output)) >= num_constraints(cluster):
-               diag_print("remove from top-level: "+str(cluster),"clsolver3D")
+               diag_print("remove from top-level: %s", "clsolver3D", cluster)
                self._rem_top_level(cluster)
                merge.restore_toplevel.append(cluster)
             else:
-               diag_print("keep top-level: "+str(cluster),"clsolver3D")
+               diag_print("keep top-level: %s", "clsolver3D", cluster)
         # add prototype selection method
         self._add_prototype_selector(merge)
         # add solution selection method
@@ -353,7 +356,7 @@ class MergeDR(ClusterMethod):
         in1 = map["$d"]
         in2 = map["$r"]
         # create ouput
-        outvars = Set(in1.vars).union(in2.vars)
+        outvars = set(in1.vars).union(in2.vars)
         out = Rigid(outvars)
         # set method properties
         self._inputs = [in1, in2]
@@ -694,7 +697,8 @@ def solve_ddd_3D(v1,v2,v3,d12,d23,d31):
         d<xy>: numeric distance values
         a<xyz>: numeric angle in radians
     """
-    diag_print("solve_ddd: %s %s %s %f %f %f" % (v1, v2, v3, d12, d23, d31), "clmethods")
+    diag_print("solve_ddd: %s %s %s %f %f %f", "clmethods",
+               v1, v2, v3, d12, d23, d31)
     # solve in 2D
     p1 = vector([0.0, 0.0])
     p2 = vector([d12, 0.0])
@@ -710,7 +714,7 @@ def solve_ddd_3D(v1,v2,v3,d12,d23,d31):
     # return only one solution (if any)
     if len(solutions) > 0:
         solutions = [solutions[0]]
-    diag_print("solve_ddd solutions"+str(solutions), "clmethods")
+    diag_print("solve_ddd solutions%s", "clmethods", solutions)
     return solutions
 
 
@@ -720,7 +724,8 @@ def solve_dad_3D(v1,v2,v3,d12,a123,d23):
         d<xy>: numeric distance values
         a<xyz>: numeric angle in radians
     """
-    diag_print("solve_dad: %s %s %s %f %f %f"%(v1,v2,v3,d12,a123,d23),"clmethods")
+    diag_print("solve_dad: %s %s %s %f %f %f", "clmethods",
+               v1, v2, v3, d12, a123, d23)
     p2 = vector([0.0, 0.0])
     p1 = vector([d12, 0.0])
     p3s = [ vector([d23*math.cos(a123), d23*math.sin(a123)]) ]
@@ -741,7 +746,8 @@ def solve_add_3D(a,b,c, a_cab, d_ab, d_bc):
         a<xyz>: numeric angle in radians
     """
 
-    diag_print("solve_dad: %s %s %s %f %f %f"%(a,b,c,a_cab,d_ab,d_bc),"clmethods")
+    diag_print("solve_dad: %s %s %s %f %f %f", "clmethods",
+               a, b, c, a_cab, d_ab, d_bc)
     p_a = vector([0.0,0.0])
     p_b = vector([d_ab,0.0])
     dir = vector([math.cos(-a_cab),math.sin(-a_cab)])
@@ -762,7 +768,8 @@ def solve_ada_3D(a, b, c, a_cab, d_ab, a_abc):
         d<xy>: numeric distance values
         a<xyz>: numeric angle in radians
     """
-    diag_print("solve_ada: %s %s %s %f %f %f"%(a,b,c,a_cab,d_ab,a_abc),"clmethods")
+    diag_print("solve_ada: %s %s %s %f %f %f", "clmethods",
+               a, b, c, a_cab, d_ab, a_abc)
     p_a = vector([0.0, 0.0])
     p_b = vector([d_ab, 0.0])
     dir_ac = vector([math.cos(-a_cab),math.sin(-a_cab)])
@@ -798,13 +805,13 @@ def solve_3p3d(v1,v2,v3,v4,p1,p2,p3,d14,d24,d34):
         d<xy>: numeric distance value
         a<xyz>: numeric angle in radians
     """
-    diag_print("solve_3p3d: %s %s %s %s "%(v1,v2,v3,v4),"clmethods")
-    diag_print("p1="+str(p1),"clsolver3D")
-    diag_print("p2="+str(p2),"clsolver3D")
-    diag_print("p3="+str(p3),"clsolver3D")
-    diag_print("d14="+str(d14),"clsolver3D")
-    diag_print("d24="+str(d24),"clsolver3D")
-    diag_print("d34="+str(d34),"clsolver3D")
+    diag_print("solve_3p3d: %s %s %s %s ", "clmethods", v1, v2, v3, v4)
+    diag_print("p1=%s", "clsolver3D", p1)
+    diag_print("p2=%s", "clsolver3D", p2)
+    diag_print("p3=%s", "clsolver3D", p3)
+    diag_print("d14=%s", "clsolver3D", d14)
+    diag_print("d24=%s", "clsolver3D", d24)
+    diag_print("d34=%s", "clsolver3D", d34)
     p4s = sss_int(p1,d14,p2,d24,p3,d34)
     solutions = []
     for p4 in p4s:
@@ -58,7 +58,7 @@ class Angle:
 
     def __eq__(self, other):
         if isinstance(other, Angle):
-            return self.vars[2] == other.vars[2] and ImmutableSet(self.vars) == ImmutableSet(other.vars)
+            return self.vars[2] == other.vars[2] and frozenset(self.vars) == frozenset(other.vars)
         else:
             return False
 
@@ -163,7 +163,7 @@ class Hedgehog(Cluster):
         """
         self.cvar = cvar
         if len(xvars) < 2:
-            raise StandardError("hedgehog must have at least three variables")
+            raise Exception("hedgehog must have at least three variables")
         self.xvars = frozenset(xvars)
         self.vars = self.xvars.union([self.cvar])
         self.overconstrained = False
@@ -254,7 +254,7 @@ def over_angles_hh(hog1, hog2):
         shared = list(set(hog1.xvars).intersection(hog2.xvars))
         if not hog1.cvar == hog2.cvar:
             return set()
-        overangles = Set()
+        overangles = set()
         for i in range(len(shared)):
             for j in range(i):
                 v1 = shared[i]
@@ -297,10 +297,10 @@ def over_angles_cb(cluster, balloon):
 
 def over_angles_bh(balloon, hog):
         # determine duplicate angles
-        shared = list(Set(balloon.vars).intersection(hog.xvars))
+        shared = list(set(balloon.vars).intersection(hog.xvars))
         if hog.cvar not in balloon.vars:
-            return Set()
-        overangles = Set()
+            return set()
+        overangles = set()
         for i in range(len(shared)):
             for j in range(i+1,len(shared)):
                 v1 = shared[i]
@@ -310,10 +310,10 @@ def over_angles_bh(balloon, hog):
 
 def over_angles_ch(cluster, hog):
         # determine duplicate angles
-        shared = list(Set(cluster.vars).intersection(hog.xvars))
+        shared = list(set(cluster.vars).intersection(hog.xvars))
         if hog.cvar not in cluster.vars:
-            return Set()
-        overangles = Set()
+            return set()
+        overangles = set()
         for i in range(len(shared)):
             for j in range(i+1,len(shared)):
                 v1 = shared[i]
@@ -27,6 +27,48 @@ def perp2D(v):
     return w
 
 
+def _perpendicular(v):
+    """a unit vector perpendicular to 3D vector v (not zero)"""
+    # cross with the axis along which v is smallest
+    axis = vector([0.0, 0.0, 0.0])
+    axis[min(range(3), key=lambda i: abs(v[i]))] = 1.0
+    w = cross(v, axis)
+    return w / norm(w)
+
+
+def _spans(conf, v1, v2, v3):
+    """True iff the points of v1, v2 and v3 in conf are not collinear"""
+    p1 = conf.get(v1)
+    return not tol_eq(norm(cross(conf.get(v2)-p1, conf.get(v3)-p1)), 0.0)
+
+
+def _spanning_triple(conf1, conf2, shared):
+    """three of the shared variables, whose points are not collinear in
+       either configuration, or None. The first three, if possible."""
+    if _spans(conf1, *shared[0:3]) and _spans(conf2, *shared[0:3]):
+        return tuple(shared[0:3])
+    segment = _segment(conf1, conf2, shared)
+    if len(segment) < 2:
+        return None
+    (v1, v2) = segment
+    for v3 in shared:
+        if _spans(conf1, v1, v2, v3) and _spans(conf2, v1, v2, v3):
+            return (v1, v2, v3)
+    return None
+
+
+def _segment(conf1, conf2, shared):
+    """the first shared variable and the variable farthest from it in 
+       conf1, if not coincident in either configuration, else only the
+       first variable"""
+    v1 = shared[0]
+    v2 = max(shared, key=lambda v: norm(conf1.get(v) - conf1.get(v1)))
+    if tol_eq(norm(conf1.get(v2) - conf1.get(v1)), 0.0) \
+            or tol_eq(norm(conf2.get(v2) - conf2.get(v1)), 0.0):
+        return [v1]
+    return [v1, v2]
+
+
 class Configuration:
     """A set of named points with coordinates of a specified dimension. 
     
@@ -56,7 +98,7 @@ class Configuration:
 
     def vars(self):
         """return list of variables"""
-        return self.map.keys()
+        return list(self.map.keys())
 
     def get(self, var):
         """return position of point var"""
@@ -128,7 +170,7 @@ class Configuration:
 
     def _merge_transform_2D(self, other):
         """returns a new configurations which is this one plus the given other configuration transformed, such that common points will overlap (if possible)."""
-        shared = Set(self.vars()).intersection(other.vars())
+        shared = set(self.vars()).intersection(other.vars())
         underconstrained = self.underconstrained or other.underconstrained
         if len(shared) == 0:
             underconstrained = True
@@ -149,14 +191,14 @@ class Configuration:
             p12 = self.map[v2]
             if tol_eq(norm(p12-p11), 0.0):
                 underconstrained = True
-                cs1 = make_hcs_2d(p11, p11+vector[1.0, 0.0])
+                cs1 = make_hcs_2d(p11, p11+vector([1.0, 0.0]))
             else:
                 cs1 = make_hcs_2d(p11, p12)
             p21 = other.map[v1]
             p22 = other.map[v2]
             if tol_eq(norm(p22-p21),0.0):
                 underconstrained = True
-                cs2 = make_hcs_2d(p21, p21+vector[1.0,0.0])
+                cs2 = make_hcs_2d(p21, p21+vector([1.0,0.0]))
             else:
                 cs2 = make_hcs_2d(p21, p22)
         # in any case
@@ -167,7 +209,7 @@ class Configuration:
     def merge_scale_2D(self, other, vars=[]):
         """returns a new configurations which is this one plus the given other configuration transformed, such that common points will overlap (if possible)."""
         if len(vars) == 0:
-            shared = Set(self.vars()).intersection(other.vars())
+            shared = set(self.vars()).intersection(other.vars())
         else:
             shared = vars
         underconstrained = self.underconstrained or other.underconstrained
@@ -180,14 +222,14 @@ class Configuration:
         p12 = self.map[v2]
         if tol_eq(norm(p12-p11),0.0):
             underconstrained = True
-            cs1 = make_hcs_2d_scaled(p11, p11+vector[1.0,0.0])
+            cs1 = make_hcs_2d_scaled(p11, p11+vector([1.0,0.0]))
         else:
             cs1 = make_hcs_2d_scaled(p11, p12)
         p21 = other.map[v1]
         p22 = other.map[v2]
         if tol_eq(norm(p22-p21),0.0):
             underconstrained = True
-            cs2 = make_hcs_2d_scaled(p21, p21+vector[1.0,0.0])
+            cs2 = make_hcs_2d_scaled(p21, p21+vector([1.0,0.0]))
         else:
             cs2 = make_hcs_2d_scaled(p21, p22)
         print("%s %s" % (cs1, cs2))
@@ -201,8 +243,19 @@ class Configuration:
         """returns a matrix for a rigid transformation 
            such that points in other are mapped onto points in self
         """
-        shared = set(self.vars()).intersection(other.vars())
+        shared = list(set(self.vars()).intersection(other.vars()))
         underconstrained = self.underconstrained or other.underconstrained
+        triple = None
+        if len(shared) >= 3:
+            triple = _spanning_triple(self, other, shared)
+            if triple is None:
+                # collinear shared points: align a segment (or a point, if
+                # coincident); the rotation about it is free
+                underconstrained = True
+                shared = _segment(self, other, shared)
+        elif len(shared) == 2 and len(_segment(self, other, shared)) == 1:
+            underconstrained = True
+            shared = shared[0:1]
         if len(shared) == 0:
             underconstrained = True
             cs1 = make_hcs_3d(vector([0.0, 0.0, 0.0]),
@@ -232,36 +285,22 @@ class Configuration:
             v2 = list(shared)[1]
             p2s = self.map[v2]
             p2o = other.map[v2]
-            p3s = p1s + cross(p2s-p1s, perp2D(p2s-p1s))
-            p3o = p1o + cross(p2o-p1o, perp2D(p2s-p1s))
-            if tol_eq(norm(p2s-p1s),0.0):
-                underconstrained = True
+            # any perpendicular will do, since rotation about the segment 
+            # is free
+            p3s = p1s + _perpendicular(p2s-p1s)
+            p3o = p1o + _perpendicular(p2o-p1o)
             cs1 = make_hcs_3d(p1s, p2s, p3s)
             cs2 = make_hcs_3d(p1o, p2o, p3o)
-        else:   # len(shared) >= 3:
-            v1 = list(shared)[0]
-            v2 = list(shared)[1]
-            v3 = list(shared)[2]
+        else:   # three shared points, not collinear
+            (v1, v2, v3) = triple
             p1s = self.map[v1]
             p2s = self.map[v2]
             p3s = self.map[v3]
             cs1 = make_hcs_3d(p1s, p2s, p3s)
-            if tol_eq(norm(p2s-p1s), 0.0):
-                underconstrained = True
-            if tol_eq(norm(p3s-p1s), 0.0):
-                underconstrained = True
-            if tol_eq(norm(p3s-p2s), 0.0):
-                underconstrained = True
             p1o = other.map[v1]
             p2o = other.map[v2]
             p3o = other.map[v3]
             cs2 = make_hcs_3d(p1o, p2o, p3o)
-            if tol_eq(norm(p2o-p1o), 0.0):
-                underconstrained = True
-            if tol_eq(norm(p3o-p1o), 0.0):
-                underconstrained = True
-            if tol_eq(norm(p3o-p2o), 0.0):
-                underconstrained = True
         # in any case:
         t = cs_transform_matrix(cs2, cs1)
         t.underconstrained = underconstrained
@@ -282,11 +321,11 @@ class Configuration:
             p2o = other.map[v2]
             scale = norm(p2s-p1s) / norm(p2o-p1o)
             scale_trans = pivot_scale_3D(p1o,scale)
-            diag_print("scale_trans = "+str(scale_trans),
-                       "Configuration.merge_scale_transform_3D")
+            diag_print("scale_trans = %s", "Configuration.merge_scale_transform_3D",
+                       scale_trans)
             merge_trans = self._merge_transform_3D(other)
-            diag_print("merge_trans = "+str(merge_trans),
-                       "Configuration.merge_scale_transform_3D")
+            diag_print("merge_trans = %s", "Configuration.merge_scale_transform_3D",
+                       merge_trans)
             # merge_scale_trans = scale_trans.mmul(merge_trans)
             merge_scale_trans = merge_trans.mmul(scale_trans)
             merge_scale_trans.underconstrained = merge_trans.underconstrained
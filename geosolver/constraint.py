@@ -131,6 +131,32 @@ class ConstraintGraph(Notifier):
             self._graph.rem_vertex(con)
             self.send_notify(("rem_constraint", con))
 
+    def add_constraints(self, constraints):
+        """add several constraints, with a single add_constraints 
+           notification (with a list of the added constraints)"""
+        added = []
+        for con in constraints:
+            if con not in self._constraints:
+                self._constraints[con] = None
+                for var in con.variables():
+                    self.add_variable(var)
+                    self._graph.add_edge(var, con)
+                added.append(con)
+        if len(added) > 0:
+            self.send_notify(("add_constraints", added))
+
+    def rem_constraints(self, constraints):
+        """remove several constraints, with a single rem_constraints 
+           notification (with a list of the removed constraints)"""
+        removed = []
+        for con in constraints:
+            if con in self._constraints:
+                del self._constraints[con]
+                self._graph.rem_vertex(con)
+                removed.append(con)
+        if len(removed) > 0:
+            self.send_notify(("rem_constraints", removed))
+
     def get_constraints_on(self, var):
         """get a list of all constraints on var"""
         if self._graph.has_vertex(var):
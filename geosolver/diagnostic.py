@@ -5,6 +5,14 @@
    Only when the code argument in diag_print matches the regular expression diag_codes, 
    then the message is printed. Messages are printed to diag_stream, which defaults to 
    sys.stdout. 
+
+   Messages may be formatted lazily: diag_print(format, code, *args) applies
+   format % args only when the message is actually printed, so callers do not
+   pay for str() conversions and concatenations of disabled diagnostics.
+
+   For hot code, diag_flag(code) returns a DiagFlag instance for a code. 
+   Its 'on' attribute is recomputed only when diag_select is called, so 
+   checking 'if flag.on:' costs a single attribute lookup. 
 """
 
 import sys
@@ -13,21 +21,64 @@ import re
 # diag_selector = re.compile(".*")
 diag_selector = re.compile("nothing")
 diag_stream = sys.stdout
+# map from codes to DiagFlag instances
+_diag_flags = {}
+
+
+class DiagFlag:
+    """A precompiled enable flag for a diagnostic code.
+
+       instance attributes:
+        code    - the diagnostic code
+        on      - True iff code matches the current selector
+    """
+
+    def __init__(self, code):
+        self.code = code
+        self.on = diag_selector.match(code) is not None
+
+    def __bool__(self):
+        return self.on
+
+    __nonzero__ = __bool__
+
+    def __str__(self):
+        return "DiagFlag(" + str(self.code) + "," + str(self.on) + ")"
+
 
 def diag_select(pattern):
     """Set regexp pattern to filter which messages are printed."""
     global diag_selector
     diag_selector = re.compile(pattern)
+    for flag in _diag_flags.values():
+        flag.on = diag_selector.match(flag.code) is not None
 
 def diag_direct(stream):
     """set stream to which messages are printed"""
     global diag_stream
     diag_stream = stream
 
-def diag_print(str, code=''):
-    global diag_selector
-    global diag_stream
-    if diag_selector.match(code):
+def diag_flag(code=''):
+    """return the (shared) DiagFlag for given code"""
+    flag = _diag_flags.get(code)
+    if flag is None:
+        flag = DiagFlag(code)
+        _diag_flags[code] = flag
+    return flag
+
+def diag_enabled(code=''):
+    """return True iff messages with given code are printed"""
+    return diag_flag(code).on
+
+def diag_print(str, code='', *args):
+    """print message str if code is selected. If args are given, 
+       the message is str % args, formatted only when printed."""
+    flag = _diag_flags.get(code)
+    if flag is None:
+        flag = diag_flag(code)
+    if flag.on:
+        if args:
+            str = str % args
         diag_stream.write(str)
         diag_stream.write("\n")
 
@@ -35,9 +86,12 @@ def diag_print(str, code=''):
 def _gen_messages():
     diag_print("Message 1")
     diag_print("Message 2", "group1")
-    diag_print("Message 3", "group1")
+    diag_print("Message %d", "group1", 3)
     diag_print("Message 4", "group2")
-    diag_print("Message 5", "gerror")
+    diag_print("Message %d", "gerror", 5)
+    flag = diag_flag("group2")
+    if flag.on:
+        diag_print("Message 6", "group2")
 
 
 def _test():
@@ -13,13 +13,18 @@ if py2 is True:
 else:
     pass
 
-from geosolver.vector import vector
-from geosolver.clsolver import PrototypeMethod, is_information_increasing
+from geosolver.vector import vector, norm, dot, cross
+from geosolver.clsolver import PrototypeMethod, NumericMerge, \
+    is_information_increasing, aligned_distance
 from geosolver.clsolver2D import ClusterSolver2D
 from geosolver.clsolver3D import ClusterSolver3D
 from geosolver.cluster import Rigid, Hedgehog
 from geosolver.configuration import Configuration
+from geosolver.method import Method
 import math
+import itertools
+import copy
+from contextlib import contextmanager
 from geosolver.diagnostic import diag_print
 from geosolver.constraint import Constraint, ConstraintGraph
 from geosolver.notify import Notifier, Listener
@@ -36,7 +41,7 @@ class GeometricProblem (Notifier, Listener):
        points for each variable and constraints.
        Variables are just names and can be any hashable object (recommend strings)
        Supported constraints are instances of DistanceConstraint,AngleConstraint,
-       FixConstraint or SelectionConstraint.
+       RigidConstraint, FixConstraint or SelectionConstraint.
        
        Prototype points are instances of vector.
 
@@ -44,6 +49,12 @@ class GeometricProblem (Notifier, Listener):
        these changes, and changes in the system of constraints and the prototype, 
        to any other listerers (e.g. GeometricSolver) 
 
+       Changes can be grouped in an update, between begin_update() and 
+       commit(), or using the update() context manager. Changes to 
+       prototype points and parameters are then buffered and passed on 
+       at commit, so that a GeometricSolver propagates all changes only
+       once. 
+
        instance attributes:
          cg         - a ConstraintGraph instance
          prototype  - a dictionary mapping variables to points
@@ -57,6 +68,21 @@ class GeometricProblem (Notifier, Listener):
         self.dimension = dimension
         self.prototype = {}
         self.cg = ConstraintGraph()
+        # indexes for fast lookup of constraints on points:
+        # frozenset([a,b]) -> DistanceConstraint
+        self._distances = {}
+        # (b, frozenset([a,c])) -> AngleConstraint, b is the center point
+        self._angles = {}
+        # var -> FixConstraint
+        self._fixes = {}
+        # keep indexes up to date when constraints are removed from cg
+        self.cg.add_listener(self)
+        # batch verifier, created by verify_all, reset on structural changes
+        self._verifier = None
+        # update nesting depth, and buffered changes during update
+        self._updating = 0
+        self._pending_points = {}
+        self._pending_parameters = {}
 
     def add_point(self, variable, position):
         """add a point variable with a prototype position"""
@@ -70,7 +96,10 @@ class GeometricProblem (Notifier, Listener):
         """set prototype position of point variable"""
         if variable in self.prototype:
             self.prototype[variable] = position
-            self.send_notify(("set_point", (variable,position)))
+            if self._updating > 0:
+                self._pending_points[variable] = position
+            else:
+                self.send_notify(("set_point", (variable,position)))
         else:
             raise Exception("unknown point variable")
 
@@ -84,80 +113,196 @@ class GeometricProblem (Notifier, Listener):
     def has_point(self, variable):
          return variable in self.prototype
 
+    def begin_update(self):
+        """Start an update. Changes to prototype points and parameters
+           are buffered until commit. Updates may be nested."""
+        self._updating += 1
+        if self._updating == 1:
+            self.send_notify(("begin_update", None))
+
+    def commit(self):
+        """End an update. When the outermost update ends, buffered changes
+           are passed on to listeners."""
+        if self._updating == 0:
+            raise Exception("commit without begin_update")
+        self._updating -= 1
+        if self._updating == 0:
+            points = self._pending_points
+            parameters = self._pending_parameters
+            self._pending_points = {}
+            self._pending_parameters = {}
+            for (variable, position) in points.items():
+                if variable in self.prototype:
+                    self.send_notify(("set_point", (variable, position)))
+            for (con, value) in parameters.items():
+                if con in self.cg.constraints():
+                    self.send_notify(("set_parameter", (con, value)))
+            self.send_notify(("commit", None))
+
+    def is_updating(self):
+        """True iff between begin_update and commit"""
+        return self._updating > 0
+
+    @contextmanager
+    def update(self):
+        """Context manager for begin_update and commit, e.g.
+        
+               with problem.update():
+                   problem.set_point(...)
+                   constraint.set_parameter(...)
+        """
+        self.begin_update()
+        try:
+            yield self
+        finally:
+            self.commit()
+
     def add_constraint(self, con):
         """add a constraint"""
+        self._index_constraint(con)
+        self.cg.add_constraint(con)
+        if isinstance(con, SelectionConstraint):
+            self.send_notify(("add_selection_constraint", con))
+
+    def add_constraints(self, constraints):
+        """Add several constraints at once. A GeometricSolver solves them
+           incrementally, but propagates only once. If any constraint can 
+           not be added, none are added."""
+        constraints = list(constraints)
+        indexed = []
+        try:
+            for con in constraints:
+                self._index_constraint(con)
+                indexed.append(con)
+        except Exception:
+            for con in indexed:
+                self._unindex_constraint(con)
+                if isinstance(con, ParametricConstraint):
+                    con.rem_listener(self)
+            raise
+        self.cg.add_constraints(constraints)
+        for con in constraints:
+            if isinstance(con, SelectionConstraint):
+                self.send_notify(("add_selection_constraint", con))
+
+    def _index_constraint(self, con):
+        """check a new constraint, and add it to the lookup indexes"""
+        for var in con.variables():
+            if var not in self.prototype:
+                raise Exception("point variable not in problem")
         if isinstance(con, DistanceConstraint):
-            for var in con.variables():
-                if var not in self.prototype:
-                    raise Exception("point variable not in problem")
             if self.get_distance(con.variables()[0],con.variables()[1]):
                 raise Exception("distance already in problem")
-            else:
-                con.add_listener(self)
-                self.cg.add_constraint(con)
+            self._distances[_distance_key(con)] = con
+            con.add_listener(self)
         elif isinstance(con, AngleConstraint):
-            for var in con.variables():
-                if var not in self.prototype:
-                    raise Exception("point variable not in problem")
             if self.get_angle(con.variables()[0],con.variables()[1], con.variables()[2]):
                 raise Exception("angle already in problem")
-            else:
-                con.add_listener(self)
-                self.cg.add_constraint(con)
+            self._angles[_angle_key(con)] = con
+            con.add_listener(self)
+        elif isinstance(con, RigidConstraint):
+            con.add_listener(self)
         elif isinstance(con, SelectionConstraint):
-            for var in con.variables():
-                if var not in self.prototype:
-                    raise Exception("point variable not in problem")
-            self.cg.add_constraint(con)
-            self.send_notify(("add_selection_constraint", con))
+            pass
         elif isinstance(con, FixConstraint):
-            for var in con.variables():
-                if var not in self.prototype:
-                    raise Exception("point variable not in problem")
             if self.get_fix(con.variables()[0]):
                 raise Exception("fix already in problem")
-            self.cg.add_constraint(con)
+            self._fixes[con.variables()[0]] = con
+            con.add_listener(self)
         else:
             raise Exception("unsupported constraint type")
 
+    def add_instance(self, template, mapping, prototype=None):
+        """Add an instance of a template (see geosolver.template), i.e. 
+           copies of its constraints, with the variables renamed by mapping
+           (a dictionary from variables of the template to variables of 
+           this problem). Points that are not in this problem are added, 
+           with a position from prototype (a dictionary from variables of 
+           the template to positions) or else the prototype of the 
+           template. A GeometricSolver adds a copy of the plan of the 
+           template, instead of searching. Returns the added constraints."""
+        if prototype is None:
+            prototype = {}
+        copies = {}
+        with self.update():
+            # listeners get begin_instance, the new points and constraints,
+            # and then add_instance (also if adding fails)
+            self.send_notify(("begin_instance", template))
+            try:
+                for var in template.problem.prototype:
+                    if mapping[var] not in self.prototype:
+                        position = prototype.get(var)
+                        if position is None:
+                            position = template.problem.get_point(var)
+                        self.add_point(mapping[var], position)
+                copies = template.copy_constraints(mapping)
+                self.add_constraints(copies.values())
+            finally:
+                self.send_notify(("add_instance",
+                                  (template, mapping, copies)))
+        return list(copies.values())
+
     def get_distance(self, a, b):
         """return the distance constraint on given points, or None"""
-        on_a = self.cg.get_constraints_on(a)
-        on_b = self.cg.get_constraints_on(b)
-        on_ab = filter(lambda c: c in on_a and c in on_b, on_a)
-        distances = list(filter(lambda c: isinstance(c, DistanceConstraint), on_ab))
-        if len(distances) > 1:
-            raise Exception("multiple constraints found")
-        elif len(distances) == 1:
-            return distances[0]
-        else:
-            return None
+        return self._distances.get(frozenset([a, b]))
 
     def get_angle(self, a, b, c):
         """return the angle constraint on given points, or None"""
-        on_a = self.cg.get_constraints_on(a)
-        on_b = self.cg.get_constraints_on(b)
-        on_c = self.cg.get_constraints_on(c)
-        on_abc = filter(lambda x: x in on_a and x in on_b and x in on_c, on_a)
-        angles = filter(lambda x: isinstance(x, AngleConstraint), on_abc)
-        candidates = list(filter(lambda x: x.variables()[1] == b, angles))
-        if len(candidates) > 1:
-            raise Exception("multiple constraints found")
-        elif len(candidates) == 1:
-            return candidates[0]
-        else:
-            return None
+        return self._angles.get((b, frozenset([a, c])))
 
     def get_fix(self, p):
         """return the fix constraint on given point, or None"""
-        on_p = self.cg.get_constraints_on(p)
-        fixes = filter(lambda x: isinstance(x, FixConstraint), on_p)
-        if len(list(fixes)) > 1:
-            raise Exception("multiple constraints found")
-        elif len(list(fixes)) == 1:
-            return list(fixes)[0]
-        else:
-            return None
+        return self._fixes.get(p)
+
+    def fork(self):
+        """Return a copy of the problem, that can be changed independently,
+           e.g. to try a change speculatively (see GeometricSolver.fork).
+           Parametric constraints are copied; the fork maps the copies to
+           the original constraints in the attribute _origins."""
+        if self._updating > 0:
+            raise Exception("cannot fork a problem during an update")
+        fork = GeometricProblem(self.dimension)
+        fork._origins = {}
+        for var in self.prototype:
+            fork.add_point(var, self.prototype[var])
+        for con in self.cg.constraints():
+            if isinstance(con, ParametricConstraint):
+                other = copy.copy(con)
+                Notifier.__init__(other)
+            else:
+                other = con
+            fork._origins[other] = con
+            fork.add_constraint(other)
+        return fork
+
+    def _adopt(self, fork):
+        """apply the changes made to a fork of this problem"""
+        origins = fork._origins
+        kept = {}
+        for con in fork.cg.constraints():
+            if con in origins:
+                kept[origins[con]] = True
+        for con in list(self.cg.constraints()):
+            if con not in kept:
+                self.rem_constraint(con)
+        for var in list(self.prototype):
+            if var not in fork.prototype:
+                self.rem_point(var)
+        for (var, position) in fork.prototype.items():
+            if var not in self.prototype:
+                self.add_point(var, position)
+            elif self.prototype[var] is not position:
+                self.set_point(var, position)
+        for con in fork.cg.constraints():
+            if con not in origins:
+                # new in the fork: move it to this problem
+                if isinstance(con, ParametricConstraint):
+                    con.rem_listener(fork)
+                self.add_constraint(con)
+            elif origins[con] is not con:
+                original = origins[con]
+                if original.get_parameter() is not con.get_parameter():
+                    original.set_parameter(con.get_parameter())
 
     def verify(self, solution):
         """returns true iff all constraints satisfied by given solution. 
@@ -173,13 +318,26 @@ class GeometricProblem (Notifier, Listener):
                         solved = False
                         break
                 if not solved:
-                    diag_print(str(con)+" not solved", "GeometricProblem.verify")
+                    diag_print("%s not solved", "GeometricProblem.verify", con)
                     sat = False
                 elif not con.satisfied(solution):
-                    diag_print(str(con)+" not satisfied", "GeometricProblem.verify")
+                    diag_print("%s not satisfied", "GeometricProblem.verify",
+                               con)
                     sat = False
         return sat
 
+    def verify_all(self, solutions, variables=None):
+        """Verify many solutions at once, see batchsolve.BatchVerifier. 
+           solutions is a list of dictionaries mapping variables to points,
+           or an (N x V x dimension) array with points in the order of 
+           variables (default cg.variables()). Returns a tuple (passed, 
+           worst) of arrays with a flag and the largest residual for each
+           solution. Requires numpy."""
+        if self._verifier is None:
+            from geosolver.batchsolve import BatchVerifier
+            self._verifier = BatchVerifier(self)
+        return self._verifier.verify(solutions, variables)
+
     def rem_point(self, var):
         """remove a point variable from the constraint system"""
         if var in self.prototype:
@@ -197,16 +355,55 @@ class GeometricProblem (Notifier, Listener):
         else:
             raise Exception("no constraint "+str(con)+" in problem.")
 
+    def rem_constraints(self, constraints):
+        """Remove several constraints at once. A GeometricSolver removes 
+           them with a single propagation. If any constraint is not in the
+           problem, none are removed."""
+        constraints = list(constraints)
+        for con in constraints:
+            if con not in self.cg.constraints():
+                raise Exception("no constraint "+str(con)+" in problem.")
+        for con in constraints:
+            if isinstance(con, SelectionConstraint):
+                self.send_notify(("rem_selection_constraint", con))
+        self.cg.rem_constraints(constraints)
+
     def receive_notify(self, object, notify):
         """When notified of changed constraint parameters,
         pass on to listeners"""
         if isinstance(object, ParametricConstraint):
             (message, data) = notify
             if message == "set_parameter":
-                self.send_notify(("set_parameter",(object,data)))
+                if self._updating > 0:
+                    self._pending_parameters[object] = data
+                else:
+                    self.send_notify(("set_parameter",(object,data)))
+        elif object == self.cg:
+            (message, data) = notify
+            if message == "rem_constraint":
+                self._unindex_constraint(data)
+            elif message == "rem_constraints":
+                for con in data:
+                    self._unindex_constraint(con)
+            self._verifier = None
         # elif object == self.cg:
         #    self.send_notify(notify)
 
+    def _unindex_constraint(self, con):
+        """remove constraint from the lookup indexes"""
+        if isinstance(con, DistanceConstraint):
+            key = _distance_key(con)
+            if self._distances.get(key) is con:
+                del self._distances[key]
+        elif isinstance(con, AngleConstraint):
+            key = _angle_key(con)
+            if self._angles.get(key) is con:
+                del self._angles[key]
+        elif isinstance(con, FixConstraint):
+            var = con.variables()[0]
+            if self._fixes.get(var) is con:
+                del self._fixes[var]
+
     def __str__(self):
         s = ""
         for v in self.prototype:
@@ -218,6 +415,17 @@ class GeometricProblem (Notifier, Listener):
 # class GeometricProblem
 
 
+def _distance_key(con):
+    """key of a DistanceConstraint in GeometricProblem._distances"""
+    return frozenset(con.variables())
+
+
+def _angle_key(con):
+    """key of an AngleConstraint in GeometricProblem._angles"""
+    (a, b, c) = con.variables()
+    return (b, frozenset([a, c]))
+
+
 # ---------- GeometricSolver --------------
 
 class GeometricSolver (Listener):
@@ -227,11 +435,19 @@ class GeometricSolver (Listener):
 
     # public methods
 
-    def __init__(self, problem):
+    def __init__(self, problem, max_time=None, max_merges=None,
+                 single_branch=False, cancel=None, progress=None):
         """Create a new GeometricSolver instance
         
            keyword args
             problem        - the GeometricProblem instance to be monitored for changes
+            max_time       - maximum time in seconds spent on solving after each change
+            max_merges     - maximum number of merges after each change
+            single_branch  - if True, keep only the solution closest to the prototype
+            cancel         - a threading.Event; when set, solving is stopped by
+                             raising Cancelled (see ClusterSolver.set_cancel)
+            progress       - callback(clustersolver), called after each step
+                             of solving (see ClusterSolver.set_progress)
         """
         # init superclasses
         Listener.__init__(self)
@@ -246,32 +462,269 @@ class GeometricSolver (Listener):
             self.dr = ClusterSolver3D()
         else:
             raise Exception("Do not know how to solve problems of dimension > 3.")
+        self.dr.set_budget(max_time, max_merges)
+        self.dr.set_single_branch(single_branch)
+        self.dr.set_cancel(cancel)
+        self.dr.set_progress(progress)
+        self._max_solutions = None
+        self._rank_by = "prototype"
+        self._rank = None
+        self._previous = {}
+        # number of changes to the problem, and the solver forked from
+        self._changes = 0
+        self._parent = None
+        # cached result: GeometricCluster, configurations used and first
+        # (best ranked) configuration per rigid, rigids whose subclusters changed,
+        # and top-level clusters
+        self._results = {}
+        self._configurations = {}
+        self._ranked = {}
+        self._changed_subs = {}
+        self._toplevel = None
+        # numeric refinement of over-constrained clusters
+        self._refine = False
+        # numeric merge of rigid, but not decomposable, problems: the
+        # merged rigid, if any, and the last solution of a dropped merge,
+        # to start the next one from
+        self._numeric = False
+        self._numeric_rigid = None
+        self._numeric_start = None
+        if self.problem.is_updating():
+            self.dr.begin_batch()
         self._map = {}
 
         # register
+        self.problem.add_listener(self)
         self.cg.add_listener(self)
         self.dr.add_listener(self)
 
         # create an initial fix cluster
         self.fixvars = []
         self.fixcluster = None
+        # configuration of the fixed points, or None
+        self._fixconf = None
 
-        # map current cg
-        for var in self.cg.variables():
-            self._add_variable(var)
+        try:
+            # map current cg
+            for var in self.cg.variables():
+                self._add_variable(var)
 
-        # add distances first? Nicer decomposition in Rigids
-        for con in self.cg.constraints():
-            if isinstance(con, DistanceConstraint):
-                self._add_constraint(con)
+            # add distances first? Nicer decomposition in Rigids
+            for con in self.cg.constraints():
+                if isinstance(con, DistanceConstraint):
+                    self._add_constraint(con)
 
-        # add angles and other constraints first? Better performance
-        for con in self.cg.constraints():
-            if not isinstance(con, DistanceConstraint):
-                self._add_constraint(con)
+            # add angles and other constraints first? Better performance
+            for con in self.cg.constraints():
+                if not isinstance(con, DistanceConstraint):
+                    self._add_constraint(con)
+        except BaseException:
+            # e.g. Cancelled: the solver must not follow the problem, even
+            # while the exception (and thus the solver) is kept
+            self.problem.rem_listener(self)
+            self.cg.rem_listener(self)
+            self.dr.rem_listener(self)
+            raise
+
+    def set_budget(self, max_time=None, max_merges=None):
+        """Limit the time (in seconds) and/or number of merges spent on 
+           solving after each change to the problem. None means no limit."""
+        self.dr.set_budget(max_time, max_merges)
+
+    def is_complete(self):
+        """False iff solving was stopped because the budget was exhausted"""
+        return self.dr.is_complete()
+
+    def set_single_branch(self, single):
+        """Iff single is True, only the solution closest to the prototype is
+           computed, falling back to all solutions where that is ambiguous.
+           Faster for interactive editing, where only the intended solution
+           is needed."""
+        self.dr.set_single_branch(single)
+
+    def set_max_solutions(self, max_solutions=None, rank_by="prototype"):
+        """Limit the number of solutions of each cluster to max_solutions
+           (None means no limit). The limit is applied during solving, so 
+           no more than max_solutions solutions are computed for each 
+           cluster, also after later changes. Solutions are ranked by 
+           rank_by, which is one of:
+            "prototype" - closest to the prototype first
+            "previous"  - closest to the solution of the cluster ranked first 
+                          by the previous get_result, else closest to the 
+                          prototype first
+            a function  - called with a solution of any cluster (a dictionary
+                          mapping variables to points), lowest value first
+           Because the limit is applied to every cluster, solutions are 
+           selected greedily, and fewer than max_solutions solutions may be
+           found even if the problem has more.
+        """
+        rank = self._ranking(rank_by)
+        self._max_solutions = max_solutions
+        self._rank_by = rank_by
+        self._rank = rank
+        self.dr.set_max_solutions(max_solutions, rank)
+
+    def _ranking(self, rank_by):
+        """the rank function for set_max_solutions"""
+        if rank_by == "prototype":
+            return self._rank_prototype
+        elif rank_by == "previous":
+            return self._rank_previous
+        elif callable(rank_by):
+            return lambda cluster, configuration: rank_by(configuration.map)
+        else:
+            raise Exception("unknown ranking "+str(rank_by))
+
+    def set_refinement(self, refine):
+        """Iff refine is True, the solutions of over-constrained clusters 
+           (flag S_OVER or I_OVER) in the result are refined numerically,
+           minimizing the residuals of all constraints on the points of 
+           the cluster (see refine.refine). Clusters without solutions are
+           refined from the prototype, and the result is added as a 
+           solution if all constraints are satisfied. The largest residual
+           is stored in the residual attribute of the cluster. Requires
+           numpy."""
+        self._refine = refine
+        self._configurations = {}
+
+    def set_numeric_fallback(self, fallback):
+        """Iff fallback is True, problems that are rigid, but that cannot
+           be decomposed (e.g. the double banana with an extra distance 
+           between the bananas), are solved numerically. If the top-level
+           clusters together are rigid, they are merged by a NumericMerge,
+           which places them as rigid bodies and solves the constraints 
+           between them, starting from the prototype. The merge is part of
+           the plan, so it is executed again when parameters or the 
+           prototype change. If the numeric solver does not converge, 
+           also from the previous solution and from restarts, the merged 
+           cluster has no solutions and flag UNSOLVED. Requires numpy."""
+        self._numeric = fallback
+        self._drop_numeric()
+        self._update_numeric()
+
+    def set_tracking(self, tolerance=None):
+        """Track solutions through small changes, e.g. when dragging a point
+           or animating a parameter. Where a merge has several solutions,
+           the one closest to the previous solution is kept, if no point
+           moves more than tolerance (modulo rigid transformations). 
+           None disables tracking."""
+        self.dr.set_tracking(tolerance)
+
+    def resume(self):
+        """Continue solving, with a new budget. 
+           Returns True iff solving is complete."""
+        complete = self.dr.resume()
+        self._update_numeric()
+        return complete
+
+    def fork(self):
+        """Return a snapshot of the solver, with a fork of the problem (the
+           problem attribute of the snapshot), to try changes 
+           speculatively. Changes to the forked problem are solved 
+           incrementally by the snapshot, without affecting this solver
+           or its problem. The snapshot is then either committed, which
+           applies the changes to the problem of this solver and adopts 
+           the solution of the snapshot, or dropped.
+
+           Clusters, methods and configurations are shared with the 
+           snapshot, and copied only when changed (see ClusterSolver.fork), 
+           so forking takes time linear in the size of the problem, 
+           without solving. Settings of the solver are copied, and can be
+           changed independently. The problem must not be changed while 
+           it has a snapshot."""
+        if self.problem.is_updating():
+            raise Exception("cannot fork a solver during an update")
+        problem = self.problem.fork()
+        copies = {}
+        for (other, con) in problem._origins.items():
+            copies[con] = other
+        fork = GeometricSolver.__new__(GeometricSolver)
+        fork.__dict__.update(self.__dict__)
+        Listener.__init__(fork)
+        fork.problem = problem
+        fork.cg = problem.cg
+        fork.dr = self.dr.fork()
+        fork._map = {}
+        for (key, value) in self._map.items():
+            fork._map[copies.get(key, key)] = copies.get(value, value)
+        fork.fixvars = list(self.fixvars)
+        fork._previous = dict(self._previous)
+        fork._results = {}
+        fork._configurations = {}
+        fork._ranked = {}
+        fork._changed_subs = {}
+        fork._toplevel = None
+        if self._rank is not None:
+            fork._rank = fork._ranking(self._rank_by)
+            fork.dr._rank = fork._rank
+        fork._changes = 0
+        fork._parent = (self, self._changes)
+        fork.problem.add_listener(fork)
+        fork.cg.add_listener(fork)
+        fork.dr.add_listener(fork)
+        return fork
+
+    def commit(self):
+        """Apply the changes made to the problem of a snapshot (see fork) to
+           the problem of the solver it was forked from, which adopts the
+           solution of the snapshot. The snapshot can not be used 
+           afterwards."""
+        if self._parent is None:
+            raise Exception("not a snapshot, or already committed or dropped")
+        (parent, changes) = self._parent
+        if parent._changes != changes:
+            raise Exception("problem changed since the snapshot was taken")
+        if self.problem.is_updating():
+            raise Exception("cannot commit a snapshot during an update")
+        self.drop()
+        # apply changes to the problem, without solving them again
+        parent.problem.rem_listener(parent)
+        parent.cg.rem_listener(parent)
+        try:
+            parent.problem._adopt(self.problem)
+        finally:
+            parent.problem.add_listener(parent)
+            parent.cg.add_listener(parent)
+        # adopt the solver state, keeping the identity of the solver and
+        # its listeners and subscribers
+        origins = self.problem._origins
+        notify = dict((key, parent.dr.__dict__[key])
+                      for key in Notifier().__dict__)
+        parent.dr.__dict__.update(self.dr.__dict__)
+        parent.dr.__dict__.update(notify)
+        parent._map = {}
+        for (key, value) in self._map.items():
+            parent._map[origins.get(key, key)] = origins.get(value, value)
+        parent.fixvars = self.fixvars
+        parent.fixcluster = self.fixcluster
+        parent._fixconf = self._fixconf
+        parent._numeric_rigid = self._numeric_rigid
+        parent._numeric_start = self._numeric_start
+        parent._previous = self._previous
+        parent._results = {}
+        parent._configurations = {}
+        parent._ranked = {}
+        parent._changed_subs = {}
+        parent._toplevel = None
+        parent._changes += 1
+        if parent._rank is not None:
+            parent.dr._rank = parent._rank
+        parent.dr._bind_rankings()
+
+    def drop(self):
+        """Discard a snapshot (see fork): it no longer follows changes of
+           its problem."""
+        if self._parent is None:
+            raise Exception("not a snapshot, or already committed or dropped")
+        self._parent = None
+        self.problem.rem_listener(self)
+        self.cg.rem_listener(self)
+        self.dr.rem_listener(self)
 
     def get_constrainedness(self):
-        toplevel = self.dr.top_level()
+        if not self.dr.is_complete():
+            return "incomplete"
+        toplevel = self._top_level()
         if len(toplevel) > 1:
             return "under-constrained"
         elif len(toplevel) == 1:
@@ -289,65 +742,50 @@ class GeometricSolver (Listener):
         elif len(toplevel) == 0:
             return "error"
 
-    def get_result(self):
-        """returns the result as a GeometricCluster"""
-        map = {}
-        # map dr clusters
-        for drcluster in self.dr.rigids():
-            # create geo cluster and map to drcluster (and vice versa)
-            geocluster = GeometricCluster()
-            map[drcluster] = geocluster
-            map[geocluster] = drcluster
-            # determine variables
-            for var in drcluster.vars:
-                geocluster.variables.append(var)
-            # determine solutions
-            solutions = self.dr.get(drcluster)
-            underconstrained = False
-            if solutions != None:
-                for solution in solutions:
-                    geocluster.solutions.append(solution.map)
-                    if solution.underconstrained:
-                        underconstrained = True
-            # determine flag
-            if drcluster.overconstrained:
-                geocluster.flag = GeometricCluster.S_OVER
-            elif len(geocluster.solutions) == 0:
-                geocluster.flag = GeometricCluster.I_OVER
-            elif underconstrained:
-                geocluster.flag = GeometricCluster.I_UNDER
-            else:
-                geocluster.flag = GeometricCluster.OK
-
-        # determine subclusters
-        for method in self.dr.methods():
-            # if is_information_increasing(method):
-                for out in method.outputs():
-                    if isinstance(out, Rigid):
-                        parent = map[out]
-                        for inp in method.inputs():
-                            if isinstance(inp, Rigid):
-                                parent.subs.append(map[inp])
-
-        # combine clusters due to selection
-        for method in self.dr.methods():
-            if isinstance(method, PrototypeMethod):
-                incluster = method.inputs()[0]
-                outcluster = method.outputs()[0]
-                geoin = map[incluster]
-                geoout = map[outcluster]
-                geoout.subs = list(geoin.subs)
+    def get_result(self, max_solutions=None, rank_by=None, lazy=False):
+        """returns the result as a GeometricCluster. If solving was 
+           stopped because the budget was exhausted, the result is the 
+           decomposition found so far and its incomplete attribute is True.
+
+           If max_solutions or rank_by are given and differ from the 
+           current setting, set_max_solutions is called first (with the 
+           current setting for the other argument). Like any call of 
+           set_max_solutions, this setting stays in effect for later 
+           changes and calls of get_result. When a ranking is set, 
+           solutions are listed best first.
+
+           The result is a new tree of GeometricClusters on each call, 
+           which later changes of the problem do not affect. The solution
+           dictionaries are shared with earlier results, and should not 
+           be changed.
+
+           If lazy is True, a LazyGeometricCluster is returned instead,
+           which determines solutions, flags and subclusters only when
+           they are accessed.
+        """
+        if max_solutions is not None or rank_by is not None:
+            if max_solutions is None:
+                max_solutions = self._max_solutions
+            if rank_by is None:
+                rank_by = self._rank_by
+            if self._rank is None or max_solutions != self._max_solutions \
+                    or rank_by != self._rank_by:
+                self.set_max_solutions(max_solutions, rank_by)
+        if lazy:
+            return self._get_lazy_result()
+        self._update_results()
+        map = self._results
 
         # determine top-level result
-        rigids = filter(lambda c: isinstance(c, Rigid), self.dr.top_level())
-        if len(list(rigids)) == 0:
+        rigids = self._top_level_rigids()
+        if len(rigids) == 0:
             # no variables in problem?
             result = GeometricCluster()
             result.variables = []
             result.subs = []
             result.solutions = []
             result.flags = GeometricCluster.UNSOLVED
-        elif len(list(rigids)) == 1:
+        elif len(rigids) == 1:
             # structurally well constrained
             result = map[rigids[0]]
         else:
@@ -356,22 +794,206 @@ class GeometricSolver (Listener):
             result.flag = GeometricCluster.S_UNDER
             for rigid in rigids:
                 result.subs.append(map[rigid])
+        result = self._copy_result(result)
+        result.incomplete = not self.dr.is_complete()
         return result
 
+    def _copy_result(self, result):
+        """a copy of a tree of (cached) GeometricClusters, with new 
+           clusters and lists; shared subclusters stay shared"""
+        copies = {}
+        stack = [result]
+        while len(stack) > 0:
+            geocluster = stack.pop()
+            if id(geocluster) not in copies:
+                copies[id(geocluster)] = copy.copy(geocluster)
+                stack.extend(geocluster.subs)
+        for geocluster in copies.values():
+            geocluster.variables = list(geocluster.variables)
+            geocluster.solutions = list(geocluster.solutions)
+            geocluster.subs = [copies[id(sub)] for sub in geocluster.subs]
+        return copies[id(result)]
+
+    def _update_results(self):
+        """Update the cached GeometricClusters. Solutions and flags are 
+           only determined again for rigids whose configurations changed, 
+           and subclusters only for rigids whose determining methods 
+           changed (see receive_notify)."""
+        previous = {}
+        for drcluster in self.dr.rigids():
+            configurations = self.dr.get(drcluster)
+            geocluster = self._results.get(drcluster)
+            if geocluster is None:
+                geocluster = GeometricCluster()
+                geocluster.variables = list(drcluster.vars)
+                self._results[drcluster] = geocluster
+                self._changed_subs[drcluster] = True
+                changed = True
+            else:
+                changed = self._configurations.get(drcluster) is not configurations
+            ranked = self._rank is not None and configurations is not None
+            if changed or (ranked and len(configurations) > 1):
+                self._update_solutions(drcluster, geocluster, configurations)
+            if ranked and len(configurations) > 0:
+                previous[drcluster] = self._ranked[drcluster]
+        for drcluster in self._changed_subs:
+            if drcluster in self._results:
+                self._results[drcluster].subs = [self._results[c] 
+                    for c in self._determine_subs(drcluster)]
+        self._changed_subs = {}
+        self._previous = previous
+
+    def _update_solutions(self, drcluster, geocluster, configurations):
+        self._configurations[drcluster] = configurations
+        if configurations is None:
+            configurations = []
+        elif self._rank is not None:
+            configurations = sorted(configurations, 
+                key=lambda c: self._rank(drcluster, c))
+        else:
+            configurations = list(configurations)
+        if len(configurations) > 0:
+            self._ranked[drcluster] = configurations[0]
+        geocluster.solutions = [self._absolute(drcluster, c).map
+                                for c in configurations]
+        underconstrained = True in [c.underconstrained for c in configurations]
+        # determine flag
+        if drcluster.overconstrained:
+            geocluster.flag = GeometricCluster.S_OVER
+        elif len(geocluster.solutions) == 0 and self._unsolved(drcluster):
+            geocluster.flag = GeometricCluster.UNSOLVED
+        elif len(geocluster.solutions) == 0:
+            geocluster.flag = GeometricCluster.I_OVER
+        elif underconstrained:
+            geocluster.flag = GeometricCluster.I_UNDER
+        else:
+            geocluster.flag = GeometricCluster.OK
+        geocluster.residual = None
+        if self._refine and geocluster.flag in (GeometricCluster.S_OVER,
+                                                GeometricCluster.I_OVER):
+            (geocluster.solutions, geocluster.residual) = \
+                self._refine_solutions(drcluster, geocluster.solutions)
+
+    def _refine_solutions(self, drcluster, solutions):
+        """refine the solutions of an over-constrained cluster, or its
+           prototype if it has no solutions; returns the solutions and the
+           largest residual"""
+        from geosolver.refine import refine
+        if len(solutions) > 0:
+            starts = solutions
+        else:
+            prototype = {}
+            for var in drcluster.vars:
+                prototype[var] = self.problem.get_point(var)
+            starts = [prototype]
+        refined = []
+        worst = 0.0
+        for start in starts:
+            (solution, residual) = refine(self.problem, start)
+            refined.append(solution)
+            worst = max(worst, residual)
+        if len(solutions) > 0 or tol_eq(worst, 0.0):
+            solutions = refined
+        return (solutions, worst)
+
+    def _unsolved(self, drcluster):
+        """True iff a rigid has no solutions because a numeric merge did 
+           not converge, rather than because it is over-constrained"""
+        for method in self.dr.find_depends(drcluster):
+            if isinstance(method, PrototypeMethod):
+                return self._unsolved(method.inputs()[0])
+            elif isinstance(method, NumericMerge):
+                return not self.dr.is_converged(method)
+        return False
+
+    def _determine_subs(self, drcluster):
+        """the rigids that are subclusters of the given rigid in the result,
+           i.e. the rigid inputs of the method determining it, or for 
+           prototype selection, the subclusters of the selected cluster"""
+        subs = []
+        for method in self.dr.find_depends(drcluster):
+            if isinstance(method, PrototypeMethod):
+                return self._determine_subs(method.inputs()[0])
+            elif isinstance(method, NumericMerge):
+                return list(filter(lambda c: isinstance(c, Rigid),
+                                   method.clusters))
+            elif isinstance(method, Method):
+                for inp in method.inputs():
+                    if isinstance(inp, Rigid):
+                        subs.append(inp)
+        return subs
+
+    def _top_level(self):
+        """cached list of top-level clusters"""
+        if self._toplevel is None:
+            self._toplevel = self.dr.top_level()
+        return self._toplevel
+
+    def _top_level_rigids(self):
+        return list(filter(lambda c: isinstance(c, Rigid), self._top_level()))
+
+    def _get_lazy_result(self):
+        clusters = {}
+        rigids = self._top_level_rigids()
+        if len(rigids) == 1:
+            result = LazyGeometricCluster(self, rigids[0], clusters)
+            clusters[rigids[0]] = result
+        else:
+            result = LazyGeometricCluster(self, None, clusters)
+            if len(rigids) == 0:
+                result.flag = GeometricCluster.UNSOLVED
+            else:
+                result.flag = GeometricCluster.S_UNDER
+                result.subs = [result._cluster(r) for r in rigids]
+        result.incomplete = not self.dr.is_complete()
+        return result
+
+    def _rank_prototype(self, drcluster, configuration):
+        return self.dr.prototype_distance(configuration)
+
+    def _rank_previous(self, drcluster, configuration):
+        if drcluster in self._previous:
+            return aligned_distance(configuration, self._previous[drcluster])
+        return self.dr.prototype_distance(configuration)
+
     def receive_notify(self, object, message):
         """Take notice of changes in constraint graph"""
+        if object == self.cg or object == self.problem:
+            self._changes += 1
         if object == self.cg:
+            self.dr.reset_budget()
+            self._drop_numeric()
             (type, data) = message
             if type == "add_constraint":
                 self._add_constraint(data)
             elif type == "rem_constraint":
                 self._rem_constraint(data)
+            elif type == "add_constraints":
+                self.dr.begin_batch()
+                try:
+                    # distances first, see __init__
+                    for con in data:
+                        if isinstance(con, DistanceConstraint):
+                            self._add_constraint(con)
+                    for con in data:
+                        if not isinstance(con, DistanceConstraint):
+                            self._add_constraint(con)
+                finally:
+                    self.dr.end_batch()
+            elif type == "rem_constraints":
+                self.dr.begin_batch()
+                try:
+                    for con in data:
+                        self._rem_constraint(con)
+                finally:
+                    self.dr.end_batch()
             elif type == "add_variable":
                 self._add_variable(data)
             elif type == "rem_variable":
                 self._rem_variable(data)
             else:
                 raise Exception("unknown message type"+str(type))
+            self._update_numeric()
         elif object == self.problem:
             (type, data) = message
             if type == "set_point":
@@ -380,15 +1002,61 @@ class GeometricSolver (Listener):
             elif type == "set_parameter":
                 (constraint, value) = data
                 self._update_constraint(constraint)
+            elif type == "begin_instance":
+                # do not search the clusters of the instance, until the
+                # plan of the template has been added
+                self.dr.begin_batch(True)
+            elif type == "add_instance":
+                (template, mapping, copies) = data
+                try:
+                    self._add_instance(template, mapping, copies)
+                finally:
+                    self.dr.end_batch()
+            elif type == "add_selection_constraint" \
+                    or type == "rem_selection_constraint":
+                # solution selection is not done by the cluster solvers;
+                # selection constraints are only checked by verify
+                pass
+            elif type == "begin_update":
+                self.dr.begin_batch()
+            elif type == "commit":
+                self.dr.reset_budget()
+                self.dr.end_batch()
+                self._update_numeric()
             else:
                 raise Exception("unknown message type"+str(type))
         elif object == self.dr:
-            pass
+            (type, data) = message
+            self._toplevel = None
+            if type == "add" and isinstance(data, Method):
+                for cluster in data.outputs():
+                    self._changed_subs[cluster] = True
+            elif type == "remove" and isinstance(data, Rigid):
+                if data in self._results:
+                    del self._results[data]
+                    del self._configurations[data]
+                if data in self._ranked:
+                    del self._ranked[data]
         else:
             raise Exception("message from unknown source"+str((object, message)))
 
     # internal methods
 
+    def _drop_numeric(self):
+        """remove the numeric merge, before structural changes"""
+        if self._numeric_rigid is not None:
+            if self.dr.contains(self._numeric_rigid):
+                configurations = self.dr.get(self._numeric_rigid)
+                if configurations:
+                    self._numeric_start = list(configurations)[0].map
+                self.dr.remove(self._numeric_rigid)
+            self._numeric_rigid = None
+
+    def _update_numeric(self):
+        """add a numeric merge, if enabled and needed"""
+        if self._numeric and self._numeric_rigid is None:
+            self._numeric_rigid = self.dr.merge_numeric(self._numeric_start)
+
     def _add_variable(self, var):
         if var not in self._map:
             rigid = Rigid([var])
@@ -422,33 +1090,41 @@ class GeometricSolver (Listener):
             self.dr.add(rig)
             # set configuration
             self._update_constraint(con)
+        elif isinstance(con, RigidConstraint):
+            # map to rigid, solved by the constraint itself
+            rig = Rigid(con.variables())
+            self._map[con] = rig
+            self._map[rig] = con
+            self.dr.add(rig)
+            # set configuration
+            self._update_constraint(con)
         elif isinstance(con, FixConstraint):
-            if self.fixcluster is not None:
-                self.dr.remove(self.fixcluster)
-            self.fixvars.append(self.get(con.variables()[0]))
-            if len(self.fixvars) >= self.problem.dimension:
-                self.fixcluster = Cluster(self.fixvars)
-                self.dr.add(self.fixcluster)
-                self.dr.set_root(fixcluster)
-            self._update_fix()
+            self.fixvars.append(con.variables()[0])
+            self._set_fixcluster()
         else:
             ## raise Exception, "unknown constraint type"
             pass
 
+    def _add_instance(self, template, mapping, copies):
+        """add the plan of a template for an instance, whose variables and
+           constraints have been added"""
+        solver = template.solver
+        clusters = {}
+        for var in template.problem.prototype:
+            if var in solver._map and mapping[var] in self._map:
+                clusters[solver._map[var]] = self._map[mapping[var]]
+        for (con, copy_) in copies.items():
+            if con in solver._map and copy_ in self._map:
+                clusters[solver._map[con]] = self._map[copy_]
+        self.dr.add_instance(solver.dr.plan(), clusters, mapping)
+
     def _rem_constraint(self, con):
         diag_print("GeometricSolver._rem_constraint","gcs")
         if isinstance(con,FixConstraint):
-            if self.fixcluster is not None:
-                self.dr.remove(self.fixcluster)
-            var = self.get(con.variables()[0])
+            var = con.variables()[0]
             if var in self.fixvars:
                 self.fixvars.remove(var)
-            if len(self.fixvars) < self.problem.dimension:
-                self.fixcluster = None
-            else:
-                self.fixcluster = Cluster(self.fixvars)
-                self.dr.add(self.fixcluster)
-                self.dr.set_root(self.fixcluster)
+            self._set_fixcluster()
         elif con in self._map:
             self.dr.remove(self._map[con])
             del self._map[con]
@@ -490,6 +1166,17 @@ class GeometricSolver (Listener):
             conf = Configuration({v0: p0, v1: p1})
             self.dr.set(rig, [conf])
             assert con.satisfied(conf.map)
+        elif isinstance(con, RigidConstraint):
+            # set configuration
+            rig = self._map[con]
+            map = {}
+            for (var, position) in zip(con.variables(), con.get_parameter()):
+                point = vector(position)
+                # pad vectors to right dimension
+                while len(point) < self.dimension:
+                    point.append(0.0)
+                map[var] = point
+            self.dr.set(rig, [Configuration(map)])
         elif isinstance(con, FixConstraint):
             self._update_fix()
         else:
@@ -501,17 +1188,48 @@ class GeometricSolver (Listener):
         conf = Configuration({variable:proto})
         self.dr.set(cluster, [conf])
 
+    def _set_fixcluster(self):
+        """replace the fix cluster, a rigid on the fixed points (if at least
+           two), which is the root cluster"""
+        if self.fixcluster is not None:
+            if self.dr.contains(self.fixcluster):
+                self.dr.remove(self.fixcluster)
+            self.fixcluster = None
+        if len(self.fixvars) >= 2:
+            self.fixcluster = Rigid(self.fixvars)
+            self.dr.add(self.fixcluster)
+            self.dr.set_root(self.fixcluster)
+        self._update_fix()
+
     def _update_fix(self):
-        if self.fixcluster:
-            vars = fixcluster.vars
-            map = {}
-            for var in vars:
-                map[var] = self.problem.get_fix(var).get_parameter()
-            conf = Configuration(map)
-            self.dr.set(fixcluster, [conf])
+        map = {}
+        for var in self.fixvars:
+            point = vector(self.problem.get_fix(var).get_parameter())
+            # pad vectors to right dimension
+            while len(point) < self.dimension:
+                point.append(0.0)
+            map[var] = point
+        if len(map) > 0:
+            self._fixconf = Configuration(map)
         else:
-            print("warning: no fixcluster to update")
-            pass
+            self._fixconf = None
+        # solutions are placed relative to the fixed points
+        self._configurations = {}
+        if self.fixcluster is not None:
+            self.dr.set(self.fixcluster, [self._fixconf])
+
+    def _absolute(self, drcluster, configuration):
+        """the configuration of a cluster in absolute coordinates, i.e. 
+           transformed onto the fixed points, if it contains all of them.
+           Two fixed points, or collinear ones, only fix the segment
+           between them; the rotation about it is arbitrary (see 
+           Configuration.merge_transform)."""
+        fixed = self._fixconf
+        if fixed is None or not drcluster.vars.issuperset(self.fixvars):
+            return configuration
+        absolute = configuration.transform(fixed.merge_transform(configuration))
+        absolute.underconstrained = configuration.underconstrained
+        return absolute
 
 # class GeometricSolver
 
@@ -538,6 +1256,11 @@ class GeometricCluster:
                               S_OVER                structural overconstrained 
                               S_UNDER               structural underconstrained
                               UNSOLVED              unsolved
+            incomplete      - True iff solving was stopped before the 
+                              decomposition was complete (see GeometricSolver.set_budget)
+            residual        - the largest constraint residual after numeric 
+                              refinement, or None if not refined 
+                              (see GeometricSolver.set_refinement)
        """
 
     OK = "well constrained"
@@ -553,6 +1276,8 @@ class GeometricCluster:
         self.solutions = []
         self.subs = []
         self.flag = GeometricCluster.OK
+        self.incomplete = False
+        self.residual = None
 
     def __str__(self):
         return self._str_recursive()
@@ -565,7 +1290,7 @@ class GeometricCluster:
 
         # make done
         if done is None:
-            done = Set()
+            done = set()
 
         # recurse
         s = ""
@@ -585,6 +1310,155 @@ class GeometricCluster:
     # def
 
 
+class LazyGeometricCluster:
+    """A GeometricCluster that determines its solutions, flag and 
+       subclusters from the solver only when they are accessed. 
+       Returned by GeometricSolver.get_result(lazy=True), it reflects the
+       state of the solver when attributes are accessed, so it should not
+       be kept after the problem changes.
+       
+       instance attributes:
+            variables       - a list of point variable names
+            solutions       - an iterable over solutions, see LazySolutions;
+                              a list if the solutions are refined
+            subs            - a list of sub-clusters (LazyGeometricCluster)
+            flag            - see GeometricCluster
+            incomplete      - see GeometricCluster
+            residual        - see GeometricCluster; solutions of 
+                              over-constrained clusters are refined when
+                              solutions or residual are first accessed
+    """
+
+    def __init__(self, solver, drcluster, clusters):
+        self._solver = solver
+        self._drcluster = drcluster
+        self._clusters = clusters
+        self._subs = None
+        self._flag = None
+        self._refined = None
+        if drcluster is None:
+            self.variables = []
+            self._subs = []
+        else:
+            self.variables = list(drcluster.vars)
+        self.incomplete = False
+
+    def _get_solutions(self):
+        if self._drcluster is None:
+            return LazySolutions(None, None, [])
+        if self._refine() is not None:
+            return self._refined[0]
+        return self._lazy_solutions()
+
+    solutions = property(_get_solutions)
+
+    def _get_residual(self):
+        if self._drcluster is None or self._refine() is None:
+            return None
+        return self._refined[1]
+
+    residual = property(_get_residual)
+
+    def _lazy_solutions(self):
+        configurations = self._solver.dr.get(self._drcluster)
+        if configurations is None:
+            configurations = []
+        return LazySolutions(self._solver._rank, self._drcluster, 
+                             configurations, self._solver._absolute)
+
+    def _refine(self):
+        """refine the solutions like GeometricSolver.get_result does, the
+           first time; returns the refined (solutions, residual), or None
+           if the cluster is not refined"""
+        if self._refined is None:
+            self._refined = False
+            if self._solver._refine and self.flag in (
+                    GeometricCluster.S_OVER, GeometricCluster.I_OVER):
+                self._refined = self._solver._refine_solutions(
+                    self._drcluster, list(self._lazy_solutions()))
+        if self._refined is False:
+            return None
+        return self._refined
+
+    def _get_flag(self):
+        if self._flag is None:
+            drcluster = self._drcluster
+            configurations = self._solver.dr.get(drcluster)
+            if drcluster.overconstrained:
+                self._flag = GeometricCluster.S_OVER
+            elif (configurations is None or len(configurations) == 0) \
+                    and self._solver._unsolved(drcluster):
+                self._flag = GeometricCluster.UNSOLVED
+            elif configurations is None or len(configurations) == 0:
+                self._flag = GeometricCluster.I_OVER
+            elif True in [c.underconstrained for c in configurations]:
+                self._flag = GeometricCluster.I_UNDER
+            else:
+                self._flag = GeometricCluster.OK
+        return self._flag
+
+    def _set_flag(self, flag):
+        self._flag = flag
+
+    flag = property(_get_flag, _set_flag)
+
+    def _get_subs(self):
+        if self._subs is None:
+            self._subs = [self._cluster(c) for c in 
+                          self._solver._determine_subs(self._drcluster)]
+        return self._subs
+
+    def _set_subs(self, subs):
+        self._subs = subs
+
+    subs = property(_get_subs, _set_subs)
+
+    def _cluster(self, drcluster):
+        if drcluster not in self._clusters:
+            self._clusters[drcluster] = LazyGeometricCluster(
+                self._solver, drcluster, self._clusters)
+        return self._clusters[drcluster]
+
+    def __str__(self):
+        return GeometricCluster._str_recursive(self)
+
+    def _str_recursive(self, depth=0, done=None):
+        return GeometricCluster._str_recursive(self, depth, done)
+
+
+class LazySolutions:
+    """The solutions of a LazyGeometricCluster. Solutions (dictionaries 
+       mapping variables to points) are produced one at a time when 
+       iterating, best first if the solver ranks solutions. Supports len
+       and indexing."""
+
+    def __init__(self, rank, drcluster, configurations, absolute=None):
+        self._rank = rank
+        self._drcluster = drcluster
+        self._configurations = configurations
+        self._absolute = absolute
+
+    def __iter__(self):
+        configurations = self._configurations
+        if self._rank is not None and len(configurations) > 1:
+            configurations = sorted(configurations, 
+                key=lambda c: self._rank(self._drcluster, c))
+        for configuration in configurations:
+            if self._absolute is not None:
+                configuration = self._absolute(self._drcluster, configuration)
+            yield configuration.map
+
+    def __len__(self):
+        return len(self._configurations)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        for solution in itertools.islice(iter(self), index, None):
+            return solution
+        raise IndexError("solution index out of range")
+
+
 # --------------------- constraint types --------------------
 
 
@@ -610,7 +1484,7 @@ class FixConstraint(ParametricConstraint):
     """A constraint to fix a point relative to the coordinate system"""
 
     def __init__(self, var, pos):
-        """Create a new DistanceConstraint instance
+        """Create a new FixConstraint instance
         
            keyword args:
             var    - a point variable name 
@@ -624,7 +1498,9 @@ class FixConstraint(ParametricConstraint):
         """return True iff mapping from variable names to
         points satisfies constraint"""
         a = mapping[self._variables[0]]
-        result = tol_eq(a[0], self._value[0]) and tol_eq(a[1], self.value[1])
+        result = True
+        for i in range(len(self._value)):
+            result = result and tol_eq(a[i], self._value[i])
         return result
 
     def __str__(self):
@@ -663,6 +1539,83 @@ class DistanceConstraint(ParametricConstraint):
             +str(self._value)+")"
 
 
+def _volume(points):
+    """the volume of the simplex spanned by two, three or four points; 
+       signed (i.e. the orientation) when the points span the space"""
+    u = points[1] - points[0]
+    if len(points) == 2:
+        return norm(u)
+    v = points[2] - points[0]
+    if len(u) == 2:
+        return u[0] * v[1] - u[1] * v[0]
+    if len(points) == 3:
+        return norm(cross(u, v))
+    return dot(cross(u, v), points[3] - points[0])
+
+
+def _spanning_simplex(points):
+    """indices of dimension+1 points that span the space, or None if 
+       the points are collinear (2D) or coplanar (3D)"""
+    simplex = [0]
+    for k in range(len(points[0])):
+        best = max(range(len(points)), key=lambda i:
+                   abs(_volume([points[j] for j in simplex] + [points[i]])))
+        if tol_eq(_volume([points[j] for j in simplex] + [points[best]]), 0.0):
+            return None
+        simplex.append(best)
+    return simplex
+
+
+class RigidConstraint(ParametricConstraint):
+    """A constraint on the relative positions of a set of points, given 
+       by their coordinates in any coordinate system, i.e. the points form
+       a rigid body. It is solved as a single rigid cluster, instead of 
+       by merging distances between the points."""
+
+    def __init__(self, points, coordinates):
+        """Create a new RigidConstraint instance
+        
+           keyword args:
+            points      - a list of point variable names
+            coordinates - a list of positions (vectors), one for each 
+                          point; the parameter value
+        """
+        ParametricConstraint.__init__(self)
+        self._variables = list(points)
+        if len(coordinates) != len(self._variables):
+            raise Exception("need a position for each point")
+        self.set_parameter(list(coordinates))
+
+    def satisfied(self, mapping):
+        """return True iff mapping from variable names to points
+        satisfies constraint, i.e. the points can be mapped onto the 
+        coordinates by a rigid transformation: all distances between the 
+        points are as given and, if the points span the space, they are 
+        not mirrored"""
+        points = [vector(mapping[var]) for var in self._variables]
+        reference = []
+        for position in self._value:
+            position = vector(position)
+            while len(position) < len(points[0]):
+                position.append(0.0)
+            reference.append(position)
+        for i in range(len(points)):
+            for j in range(i):
+                if not tol_eq(distance_2p(points[i], points[j]),
+                              distance_2p(reference[i], reference[j])):
+                    return False
+        simplex = _spanning_simplex(reference)
+        if simplex is None:
+            return True
+        volume = _volume([points[i] for i in simplex])
+        return (volume > 0) == (_volume([reference[i] for i in simplex]) > 0)
+
+    def __str__(self):
+        return "RigidConstraint("\
+            +str(self._variables)+","\
+            +str(self._value)+")"
+
+
 class AngleConstraint(ParametricConstraint):
     """A constraint on the angle in point B of a triangle ABC"""
 
@@ -696,7 +1649,8 @@ class AngleConstraint(ParametricConstraint):
                 cmp = self._value
             result = tol_eq(ang, cmp)
         if result is False:
-            diag_print("measured angle = "+str(ang)+",parameter value = "+str(cmp), "geometric")
+            diag_print("measured angle = %s,parameter value = %s", "geometric",
+                       ang, cmp)
         return result
 
     def __str__(self):
@@ -56,6 +56,8 @@ class Graph (Notifier):
         """the edges are stored in a dictionary of dictionaries"""
         self._reverse = {}
         """the reverse graph is stored here"""
+        self._shared = set()
+        """vertices whose edge dictionaries are shared with a fork"""
         # copy input graph
         if graph:
             for v in graph.vertices():
@@ -65,12 +67,32 @@ class Graph (Notifier):
                 self.set(v,w,graph.get(v,w))
         #end __init__
 
+    def fork(self):
+        """Return a copy of the graph (a Graph). The edge dictionaries of 
+           each vertex are shared, until either graph changes them 
+           (copy-on-write), so forking takes time linear in the number of
+           vertices only."""
+        g = Graph()
+        g._dict = dict(self._dict)
+        g._reverse = dict(self._reverse)
+        g._shared = set(self._dict)
+        self._shared = set(self._dict)
+        return g
+
+    def _own(self, v):
+        """copy the edge dictionaries of v, if shared with a fork"""
+        if self._shared and v in self._shared:
+            self._dict[v] = dict(self._dict[v])
+            self._reverse[v] = dict(self._reverse[v])
+            self._shared.remove(v)
+
     def add_vertex(self, v):
         "Add vertex to graph if not already."
         if v not in self._dict:
             self._dict[v] = {}
             self._reverse[v] = {}
-            self.send_notify(("add_vertex",v))
+            if self.observed:
+                self.send_notify(("add_vertex",v))
 
     def add_edge(self, v1, v2, value=1):
         "Add edge from v1 to v2 with optional value."
@@ -81,11 +103,14 @@ class Graph (Notifier):
             self.add_vertex(v2);
         # add edge if not yet in graph
         if v2 not in self._dict[v1]:
+            self._own(v1)
             self._dict[v1][v2] = value
         # and the reverse edge in the reverse
         if v1 not in self._reverse[v2]:
+            self._own(v2)
             self._reverse[v2][v1] = value
-            self.send_notify(("add_edge",(v1,v2,value)))
+            if self.observed:
+                self.send_notify(("add_edge",(v1,v2,value)))
 
     def add_bi(self, v1, v2, value=1):
         "Add edges bi-directinally with optional value."
@@ -103,29 +128,42 @@ class Graph (Notifier):
     def rem_vertex(self, v):
         "Remove vertex and incident edges."
         if v in self._dict:
-            # remove edges going to vertex
-            for u in self.ingoing_vertices(v):
-                self.rem_edge(u, v)
-            # remove edges going from vertex
-            for w in self.outgoing_vertices(v):
-                self.rem_edge(v, w)
-            # remove vertex (and edges going from vertex)
-            del self._dict[v]
-            # and in the reverse
-            del self._reverse[v]
-            # notify
-            self.send_notify(("rem_vertex", v))
+            # deliver the removed edges and vertex in one batch
+            batch = self.observed
+            if batch:
+                self.begin_notify_batch()
+            try:
+                # remove edges going to vertex
+                for u in self.ingoing_vertices(v):
+                    self.rem_edge(u, v)
+                # remove edges going from vertex
+                for w in self.outgoing_vertices(v):
+                    self.rem_edge(v, w)
+                # remove vertex (and edges going from vertex)
+                del self._dict[v]
+                # and in the reverse
+                del self._reverse[v]
+                self._shared.discard(v)
+                # notify
+                if self.observed:
+                    self.send_notify(("rem_vertex", v))
+            finally:
+                if batch:
+                    self.end_notify_batch()
         else:
             raise Exception("vertex not in graph")
 
     def rem_edge(self, v1, v2):
         "Remove edge."
         if self.has_edge(v1,v2):
+            self._own(v1)
+            self._own(v2)
             del self._dict[v1][v2]
             # remove from reverse
             del self._reverse[v2][v1]
             # notify
-            self.send_notify(("rem_edge",(v1,v2)))
+            if self.observed:
+                self.send_notify(("rem_edge",(v1,v2)))
         else:
             raise Exception("edge not in graph")
 
@@ -162,9 +200,12 @@ class Graph (Notifier):
         if not self.has_edge(v1,v2):
             self.add_edge(v1,v2,value)
         else:
+            self._own(v1)
+            self._own(v2)
             self._dict[v1][v2] = value
             self._reverse[v2][v1] = value
-            self.send_notify(("set",(v1,v2,value)))
+            if self.observed:
+                self.send_notify(("set",(v1,v2,value)))
 
     def set_bi(self, v1, v2, value):
         "Set value of edges (v1,v2) and (v2,v1)."
@@ -202,11 +243,11 @@ class Graph (Notifier):
     def ingoing_vertices(self,vertex):
         """return list of vertices from which edge goes to given vertex"""
         # this is where keeping reverse graph pays off (also used in remove)
-        return self._reverse[vertex].keys()
+        return list(self._reverse[vertex].keys())
 
     def outgoing_vertices(self, vertex):
         """return list of vertices to which edge goes from given vertex"""
-        return self._dict[vertex].keys()
+        return list(self._dict[vertex].keys())
 
     def adjacent_vertices(self, v):
         """list of adjacent (ingoing or outgoing) vertices"""
@@ -472,6 +513,7 @@ class FanGraph(Graph):
         """map from fan-in numbers to vertices with that fan-in"""
         self._outfan = {}
         """map from fan-out numbers to vertices with that fan-out"""
+        self._shared = set()
         # copy input graph
         if graph:
             for v in graph.vertices():
@@ -480,6 +522,10 @@ class FanGraph(Graph):
                 (v,w) = e
                 self.set(v,w,graph.get(v,w))
 
+    def fork(self):
+        "Return a copy of the graph (a FanGraph, without sharing)."
+        return FanGraph(self)
+
     def add_vertex(self, v):
         "Add vertex to graph if not already."
         if v not in self._dict:
@@ -487,7 +533,8 @@ class FanGraph(Graph):
             self._reverse[v] = {}
             self._set_fanin(v, 0)
             self._set_fanout(v, 0)
-            self.send_notify(("add_vertex",v))
+            if self.observed:
+                self.send_notify(("add_vertex",v))
 
     def add_edge(self, v1, v2, value=1):
         "Add edge from v1 to v2 with optional value."
@@ -507,26 +554,36 @@ class FanGraph(Graph):
             # increment fan-in for v2
             self._set_fanin(v2, self._fanin[v2]+1)
             # notify
-            self.send_notify(("add_edge",(v1,v2,value)))
+            if self.observed:
+                self.send_notify(("add_edge",(v1,v2,value)))
 
     def rem_vertex(self, v):
         "Remove vertex and incident edges."
         if v in self._dict:
-            # remove edges going to vertex
-            for u in self.ingoing_vertices(v):
-                self.rem_edge(u, v)
-            # remove edges going from vertex
-            for w in self.outgoing_vertices(v):
-                self.rem_edge(v,w)
-            # remove entries from fan-in and fan-out tables
-            self._set_fanin(v, None)
-            self._set_fanout(v, None)
-            # remove vertex (and edges going from vertex)
-            del self._dict[v]
-            # and in the reverse
-            del self._reverse[v]
-            # notify
-            self.send_notify(("rem_vertex", v))
+            # deliver the removed edges and vertex in one batch
+            batch = self.observed
+            if batch:
+                self.begin_notify_batch()
+            try:
+                # remove edges going to vertex
+                for u in self.ingoing_vertices(v):
+                    self.rem_edge(u, v)
+                # remove edges going from vertex
+                for w in self.outgoing_vertices(v):
+                    self.rem_edge(v,w)
+                # remove entries from fan-in and fan-out tables
+                self._set_fanin(v, None)
+                self._set_fanout(v, None)
+                # remove vertex (and edges going from vertex)
+                del self._dict[v]
+                # and in the reverse
+                del self._reverse[v]
+                # notify
+                if self.observed:
+                    self.send_notify(("rem_vertex", v))
+            finally:
+                if batch:
+                    self.end_notify_batch()
         else:
             raise Exception("vertex not in graph")
 
@@ -541,7 +598,8 @@ class FanGraph(Graph):
             # decrement fan-in for v2
             self._set_fanin(v2, self._fanin[v2]-1)
             # notify
-            self.send_notify(("rem_edge",(v1,v2)))
+            if self.observed:
+                self.send_notify(("rem_edge",(v1,v2)))
         else:
             raise Exception("edge not in graph")
 
@@ -42,9 +42,12 @@ def sss_int(p1, r1, p2, r2, p3, r3):
     # py = project p3 on px,nx
     dy3 = dot(p3-px, nx)
     py = p3 - (nx * dy3)
-    if tol_gt(dy3, r3):
+    if tol_gt(abs(dy3), r3):
         return []
-    ry = math.sin(math.acos(abs(dy3/r3)))*r3
+    elif abs(dy3) >= r3:
+        ry = 0.0
+    else:
+        ry = math.sin(math.acos(abs(dy3/r3)))*r3
     # print "py,ry:",py,ry
     cpx = vector([0.0,0.0])
     cpy = vector([norm(py-px), 0.0])
@@ -81,13 +84,6 @@ def cc_int(p1, r1, p2, r2):
             p3b = p1+vector([p1[1]-p2[1], p2[0]-p1[0]])*r1/d
             return [p3a, p3b]
     else:
-        print("***")
-        print(p1)
-        print(s)
-        print(vector([s[1], -s[0]]))
-        print(v)
-        print(norm(s))
-        print("***")
         p3a = p1 + s + vector([s[1], -s[0]]) * v / norm(s)
         if tol_eq(v / norm(s), 0):
             return [p3a]
@@ -140,8 +136,7 @@ def ll_int(p1, v1, p2, v2):
     """Intersect line though p1 direction v1 with line through p2 direction v2.
        Returns a list of zero or one solutions
     """
-    diag_print("ll_int " + str(p1) + str(v1) + str(p2) + str(v2),
-               "intersections")
+    diag_print("ll_int %s%s%s%s", "intersections", p1, v1, p2, v2)
     if tol_eq((v1[0] * v2[1]) - (v1[1] * v2[0]), 0):
         return []
     elif not tol_eq(v2[1], 0.0):
@@ -159,8 +154,7 @@ def lr_int(p1, v1, p2, v2):
     """Intersect line though p1 direction v1 with ray through p2 direction v2.
        Returns a list of zero or one solutions
     """
-    diag_print("lr_int " + str(p1) + str(v1) + str(p2) + str(v2),
-               "intersections")
+    diag_print("lr_int %s%s%s%s", "intersections", p1, v1, p2, v2)
     s = ll_int(p1, v1, p2, v2)
     if len(s) > 0 and tol_gte(dot(s[0] - p2, v2), 0):
         return s
@@ -172,8 +166,7 @@ def rr_int(p1, v1, p2, v2):
     """Intersect ray though p1 direction v1 with ray through p2 direction v2.
        Returns a list of zero or one solutions
     """
-    diag_print("rr_int " + str(p1) + str(v1) + str(p2) + str(v2),
-               "intersections")
+    diag_print("rr_int %s%s%s%s", "intersections", p1, v1, p2, v2)
     s = ll_int(p1, v1, p2, v2)
     if len(s) > 0 and tol_gte(dot(s[0] - p2, v2), 0) and tol_gte(
             dot(s[0] - p1, v1), 0):
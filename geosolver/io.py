@@ -0,0 +1,420 @@
+"""Reading and writing GeometricProblems and their solutions.
+
+Problems are stored with their dimension, points (prototypes), distance,
+angle, rigid, fix and selection constraints, and optionally a list of
+solutions. Two variants of the format are supported, both versioned (see
+VERSION):
+
+ - JSON: one problem per line (JSON Lines), for interchange. Each line is
+   a JSON object with keys "format", "version", "dimension", "points"
+   (a list of [variable, coordinates] pairs), "constraints" and optionally
+   "solutions" (a list of lists of coordinates, in the order of points).
+
+ - binary: a magic header followed by blocks, each an 8-byte little-endian
+   length and a compressed NumPy .npz archive that holds a block of
+   problems in columnar arrays, for bulk data. Requires numpy. Rigid
+   constraints are not supported in this variant.
+
+Both variants are read and written as streams, so any number of problems
+can be processed without holding them in memory.
+
+Variables may be any JSON-serializable value (recommend strings).
+Selection constraints are stored by class name, and FunctionConstraints by
+the name of their function, which must be defined in
+geosolver.intersections (possibly negated with fnot).
+
+Example:
+
+    with open("problems.jsonl", "w") as stream:
+        write_json(stream, [problem, (problem2, solutions)])
+    with open("problems.jsonl") as stream:
+        for (problem, solutions) in read_json(stream):
+            ...
+"""
+
+import json
+import struct
+from io import BytesIO
+
+import geosolver.intersections as intersections
+import geosolver.selconstr as selconstr
+from geosolver.geometric import GeometricProblem, DistanceConstraint, \
+    AngleConstraint, FixConstraint, RigidConstraint
+from geosolver.selconstr import SelectionConstraint, FunctionConstraint, fnot
+from geosolver.vector import vector
+
+FORMAT = "geosolver"
+VERSION = 1
+
+# header of the binary variant
+MAGIC = b"GEOSOLVR"
+
+# constraint type codes in the binary variant
+_types = ["distance", "angle", "fix", "selection", "function"]
+
+
+# ----- records -----
+
+def problem_to_dict(problem, solutions=None):
+    """Return a dictionary (as stored in the JSON variant) representing a
+       GeometricProblem and optionally a list of solutions, each a
+       dictionary mapping variables to points."""
+    variables = list(problem.prototype)
+    data = {"format": FORMAT,
+            "version": VERSION,
+            "dimension": problem.dimension,
+            "points": [[v, _coordinates(problem.get_point(v))]
+                       for v in variables],
+            "constraints": [constraint_to_dict(con)
+                            for con in problem.cg.constraints()]}
+    if solutions is not None:
+        data["solutions"] = [[_coordinates(solution[v]) for v in variables]
+                             for solution in solutions]
+    return data
+
+
+def problem_from_dict(data):
+    """Return a tuple (problem, solutions) from a dictionary created by
+       problem_to_dict. Solutions is None if none were stored."""
+    _check_version(data.get("format"), data.get("version"))
+    problem = GeometricProblem(dimension=data["dimension"])
+    variables = []
+    for (var, position) in data["points"]:
+        var = variable_from_json(var)
+        problem.add_point(var, vector(position))
+        variables.append(var)
+    for con in data["constraints"]:
+        problem.add_constraint(constraint_from_dict(con))
+    solutions = None
+    if "solutions" in data:
+        solutions = [_solution(variables, positions)
+                     for positions in data["solutions"]]
+    return (problem, solutions)
+
+
+def constraint_to_dict(con):
+    """Return a dictionary representing a constraint"""
+    variables = list(con.variables())
+    if isinstance(con, DistanceConstraint):
+        return {"type": "distance", "variables": variables,
+                "value": float(con.get_parameter())}
+    elif isinstance(con, AngleConstraint):
+        return {"type": "angle", "variables": variables,
+                "value": float(con.get_parameter())}
+    elif isinstance(con, FixConstraint):
+        return {"type": "fix", "variables": variables,
+                "value": _coordinates(con.get_parameter())}
+    elif isinstance(con, RigidConstraint):
+        return {"type": "rigid", "variables": variables,
+                "value": [_coordinates(p) for p in con.get_parameter()]}
+    elif isinstance(con, FunctionConstraint):
+        (name, negated) = _function_name(con._function)
+        return {"type": "function", "variables": variables,
+                "function": name, "negated": negated}
+    elif isinstance(con, SelectionConstraint):
+        return {"type": "selection", "variables": variables,
+                "class": con.__class__.__name__}
+    else:
+        raise Exception("unsupported constraint type " + str(con))
+
+
+def constraint_from_dict(data):
+    """Return a constraint from a dictionary created by constraint_to_dict"""
+    type_ = data["type"]
+    variables = [variable_from_json(v) for v in data["variables"]]
+    if type_ == "distance":
+        return DistanceConstraint(variables[0], variables[1], data["value"])
+    elif type_ == "angle":
+        return AngleConstraint(variables[0], variables[1], variables[2],
+                               data["value"])
+    elif type_ == "fix":
+        return FixConstraint(variables[0], vector(data["value"]))
+    elif type_ == "rigid":
+        return RigidConstraint(variables,
+                               [vector(p) for p in data["value"]])
+    elif type_ == "function":
+        return FunctionConstraint(
+            _function(data["function"], data.get("negated", False)),
+            variables)
+    elif type_ == "selection":
+        return _selection_class(data["class"])(*variables)
+    else:
+        raise Exception("unknown constraint type " + str(type_))
+
+
+def _function_name(function):
+    """name of a function in intersections, and whether it was negated"""
+    negated = hasattr(function, "negated")
+    if negated:
+        function = function.negated
+    if getattr(intersections, function.__name__, None) is not function:
+        raise Exception("function not in geosolver.intersections: "
+                        + function.__name__)
+    return (function.__name__, negated)
+
+
+def _function(name, negated):
+    function = getattr(intersections, name, None)
+    if not callable(function):
+        raise Exception("function not in geosolver.intersections: " + name)
+    if negated:
+        function = fnot(function)
+    return function
+
+
+def _selection_class(name):
+    cls = getattr(selconstr, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, SelectionConstraint)) \
+            or cls is FunctionConstraint:
+        raise Exception("unknown selection constraint " + name)
+    return cls
+
+
+def _check_version(format_, version):
+    if format_ != FORMAT:
+        raise Exception("not a geosolver problem")
+    if not isinstance(version, int) or version > VERSION:
+        raise Exception("unsupported version " + str(version))
+
+
+def _coordinates(point):
+    return [float(x) for x in point]
+
+
+def variable_from_json(var):
+    """Return a variable decoded from JSON, with lists converted to tuples
+       (JSON has no tuples, and variables must be hashable)"""
+    if isinstance(var, list):
+        return tuple(variable_from_json(v) for v in var)
+    return var
+
+
+def _solution(variables, positions):
+    solution = {}
+    for i in range(len(variables)):
+        solution[variables[i]] = vector(positions[i])
+    return solution
+
+
+def _records(records):
+    """(problem, solutions) for each record, a problem or such a tuple"""
+    for record in records:
+        if isinstance(record, GeometricProblem):
+            yield (record, None)
+        else:
+            yield record
+
+
+# ----- JSON -----
+
+def write_json(stream, records):
+    """Write problems to a text stream, one JSON object per line. Each
+       record is a GeometricProblem, or a tuple (problem, solutions)."""
+    for (problem, solutions) in _records(records):
+        stream.write(json.dumps(problem_to_dict(problem, solutions),
+                                separators=(",", ":")))
+        stream.write("\n")
+
+
+def read_json(stream):
+    """Generate a tuple (problem, solutions) for each line of a text
+       stream written by write_json. Blank lines are skipped."""
+    for line in stream:
+        if line.strip():
+            yield problem_from_dict(json.loads(line))
+
+
+# ----- binary -----
+
+def write_binary(stream, records, block_size=1024):
+    """Write problems to a binary stream, in blocks of at most block_size
+       problems. Each record is a GeometricProblem, or a tuple
+       (problem, solutions). Requires numpy."""
+    stream.write(MAGIC)
+    block = []
+    for record in _records(records):
+        block.append(record)
+        if len(block) >= block_size:
+            _write_block(stream, block)
+            block = []
+    if len(block) > 0:
+        _write_block(stream, block)
+
+
+def read_binary(stream):
+    """Generate a tuple (problem, solutions) for each problem in a binary
+       stream written by write_binary. Requires numpy."""
+    if stream.read(len(MAGIC)) != MAGIC:
+        raise Exception("not a geosolver binary stream")
+    while True:
+        header = stream.read(8)
+        if len(header) == 0:
+            break
+        if len(header) != 8:
+            raise Exception("truncated geosolver binary stream")
+        (size,) = struct.unpack("<Q", header)
+        data = stream.read(size)
+        if len(data) != size:
+            raise Exception("truncated geosolver binary stream")
+        for record in _read_block(BytesIO(data)):
+            yield record
+
+
+def _write_block(stream, block):
+    import numpy
+    dimensions = []
+    point_counts = []
+    names = []
+    points = []
+    constraint_counts = []
+    types = []
+    constraint_names = []
+    variable_counts = []
+    constraint_variables = []
+    values = []
+    solution_counts = []
+    solution_points = []
+    for (problem, solutions) in block:
+        data = problem_to_dict(problem, solutions)
+        index = {}
+        dimensions.append(data["dimension"])
+        point_counts.append(len(data["points"]))
+        for (var, position) in data["points"]:
+            index[json.dumps(var)] = len(index)
+            names.append(json.dumps(var))
+            points.append(_padded(position))
+        constraint_counts.append(len(data["constraints"]))
+        for con in data["constraints"]:
+            if con["type"] not in _types:
+                raise Exception("constraint type " + con["type"]
+                                + " not supported in the binary format")
+            types.append(_types.index(con["type"]))
+            variable_counts.append(len(con["variables"]))
+            constraint_variables += [index[json.dumps(v)]
+                                     for v in con["variables"]]
+            value = con.get("value", 0.0)
+            if not isinstance(value, list):
+                value = [value]
+            values.append(_padded(value))
+            if con["type"] == "function":
+                name = con["function"]
+                if con["negated"]:
+                    name = "!" + name
+            else:
+                name = con.get("class", "")
+            constraint_names.append(name)
+        # -1 if no solutions were stored, to tell None from []
+        solutions = data.get("solutions")
+        if solutions is None:
+            solution_counts.append(-1)
+            solutions = []
+        else:
+            solution_counts.append(len(solutions))
+        for positions in solutions:
+            solution_points += [_padded(p) for p in positions]
+    buffer = BytesIO()
+    numpy.savez_compressed(
+        buffer,
+        version=numpy.array([VERSION]),
+        dimensions=numpy.array(dimensions, dtype=numpy.int8),
+        point_counts=numpy.array(point_counts, dtype=numpy.int64),
+        names=numpy.array(names, dtype=str),
+        points=numpy.array(points, dtype=float).reshape(-1, 3),
+        constraint_counts=numpy.array(constraint_counts, dtype=numpy.int64),
+        types=numpy.array(types, dtype=numpy.int8),
+        constraint_names=numpy.array(constraint_names, dtype=str),
+        variable_counts=numpy.array(variable_counts, dtype=numpy.int64),
+        variables=numpy.array(constraint_variables, dtype=numpy.int64),
+        values=numpy.array(values, dtype=float).reshape(-1, 3),
+        solution_counts=numpy.array(solution_counts, dtype=numpy.int64),
+        solutions=numpy.array(solution_points, dtype=float).reshape(-1, 3))
+    data = buffer.getvalue()
+    stream.write(struct.pack("<Q", len(data)))
+    stream.write(data)
+
+
+def _read_block(buffer):
+    import numpy
+    arrays = numpy.load(buffer)
+    _check_version(FORMAT, int(arrays["version"][0]))
+    dimensions = arrays["dimensions"].tolist()
+    point_counts = arrays["point_counts"].tolist()
+    names = arrays["names"].tolist()
+    points = arrays["points"].tolist()
+    constraint_counts = arrays["constraint_counts"].tolist()
+    types = arrays["types"].tolist()
+    constraint_names = arrays["constraint_names"].tolist()
+    variable_counts = arrays["variable_counts"].tolist()
+    variables = arrays["variables"].tolist()
+    values = arrays["values"].tolist()
+    solution_counts = arrays["solution_counts"].tolist()
+    solution_points = arrays["solutions"].tolist()
+    (ip, ic, iv, isol) = (0, 0, 0, 0)
+    for k in range(len(dimensions)):
+        dim = dimensions[k]
+        n = point_counts[k]
+        pnames = [json.loads(name) for name in names[ip:ip + n]]
+        data = {"format": FORMAT, "version": VERSION, "dimension": dim,
+                "points": [[pnames[i], points[ip + i][:dim]]
+                           for i in range(n)],
+                "constraints": []}
+        ip += n
+        for j in range(ic, ic + constraint_counts[k]):
+            type_ = _types[types[j]]
+            con = {"type": type_,
+                   "variables": [pnames[i] for i in
+                                 variables[iv:iv + variable_counts[j]]]}
+            iv += variable_counts[j]
+            if type_ == "fix":
+                con["value"] = values[j][:dim]
+            elif type_ in ("distance", "angle"):
+                con["value"] = values[j][0]
+            elif type_ == "function":
+                name = constraint_names[j]
+                con["negated"] = name.startswith("!")
+                con["function"] = name.lstrip("!")
+            else:
+                con["class"] = constraint_names[j]
+            data["constraints"].append(con)
+        ic += constraint_counts[k]
+        if solution_counts[k] >= 0:
+            data["solutions"] = []
+            for s in range(solution_counts[k]):
+                data["solutions"].append(
+                    [p[:dim] for p in solution_points[isol:isol + n]])
+                isol += n
+        yield problem_from_dict(data)
+
+
+def _padded(position):
+    return list(position) + [0.0] * (3 - len(position))
+
+
+# ----- files -----
+
+def save(filename, records):
+    """Write problems to a file; JSON if the file name ends with .json or
+       .jsonl, else binary."""
+    if _is_json(filename):
+        with open(filename, "w") as stream:
+            write_json(stream, records)
+    else:
+        with open(filename, "wb") as stream:
+            write_binary(stream, records)
+
+
+def load(filename):
+    """Generate a tuple (problem, solutions) for each problem in a file
+       written by save."""
+    if _is_json(filename):
+        with open(filename) as stream:
+            for record in read_json(stream):
+                yield record
+    else:
+        with open(filename, "rb") as stream:
+            for record in read_binary(stream):
+                yield record
+
+
+def _is_json(filename):
+    return filename.endswith(".json") or filename.endswith(".jsonl")
@@ -56,8 +56,8 @@ class Table(list):
         return self.__class__(list.__getslice__(self, i, j))
 
     def __init__(self, elems):
-        list.__init__(self, elems)
         elems = list(elems)
+        list.__init__(self, elems)
         if len(elems) and hasattr(elems[0], 'dim'):
             self.dim = elems[0].dim + 1
         self.makehash()   # Rick van der Meiden 25-1-2007
@@ -395,7 +395,7 @@ def matrix_factory(elems):
     r"""Factory function to create a new matrix.
     
     """
-    # elems = list(elems)
+    elems = list(elems)
     logger.debug("matrix_factory() got : %s" % str(elems))
 
     m, n = len(elems), len(elems[0])
@@ -47,6 +47,10 @@ class ValidityError(Exception):
     def __str__(self):
         return "ValidityError: " + self._message
 
+
+class Cancelled(Exception):
+    """Error indicating propagation or solving was cancelled"""
+
 # ----------- class Method -----------
 
 class Method:
@@ -123,6 +127,12 @@ class MethodGraph:
         """A graph for fast navigation"""
         self._changed = {}
         """Set of changed variables since last propagation"""
+        self._pending = {}
+        """Set of methods added without propagation, not executed yet"""
+        self._cancel = None
+        """Event checked for cancellation during propagation, or None"""
+        self._attributes = {}
+        """Map from methods to attributes set before executing them"""
 
     def variables(self):
         """return a list of variables"""
@@ -201,15 +211,60 @@ class MethodGraph:
         if prop:
             self._execute(met)
             self.propagate()
+        else:
+            self._pending[met] = 1
 
     def rem_method(self, met):
         """Remove a method"""
         if met in self._methods:
             del self._methods[met]
+            if met in self._pending:
+                del self._pending[met]
+            if met in self._attributes:
+                del self._attributes[met]
             self._graph.rem_vertex(met)
         else:
             raise Exception("method not in graph")
 
+    def fork(self):
+        """Return a copy of the method graph. Variables and methods
+           (and values) are shared with the copy, but adding or removing
+           variables, methods and values in either graph does not affect
+           the other. The structure is copied-on-write (see Graph.fork)."""
+        mg = MethodGraph()
+        mg._map = dict(self._map)
+        mg._methods = dict(self._methods)
+        mg._graph = self._graph.fork()
+        mg._changed = dict(self._changed)
+        mg._pending = dict(self._pending)
+        mg._cancel = self._cancel
+        mg._attributes = {}
+        for (met, attributes) in self._attributes.items():
+            mg._attributes[met] = dict(attributes)
+        return mg
+
+    def set_attributes(self, met, **attributes):
+        """Set attributes of a method for this graph only: they are set on
+           the method whenever this graph executes it, and read back 
+           afterwards (so that state kept by the method is kept too). 
+           Graphs sharing methods (see fork) thus do not share these 
+           attributes. The method need not be added yet."""
+        if met not in self._attributes:
+            self._attributes[met] = {}
+        self._attributes[met].update(attributes)
+
+    def get_attribute(self, met, name):
+        """get an attribute of a method in this graph, see set_attributes"""
+        return self._attributes[met][name]
+
+    def set_cancel(self, event):
+        """Cancel propagation when the given event (a threading.Event, or
+           any object with an is_set method) is set. It is checked before
+           each method is executed, and Cancelled is raised when set. The
+           values of variables are then undefined. None disables 
+           cancellation."""
+        self._cancel = event
+
     def propagate(self):
         """Propagate any pending changes.
         
@@ -218,15 +273,46 @@ class MethodGraph:
         from set() and add_method() by default. However, if the
         user so chooses, the methods will not call propagate, and
         the user should call this fucntion at a convenient time. 
-        """
-        while len(self._changed) != 0:
-            pick = list(self._changed.keys())[0]
-            methods = self._graph.outgoing_vertices(pick)
-            for met in methods:
-                self._execute(met)
 
-            if pick in self._changed:
-                del self._changed[pick]
+        All methods downstream of the changed variables and methods
+        added without propagation are executed once, in topological 
+        order, so many pending changes are propagated in a single pass.
+        """
+        if len(self._changed) == 0 and len(self._pending) == 0:
+            return
+        # collect methods downstream of changes
+        methods = {}
+        front = list(self._pending.keys())
+        for var in self._changed:
+            front.extend(self._graph.outgoing_vertices(var))
+        while len(front) > 0:
+            met = front.pop()
+            if met not in methods:
+                methods[met] = 1
+                for var in self._graph.outgoing_vertices(met):
+                    front.extend(self._graph.outgoing_vertices(var))
+        # number of inputs determined by collected methods
+        count = {}
+        for met in methods:
+            count[met] = 0
+            for var in self._graph.ingoing_vertices(met):
+                for m in self._graph.ingoing_vertices(var):
+                    if m in methods:
+                        count[met] += 1
+        # execute in topological order (the graph is acyclic)
+        self._pending = {}
+        ready = list(filter(lambda m: count[m] == 0, methods))
+        while len(ready) > 0:
+            if self._cancel is not None and self._cancel.is_set():
+                raise Cancelled("propagation cancelled")
+            met = ready.pop()
+            self._execute(met)
+            for var in self._graph.outgoing_vertices(met):
+                for m in self._graph.outgoing_vertices(var):
+                    count[m] -= 1
+                    if count[m] == 0:
+                        ready.append(m)
+        self._changed = {}
 
     def clear(self):
         """clear methodgraph by removing all variables"""
@@ -234,12 +320,19 @@ class MethodGraph:
             var = self._map.keys()[0]
             self.rem_variable(var)
 
-    def execute(self, met):
+    def execute(self, met, prop = True):
         """Execute a method and proagate changes.
-        Method must be in Methodgraph"""
+        Method must be in Methodgraph.
+
+           Iff prop is false, the method is only scheduled for
+           execution in the next propagation.
+        """
         if met in self._methods:
-            self._execute(met)
-            self.propagate()
+            if prop:
+                self._execute(met)
+                self.propagate()
+            else:
+                self._pending[met] = 1
         else:
             raise Exception("method not in graph")
 
@@ -258,11 +351,17 @@ class MethodGraph:
             inmap[var] = value
         for var in met.outputs():
             inmap[var] = self._map[var]
-        # call method.execute
+        # call method.execute, with the attributes of the method in this graph
+        attributes = self._attributes.get(met)
+        if attributes is not None:
+            met.__dict__.update(attributes)
         if hasNoneValues:
             outmap = {}
         else:
             outmap = met.execute(inmap)
+        if attributes is not None:
+            for name in attributes:
+                attributes[name] = getattr(met, name)
         # update values in self._map
         # set output variables changed
         for var in met.outputs():
@@ -46,6 +46,11 @@ class MultiMethod(Method):
        The 'multi_execute' method must return a list of possible values for the output variable.
        The output values returned by subsequent calls multi-execute are collected and stored in the 
        output MultiVariable. 
+
+       The number of output values may be limited by setting the attribute max_values. 
+       Values are then collected while executing, keeping only the max_values values 
+       with the lowest key, as given by the function in attribute rank (or arbitrary
+       values if rank is None).
     """
 
     def __init__(self):
@@ -58,6 +63,8 @@ class MultiMethod(Method):
             raise Exception("requires exactly one output")
         if not isinstance(self._outputs[0], MultiVariable):
             raise Exception("requires a MultiVariable output")
+        self.max_values = None
+        self.rank = None
 
 
     def execute(self, inmap):
@@ -81,9 +88,20 @@ class MultiMethod(Method):
             for value in values:
                 base_inmap[mvar] = value
                 output.update(self._recurse_execute(inmap, base_inmap, multi_inputs[1:]))
+                if self.max_values is not None and len(output) > self.max_values:
+                    output = self._best_values(output)
             return output
         else:
-            return self.multi_execute(base_inmap)
+            output = self.multi_execute(base_inmap)
+            if self.max_values is not None and len(output) > self.max_values:
+                output = self._best_values(output)
+            return output
+
+    def _best_values(self, values):
+        """return a set of at most max_values values with the lowest rank"""
+        if self.rank is None:
+            return set(list(values)[:self.max_values])
+        return set(sorted(values, key=self.rank)[:self.max_values])
 
 
 #####
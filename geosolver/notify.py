@@ -1,4 +1,13 @@
-"""This module implements a simple listen/notify schema"""
+"""This module implements a simple listen/notify schema.
+
+Messages are tuples (type, data), e.g. ("add_edge", (v1, v2, value)).
+Listeners receive all messages of the Notifiers they listen to. Callbacks
+can also be subscribed to a Notifier for given message types only. Messages
+sent between begin_notify_batch and end_notify_batch (or in a notify_batch
+context) are delivered at once, at the end of the batch. A Notifier without listeners and subscribers does
+not deliver anything; senders of frequent messages can test
+notifier.observed, to avoid even building the message.
+"""
 
 # 20090521
 # - replaced lists by weakKeyDict, do when listener/notifier deleted from all other contexts, its reference is removed
@@ -8,19 +17,42 @@
 # - member variables "listeners" and "notifiers" are not hidden, but should never be modified independently, so be careful!
 # - subclasses will need to override the receive_notify class.
 # - Notifier/Listener subclasses __init__ method  must call Notifier/Listener.__init__(self)
+# - the dictionary of listeners is created when first needed, so Notifiers that nobody listens to (e.g. the
+#   internal graphs of the solvers) are cheap to create and to send messages from.
 
 import weakref
+from contextlib import contextmanager
 
 class Notifier:
     """A notifier keeps a list of Listener instances that are to be informed of certain events.
     
        instance attributes:
         listeners       - a list of Listener instances
+        observed        - False if there are no listeners and subscribers
+                          (if True, there may be)
     """
 
     def __init__(self):
         #self.listeners = []
-        self.listeners = weakref.WeakKeyDictionary()
+        self._listeners = None
+        self._subscribers = None
+        self._queue = None
+        self._batches = 0
+        self.observed = False
+
+    def _get_listeners(self):
+        if self._listeners is None:
+            self._listeners = weakref.WeakKeyDictionary()
+        return self._listeners
+
+    def _set_listeners(self, listeners):
+        self._listeners = listeners
+        self._update_observed()
+
+    listeners = property(_get_listeners, _set_listeners)
+
+    def _update_observed(self):
+        self.observed = bool(self._listeners) or bool(self._subscribers)
 
     def add_listener(self, listener):
         """add a listener to the list (and self to listers' list)"""
@@ -28,6 +60,7 @@ class Notifier:
         #listener.notifiers.add(self)
         self.listeners[listener] = True
         listener.notifiers[self] = True
+        self.observed = True
 
     def rem_listener(self, listener):
         """remove a listener from the list (and self from listers' list)"""
@@ -35,11 +68,86 @@ class Notifier:
         #listener.notifiers.remove(self)
         del self.listeners[listener]
         del listener.notifiers[self]
+        self._update_observed()
+
+    def subscribe(self, callback, *types):
+        """call callback(notifier, messages) with a list of the sent
+           messages of the given types (of any type if none given). The
+           list has a single message, except at the end of a batch."""
+        if self._subscribers is None:
+            self._subscribers = []
+        if len(types) == 0:
+            types = None
+        else:
+            types = frozenset(types)
+        self._subscribers.append((callback, types))
+        self.observed = True
+
+    def unsubscribe(self, callback):
+        """remove all subscriptions of callback"""
+        if self._subscribers:
+            self._subscribers = [(c, t) for (c, t) in self._subscribers
+                                 if c != callback]
+        self._update_observed()
+
+    def begin_notify_batch(self):
+        """queue sent messages until end_notify_batch. Batches may be
+           nested."""
+        self._batches += 1
+        if self._queue is None:
+            self._queue = []
+
+    def end_notify_batch(self):
+        """deliver the messages queued since begin_notify_batch, with a
+           single call of receive_batch for each listener, and of each
+           subscribed callback."""
+        if self._batches == 0:
+            raise Exception("end_notify_batch without begin_notify_batch")
+        self._batches -= 1
+        if self._batches == 0:
+            messages = self._queue
+            self._queue = None
+            if len(messages) > 0:
+                if self._listeners:
+                    for dest in self._listeners:
+                        dest.receive_batch(self, messages)
+                if self._subscribers:
+                    self._publish(messages)
+
+    @contextmanager
+    def notify_batch(self):
+        """Context manager for begin_notify_batch and end_notify_batch"""
+        self.begin_notify_batch()
+        try:
+            yield self
+        finally:
+            self.end_notify_batch()
 
     def send_notify(self, message):
-        """send a message to all listeners"""
-        for dest in self.listeners:
-            dest.receive_notify(self, message)
+        """send a message to all listeners, and to subscribers of its
+           type. During a batch, the message is queued instead."""
+        if not self.observed:
+            return
+        if self._queue is not None:
+            self._queue.append(message)
+            return
+        if self._listeners:
+            for dest in self._listeners:
+                dest.receive_notify(self, message)
+        if self._subscribers:
+            self._publish([message])
+        if not self._listeners and not self._subscribers:
+            # all listeners have been deleted
+            self.observed = False
+
+    def _publish(self, messages):
+        for (callback, types) in list(self._subscribers):
+            if types is None:
+                callback(self, messages)
+            else:
+                selected = [m for m in messages if m[0] in types]
+                if len(selected) > 0:
+                    callback(self, selected)
 
 
 class Listener:
@@ -58,17 +166,22 @@ class Listener:
         """add a notifier to the list (and self to notifiers' list)"""
         # self.notifiers.add(notifier)
         # notifier.listeners.add(self)
-        self.notifiers[notifier] = True
-        notifier.listeners[self] = True
+        notifier.add_listener(self)
 
     def rem_notifier(self, notifier):
         """remove a notifier from the list (and self from notifiers' list)"""
         # self.notifiers.remove(notifier)
         # notifier.listeners.remove(self)
-        del self.notifiers[notifier]
-        del notifier.listeners[self]
+        notifier.rem_listener(self)
 
     def receive_notify(self, source, message):
         """receive a message from a notifier.
         Implementing classes should override this."""
         print("%s %s %s %s" % (self, "receive_notify", source, message))
+
+    def receive_batch(self, source, messages):
+        """receive the list of messages of a batch from a notifier (see
+        Notifier.begin_notify_batch). By default, receive_notify is
+        called for each message."""
+        for message in messages:
+            self.receive_notify(source, message)
@@ -0,0 +1,158 @@
+"""Parameter ranges.
+
+Determines for which values of the parameter of a constraint (e.g. a
+DistanceConstraint or an AngleConstraint) a GeometricProblem has solutions.
+
+The parameter is swept over an interval using a single GeometricSolver,
+on a copy of the problem, so that the problem and its other solvers are
+not affected. Because the structure of the problem does not change, the decomposition
+(DR-plan) is computed once, and for each sample only the methods depending
+on the constraint are re-executed. Boundaries of the feasible sub-intervals
+are refined by bisection between samples. Parameter values for which 
+solving fails (e.g. a division by zero for a degenerate distance) are 
+considered infeasible.
+"""
+
+from geosolver.geometric import GeometricSolver
+from geosolver.diagnostic import diag_print
+
+
+class Interval:
+    """A closed interval [left, right] of parameter values"""
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def left_value(self):
+        return self.left
+
+    def right_value(self):
+        return self.right
+
+    def contains(self, value):
+        return self.left <= value <= self.right
+
+    def __str__(self):
+        return "[" + str(self.left) + ", " + str(self.right) + "]"
+
+
+class ParameterRange:
+    """The result of sampling the parameter of a constraint.
+
+       instance attributes:
+        constraint  - the sampled constraint
+        intervals   - list of Intervals of parameter values for which the problem
+                      has solutions, in increasing order
+        samples     - list of (value, count) tuples, where count is the
+                      number of solutions for that parameter value
+    """
+
+    def __init__(self, constraint):
+        self.constraint = constraint
+        self.intervals = []
+        self.samples = []
+
+    def contains(self, value):
+        """True iff value is in one of the feasible intervals"""
+        for interval in self.intervals:
+            if interval.contains(value):
+                return True
+        return False
+
+    def __str__(self):
+        return "ParameterRange(" + str(self.constraint) + ", [" \
+            + ", ".join(map(str, self.intervals)) + "])"
+
+
+def sample_prange(problem, constraint, lo, hi, step, tolerance=None):
+    """Determine the feasible range of the parameter of a constraint.
+
+       The parameter is sampled from lo to hi (inclusive) with given step.
+       Boundaries of feasible intervals are then refined by bisection,
+       until they are known within the given tolerance (default step/1024).
+       A copy of the problem is sampled (see GeometricProblem.fork), so 
+       the problem and the parameter of the constraint are not changed.
+
+       keyword args:
+        problem     - a GeometricProblem
+        constraint  - a DistanceConstraint or AngleConstraint in problem
+        lo, hi      - the interval to sample
+        step        - the distance between samples
+        tolerance   - the precision of interval boundaries
+
+       Returns a ParameterRange.
+    """
+    if step <= 0:
+        raise Exception("step must be positive")
+    if tolerance is None:
+        tolerance = step / 1024.0
+    fork = problem.fork()
+    copies = [c for c in fork._origins if fork._origins[c] is constraint]
+    if len(copies) == 0:
+        raise Exception("constraint not in problem")
+    sampled = copies[0]
+    solver = GeometricSolver(fork)
+    prange = ParameterRange(constraint)
+
+    def count(value):
+        # solving may fail for degenerate values; these are infeasible
+        try:
+            sampled.set_parameter(value)
+            return _count_solutions(solver)
+        except Exception as e:
+            diag_print("sample_prange: %s at %s", "prange", e, value)
+            return 0
+
+    # sample
+    values = []
+    n = int((hi - lo) / step + 1e-9)
+    for i in range(n + 1):
+        values.append(lo + i * step)
+    if values[-1] < hi:
+        values.append(hi)
+    for value in values:
+        prange.samples.append((value, count(value)))
+    diag_print("sample_prange: %d samples", "prange", len(values))
+
+    # determine intervals, refine boundaries between samples
+    left = None
+    for i in range(len(values)):
+        feasible = prange.samples[i][1] > 0
+        if feasible and left is None:
+            if i == 0:
+                left = values[i]
+            else:
+                left = _bisect(count, values[i - 1], values[i], tolerance)
+        elif not feasible and left is not None:
+            right = _bisect(count, values[i], values[i - 1], tolerance)
+            prange.intervals.append(Interval(left, right))
+            left = None
+    if left is not None:
+        prange.intervals.append(Interval(left, values[-1]))
+    return prange
+
+
+def _count_solutions(solver):
+    """number of solutions of the current decomposition, i.e. the product of
+       the number of configurations of the top-level clusters"""
+    count = 1
+    for cluster in solver.dr.top_level():
+        configurations = solver.dr.get(cluster)
+        if configurations is None:
+            return 0
+        count *= len(configurations)
+    return count
+
+
+def _bisect(count, infeasible, feasible, tolerance):
+    """return the feasible parameter value closest to the boundary
+       between given infeasible and feasible values; count gives the
+       number of solutions for a value, 0 where solving fails"""
+    while abs(feasible - infeasible) > tolerance:
+        middle = (infeasible + feasible) / 2.0
+        if count(middle) > 0:
+            feasible = middle
+        else:
+            infeasible = middle
+    return feasible
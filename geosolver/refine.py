@@ -0,0 +1,435 @@
+"""Numeric refinement of solutions.
+
+The constructive solver determines each cluster from a minimal subset of
+its constraints. For over-constrained clusters the remaining constraints
+are only satisfied up to the accumulated error, and solutions close to
+the tolerance bounds may be lost. Refinement minimizes the residuals of
+all distance, angle and fix constraints on the points of a solution with
+a Levenberg-Marquardt iteration, using analytic Jacobians, starting from
+a given solution.
+
+Clusters that together are rigid, but that cannot be merged by the
+decomposition rules, are placed as rigid bodies by place_bodies, which
+solves the constraints between the bodies numerically in the same way.
+
+Example:
+
+    (solution, residual) = refine(problem, solution)
+"""
+
+import numpy
+
+import itertools
+
+from geosolver.geometric import DistanceConstraint, AngleConstraint, \
+    FixConstraint
+from geosolver.cluster import Rigid, Hedgehog, Balloon
+from geosolver.vector import vector
+from geosolver.diagnostic import diag_print
+import geosolver.tolerance as tolerance
+
+
+def refine(problem, solution, max_iterations=50):
+    """Refine a solution of (part of) a GeometricProblem.
+
+       All distance, angle and fix constraints of the problem on variables
+       in the solution are taken into account.
+
+       keyword args:
+        problem         - a GeometricProblem
+        solution        - a dictionary mapping variables to points
+        max_iterations  - maximum number of iterations
+
+       Returns a tuple (solution, residual), with the refined solution
+       and the largest absolute residual of the constraints.
+    """
+    variables = list(solution.keys())
+    if len(variables) == 0:
+        return (dict(solution), 0.0)
+    dimension = len(solution[variables[0]])
+    residuals = _Residuals(problem, variables, dimension)
+    x = numpy.array([list(solution[v]) for v in variables], dtype=float)
+    x = x.reshape(-1)
+    (x, residual) = _levenberg_marquardt(residuals, x, max_iterations)
+    x = x.reshape(len(variables), dimension)
+    refined = {}
+    for i in range(len(variables)):
+        refined[variables[i]] = vector(x[i].tolist())
+    return (refined, residual)
+
+
+class _Residuals:
+    """residuals and Jacobian of the constraints on given variables"""
+
+    def __init__(self, problem, variables, dimension):
+        self.dimension = dimension
+        index = {}
+        for i in range(len(variables)):
+            index[variables[i]] = i
+        distances = []
+        angles = []
+        fixes = []
+        for con in problem.cg.constraints():
+            if not all([v in index for v in con.variables()]):
+                continue
+            if isinstance(con, DistanceConstraint):
+                distances.append(con)
+            elif isinstance(con, AngleConstraint):
+                angles.append(con)
+            elif isinstance(con, FixConstraint):
+                fixes.append(con)
+        self.size = len(variables) * dimension
+        self.distance_index = numpy.array(
+            [[index[v] for v in c.variables()] for c in distances],
+            dtype=int).reshape(-1, 2)
+        self.distance_value = numpy.array(
+            [c.get_parameter() for c in distances], dtype=float)
+        self.angle_index = numpy.array(
+            [[index[v] for v in c.variables()] for c in angles],
+            dtype=int).reshape(-1, 3)
+        self.angle_value = numpy.array(
+            [c.get_parameter() for c in angles], dtype=float)
+        if dimension == 3:
+            self.angle_value = numpy.abs(self.angle_value)
+        self.fix_index = numpy.array(
+            [index[c.variables()[0]] for c in fixes], dtype=int)
+        self.fix_value = numpy.array(
+            [list(c.get_parameter())[:dimension] for c in fixes],
+            dtype=float).reshape(-1, dimension)
+        self.count = len(distances) + len(angles) \
+            + len(fixes) * dimension
+
+    def evaluate(self, x):
+        """return residual vector r and Jacobian J (count x size) at x"""
+        dim = self.dimension
+        p = x.reshape(-1, dim)
+        r = numpy.zeros(self.count)
+        jac = numpy.zeros((self.count, self.size))
+        row = 0
+        # distances: |pb - pa| - d
+        n = len(self.distance_value)
+        if n > 0:
+            (ia, ib) = (self.distance_index[:, 0], self.distance_index[:, 1])
+            d = p[ib] - p[ia]
+            length = numpy.sqrt((d * d).sum(axis=1))
+            r[row:row + n] = length - self.distance_value
+            g = d / numpy.maximum(length, 1e-12)[:, None]
+            rows = numpy.arange(row, row + n)
+            for k in range(dim):
+                jac[rows, ia * dim + k] -= g[:, k]
+                jac[rows, ib * dim + k] += g[:, k]
+            row += n
+        # angles: angle(pa - pb, pc - pb) - a
+        n = len(self.angle_value)
+        if n > 0:
+            (ia, ib, ic) = (self.angle_index[:, 0], self.angle_index[:, 1],
+                            self.angle_index[:, 2])
+            (angle, da, dc) = _angles(p[ia] - p[ib], p[ic] - p[ib], dim)
+            r[row:row + n] = angle - self.angle_value
+            rows = numpy.arange(row, row + n)
+            for k in range(dim):
+                jac[rows, ia * dim + k] += da[:, k]
+                jac[rows, ic * dim + k] += dc[:, k]
+                jac[rows, ib * dim + k] -= da[:, k] + dc[:, k]
+            row += n
+        # fixed points: p - f, per coordinate
+        for k in range(dim):
+            n = len(self.fix_index)
+            rows = numpy.arange(row, row + n)
+            r[rows] = p[self.fix_index, k] - self.fix_value[:, k]
+            jac[rows, self.fix_index * dim + k] = 1.0
+            row += n
+        return (r, jac)
+
+
+def place_bodies(clusters, configurations, prototype, dimension,
+                 fixed=None, max_iterations=100):
+    """Place rigid clusters as rigid bodies, such that shared points
+       coincide and the angles of hedgehogs and balloons are satisfied.
+
+       keyword args:
+        clusters        - a list of Rigids, Hedgehogs and Balloons; every
+                          variable must be in at least one Rigid
+        configurations  - a dictionary mapping each cluster to a
+                          dictionary mapping its variables to points
+        prototype       - a dictionary mapping all variables to points,
+                          the initial placement of the bodies
+        dimension       - 2 or 3
+        fixed           - the Rigid that keeps its position, or None for
+                          the rigid with the most variables
+        max_iterations  - maximum number of iterations
+
+       Returns a tuple (solution, residual), with a dictionary mapping
+       variables to points, in the coordinates of the fixed rigid, and
+       the largest absolute residual.
+    """
+    bodies = _Bodies(clusters, configurations, prototype, dimension, fixed)
+    x = numpy.zeros(bodies.size)
+    (x, residual) = _levenberg_marquardt(bodies, x, max_iterations)
+    return (bodies.solution(x), residual)
+
+
+def is_rigid(clusters, dimension):
+    """True iff the given clusters (see place_bodies) together are
+       generically rigid, determined by the rank of the Jacobian of the 
+       constraints between the bodies at a random realization."""
+    random = numpy.random.RandomState(0)
+    positions = {}
+    for cluster in clusters:
+        for var in cluster.vars:
+            if var not in positions:
+                positions[var] = random.uniform(-1.0, 1.0, dimension)
+    configurations = {}
+    for cluster in clusters:
+        configurations[cluster] = positions
+    bodies = _Bodies(clusters, configurations, positions, dimension)
+    if bodies.size == 0:
+        return True
+    (r, jac) = bodies.evaluate(numpy.zeros(bodies.size))
+    if jac.shape[0] == 0:
+        return bodies.degrees_of_freedom == 0
+    values = numpy.linalg.svd(jac, compute_uv=False)
+    rank = int((values > values.max() * 1e-9).sum())
+    return rank == bodies.degrees_of_freedom
+
+
+class _Bodies:
+    """residuals and Jacobian of the relative placement of rigid bodies. 
+       Each body, except the fixed body, has a rotation and a translation
+       relative to its initial placement at the prototype, about its
+       centroid. Residuals are the differences between the positions of 
+       shared points, and the angles of hedgehogs and balloons."""
+
+    def __init__(self, clusters, configurations, prototype, dimension,
+                 fixed=None):
+        self.dimension = dimension
+        dim = dimension
+        rigids = [c for c in clusters if isinstance(c, Rigid)]
+        if fixed is None:
+            fixed = max(rigids, key=lambda c: len(c.vars))
+        rigids.remove(fixed)
+        rigids.insert(0, fixed)
+        if dim == 3:
+            (self.nrot, full) = (3, 6)
+            dof = {1: 3, 2: 5}
+        else:
+            (self.nrot, full) = (1, 3)
+            dof = {1: 2}
+        self.npar = self.nrot + dim
+        # point instances, per body, in local coordinates about the centroid
+        local = []
+        body = []
+        first = {}
+        shared = []
+        self.rotations = []
+        self.translations = []
+        self.centroids = []
+        self.degrees_of_freedom = -full
+        for k in range(len(rigids)):
+            variables = list(rigids[k].vars)
+            conf = configurations[rigids[k]]
+            c = numpy.array([list(conf[v]) for v in variables], dtype=float)
+            centroid = c.mean(axis=0)
+            c = c - centroid
+            p = numpy.array([list(prototype[v]) for v in variables],
+                            dtype=float)
+            (rotation, translation) = _align(c, p)
+            self.rotations.append(rotation)
+            self.translations.append(translation)
+            self.centroids.append(centroid)
+            self.degrees_of_freedom += dof.get(len(variables), full)
+            for i in range(len(variables)):
+                if variables[i] in first:
+                    shared.append((first[variables[i]], len(local)))
+                else:
+                    first[variables[i]] = len(local)
+                local.append(c[i])
+                body.append(k)
+        self.local = numpy.array(local, dtype=float).reshape(-1, dim)
+        self.body = numpy.array(body, dtype=int)
+        self.first = first
+        self.shared = numpy.array(shared, dtype=int).reshape(-1, 2)
+        # angles of hedgehogs and balloons, on first instances
+        angles = []
+        values = []
+        for cluster in clusters:
+            if isinstance(cluster, Hedgehog):
+                xvars = list(cluster.xvars)
+                triples = [(a, cluster.cvar, b)
+                           for (a, b) in itertools.combinations(xvars, 2)]
+            elif isinstance(cluster, Balloon):
+                triples = []
+                for (a, b, c) in itertools.combinations(list(cluster.vars), 3):
+                    triples += [(b, a, c), (a, b, c)]
+            else:
+                continue
+            conf = configurations[cluster]
+            for (a, b, c) in triples:
+                angles.append((first[a], first[b], first[c]))
+                pa = numpy.array(list(conf[a]), dtype=float)
+                pb = numpy.array(list(conf[b]), dtype=float)
+                pc = numpy.array(list(conf[c]), dtype=float)
+                values.append(_angles((pa - pb)[None], (pc - pb)[None],
+                                      dim)[0][0])
+        self.angle_index = numpy.array(angles, dtype=int).reshape(-1, 3)
+        self.angle_value = numpy.array(values, dtype=float)
+        self.size = (len(rigids) - 1) * self.npar
+        self.count = len(self.shared) * dim + len(self.angle_value)
+
+    def _positions(self, x):
+        """positions of all point instances, and their offsets from the
+           centroid of their body"""
+        dim = self.dimension
+        params = numpy.concatenate([numpy.zeros(self.npar), x])
+        params = params.reshape(-1, self.npar)
+        offsets = numpy.empty_like(self.local)
+        for k in range(len(params)):
+            rotation = numpy.dot(_rotation(params[k, :self.nrot], dim),
+                                 self.rotations[k])
+            instances = self.body == k
+            offsets[instances] = numpy.dot(self.local[instances], rotation.T)
+        translations = numpy.array(self.translations) + params[:, self.nrot:]
+        return (offsets + translations[self.body], offsets)
+
+    def evaluate(self, x):
+        """return residual vector r and Jacobian J (count x size) at x"""
+        dim = self.dimension
+        (q, offsets) = self._positions(x)
+        m = len(q)
+        r = numpy.zeros(self.count)
+        jac = numpy.zeros((self.count, m * dim))
+        row = 0
+        # shared points: qi - qj, per coordinate
+        n = len(self.shared)
+        (ii, ij) = (self.shared[:, 0], self.shared[:, 1])
+        for k in range(dim):
+            rows = numpy.arange(row, row + n)
+            r[rows] = q[ii, k] - q[ij, k]
+            jac[rows, ii * dim + k] = 1.0
+            jac[rows, ij * dim + k] = -1.0
+            row += n
+        # angles: angle(qa - qb, qc - qb) - a
+        n = len(self.angle_value)
+        if n > 0:
+            (ia, ib, ic) = (self.angle_index[:, 0], self.angle_index[:, 1],
+                            self.angle_index[:, 2])
+            (angle, da, dc) = _angles(q[ia] - q[ib], q[ic] - q[ib], dim)
+            # keep the residual in [-pi, pi) for signed 2D angles
+            diff = angle - self.angle_value
+            r[row:row + n] = (diff + numpy.pi) % (2 * numpy.pi) - numpy.pi
+            rows = numpy.arange(row, row + n)
+            for k in range(dim):
+                jac[rows, ia * dim + k] += da[:, k]
+                jac[rows, ic * dim + k] += dc[:, k]
+                jac[rows, ib * dim + k] -= da[:, k] + dc[:, k]
+            row += n
+        # chain rule: derivatives of instance positions to body parameters,
+        # rotation (small angles about the current orientation) and
+        # translation
+        derivative = numpy.zeros((m * dim, len(self.translations) * self.npar))
+        for i in range(m):
+            column = self.body[i] * self.npar
+            o = offsets[i]
+            if dim == 3:
+                derivative[i * dim:(i + 1) * dim, column:column + 3] = \
+                    [[0.0, o[2], -o[1]], [-o[2], 0.0, o[0]], [o[1], -o[0], 0.0]]
+            else:
+                derivative[i * dim:(i + 1) * dim, column] = [-o[1], o[0]]
+            column += self.nrot
+            derivative[i * dim:(i + 1) * dim, column:column + dim] = \
+                numpy.identity(dim)
+        jac = numpy.dot(jac, derivative)[:, self.npar:]
+        return (r, jac)
+
+    def solution(self, x):
+        """positions of the variables, in the coordinates of the fixed body"""
+        (q, offsets) = self._positions(x)
+        # inverse of the initial placement of the fixed body
+        q = numpy.dot(q - self.translations[0], self.rotations[0]) \
+            + self.centroids[0]
+        solution = {}
+        for var in self.first:
+            solution[var] = vector(q[self.first[var]].tolist())
+        return solution
+
+
+def _rotation(angles, dimension):
+    """rotation matrix for a rotation vector (3D) or angle (2D)"""
+    if dimension == 2:
+        (c, s) = (numpy.cos(angles[0]), numpy.sin(angles[0]))
+        return numpy.array([[c, -s], [s, c]])
+    angle = numpy.sqrt(numpy.dot(angles, angles))
+    if angle < 1e-15:
+        return numpy.identity(3)
+    (x, y, z) = angles / angle
+    k = numpy.array([[0.0, -z, y], [z, 0.0, -x], [-y, x, 0.0]])
+    return numpy.identity(3) + numpy.sin(angle) * k \
+        + (1.0 - numpy.cos(angle)) * numpy.dot(k, k)
+
+
+def _align(local, target):
+    """rotation and translation that best map local points (centered) to
+       target points, without reflection"""
+    dim = local.shape[1]
+    centroid = target.mean(axis=0)
+    h = numpy.dot(local.T, target - centroid)
+    (u, s, vt) = numpy.linalg.svd(h)
+    d = numpy.identity(dim)
+    d[-1, -1] = numpy.sign(numpy.linalg.det(numpy.dot(vt.T, u.T))) or 1.0
+    rotation = numpy.dot(vt.T, numpy.dot(d, u.T))
+    return (rotation, centroid)
+
+
+def _angles(u, v, dimension):
+    """angles between the rows of u and v, and their gradients with
+       respect to u and v. The angle is atan2(s, c), with c = u.v and
+       s = |u x v| in 3D or the signed cross product in 2D."""
+    c = (u * v).sum(axis=1)
+    if dimension == 3:
+        w = numpy.cross(u, v)
+        s = numpy.maximum(numpy.sqrt((w * w).sum(axis=1)), 1e-12)
+        uu = (u * u).sum(axis=1)
+        vv = (v * v).sum(axis=1)
+        ds_du = (vv[:, None] * u - c[:, None] * v) / s[:, None]
+        ds_dv = (uu[:, None] * v - c[:, None] * u) / s[:, None]
+    else:
+        s = u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]
+        ds_du = numpy.stack([v[:, 1], -v[:, 0]], axis=1)
+        ds_dv = numpy.stack([-u[:, 1], u[:, 0]], axis=1)
+    q = numpy.maximum(s * s + c * c, 1e-24)[:, None]
+    du = (c[:, None] * ds_du - s[:, None] * v) / q
+    dv = (c[:, None] * ds_dv - s[:, None] * u) / q
+    return (numpy.arctan2(s, c), du, dv)
+
+
+def _levenberg_marquardt(residuals, x, max_iterations):
+    if residuals.count == 0:
+        return (x, 0.0)
+    (r, jac) = residuals.evaluate(x)
+    cost = numpy.dot(r, r)
+    damping = 1e-3
+    iteration = 0
+    for iteration in range(max_iterations):
+        if numpy.abs(r).max() <= tolerance.default_tol * 1e-3:
+            break
+        jtj = numpy.dot(jac.T, jac)
+        jtr = numpy.dot(jac.T, r)
+        scale = numpy.diag(jtj) + 1e-9
+        improved = False
+        while damping < 1e12:
+            step = numpy.linalg.solve(jtj + damping * numpy.diag(scale), -jtr)
+            (rn, jn) = residuals.evaluate(x + step)
+            costn = numpy.dot(rn, rn)
+            if costn < cost:
+                x = x + step
+                (r, jac, cost) = (rn, jn, costn)
+                damping = max(damping / 10.0, 1e-12)
+                improved = True
+                break
+            damping *= 10.0
+        if not improved or numpy.abs(step).max() < 1e-15:
+            break
+    residual = float(numpy.abs(r).max())
+    diag_print("refined in %d iterations, residual %s", "refine",
+               iteration + 1, residual)
+    return (x, residual)
@@ -113,15 +113,16 @@ class FunctionConstraint(SelectionConstraint):
         values = []
         for var in self._variables:
             values.append(map[var])
-        return apply(self._function, values)==True
+        return self._function(*values)==True
 
     def __str__(self):
         return "FunctionConstraint("+self._function.__name__+","+str(map(str, self._variables))+")"
 
 
 def fnot(function):
-    notf = lambda *args: not apply(function,args)
+    notf = lambda *args: not function(*args)
     notf.__name__ = "fnot("+function.__name__+")"
+    notf.negated = function
     return notf
 
 
@@ -0,0 +1,427 @@
+"""A local solver service, that keeps solvers warm between requests.
+
+The service accepts JSON-RPC 2.0 requests (single or batch), posted over
+HTTP. Problems are opened once and then edited incrementally, so that
+follow-up requests only pay for incremental solving and propagation.
+Open problems are kept in an LRU cache, keyed by a problem id, given by
+the client or else generated. Solvers of recently opened problems are kept
+warm in a second LRU cache, keyed by the structural fingerprint of the
+problem (see batchsolve.fingerprint) and its selection constraints. Each
+open gets its own fork of a warm solver with the same structure (see
+GeometricSolver.fork), setting only the new parameters and prototype
+points, so clients never share a problem or its solver settings.
+
+Methods (parameters by name):
+
+    open(problem, id=None)             - problem as in io.problem_to_dict;
+                                         returns the id
+    close(id)
+    set_point(id, variable, position)
+    set_parameter(id, constraint, value)
+    add_point(id, variable, position)
+    rem_point(id, variable)
+    add_constraint(id, constraint)     - constraint as in io.problem_to_dict
+    rem_constraint(id, constraint)
+    get_result(id, max_solutions=None) - see batch.solve_record; 
+                                         max_solutions stays in effect
+                                         for the problem
+    stats()
+
+Constraints are identified by a dictionary with keys "type" ("distance",
+"angle" or "fix") and "variables". Edits may be sent as a batch request,
+which is applied as a single update of the problem.
+
+Usage:
+
+    python -m geosolver.service --port 8765
+
+    client = ServiceClient("http://127.0.0.1:8765/")
+    id = client.open(io.problem_to_dict(problem))
+    client.set_parameter(id, {"type": "distance", "variables": ["a", "b"]},
+                         2.0)
+    result = client.get_result(id)
+"""
+
+import sys
+import json
+import uuid
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+from geosolver.io import problem_from_dict, constraint_from_dict, \
+    constraint_to_dict, variable_from_json
+from geosolver.geometric import GeometricSolver
+from geosolver.batchsolve import fingerprint
+from geosolver.selconstr import SelectionConstraint
+from geosolver.vector import vector
+
+
+class ServiceError(Exception):
+    """An error reported to the client, with a JSON-RPC error code"""
+
+    def __init__(self, message, code=-32000):
+        Exception.__init__(self, message)
+        self.code = code
+
+
+class SolverService:
+    """Dispatches JSON-RPC requests to solvers in an LRU cache of at most
+       max_solvers open problems, forked from at most max_solvers warm
+       solvers. Thread-safe."""
+
+    def __init__(self, max_solvers=64):
+        self.max_solvers = max_solvers
+        # id -> (problem, solver), least recently used first
+        self._cache = OrderedDict()
+        # structure -> warm solver, least recently used first
+        self._warm = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def handle(self, request):
+        """Handle a decoded JSON-RPC request or batch; return the response
+           (None for notifications only)."""
+        with self._lock:
+            if isinstance(request, list):
+                # edits are applied as a single update, results after it
+                problems = self._batch_problems(request)
+                responses = [None] * len(request)
+                results = []
+                for problem in problems:
+                    problem.begin_update()
+                try:
+                    for i in range(len(request)):
+                        if isinstance(request[i], dict) and \
+                                request[i].get("method") == "get_result":
+                            results.append(i)
+                        else:
+                            responses[i] = self._handle(request[i])
+                finally:
+                    for problem in problems:
+                        problem.commit()
+                for i in results:
+                    responses[i] = self._handle(request[i])
+                responses = [r for r in responses if r is not None]
+                return responses or None
+            return self._handle(request)
+
+    def _batch_problems(self, requests):
+        """cached problems edited by a batch"""
+        problems = []
+        for request in requests:
+            params = request.get("params") if isinstance(request, dict) \
+                else None
+            if isinstance(params, dict) and params.get("id") in self._cache:
+                problem = self._cache[params["id"]][0]
+                if problem not in problems:
+                    problems.append(problem)
+        return problems
+
+    def _handle(self, request):
+        if not isinstance(request, dict) or "method" not in request:
+            return _error(None, -32600, "invalid request")
+        id_ = request.get("id")
+        method = getattr(self, "rpc_" + str(request["method"]), None)
+        if method is None:
+            return _error(id_, -32601, "method not found")
+        params = request.get("params", {})
+        try:
+            if isinstance(params, list):
+                result = method(*params)
+            else:
+                result = method(**params)
+        except ServiceError as e:
+            return _error(id_, e.code, str(e))
+        except TypeError as e:
+            return _error(id_, -32602, str(e))
+        except Exception as e:
+            return _error(id_, -32000, "%s: %s" % (type(e).__name__, e))
+        if "id" not in request:
+            return None
+        return {"jsonrpc": "2.0", "id": id_, "result": result}
+
+    # --- cache ---
+
+    def _get(self, id):
+        if id not in self._cache:
+            raise ServiceError("unknown problem " + str(id), -32001)
+        self._cache.move_to_end(id)
+        return self._cache[id]
+
+    def _put(self, id, problem, solver):
+        self._cache[id] = (problem, solver)
+        self._cache.move_to_end(id)
+        while len(self._cache) > self.max_solvers:
+            self._cache.popitem(last=False)
+
+    def _fork(self, problem):
+        """a fork of the warm solver for the structure of problem, with
+           the values of problem"""
+        key = _structure(problem)
+        if key in self._warm:
+            self._hits += 1
+            self._warm.move_to_end(key)
+            solver = self._warm[key].fork()
+            with solver.problem.update():
+                _copy_values(problem, solver.problem)
+            return solver
+        self._misses += 1
+        warm = GeometricSolver(problem)
+        self._warm[key] = warm
+        while len(self._warm) > self.max_solvers:
+            self._warm.popitem(last=False)
+        return warm.fork()
+
+    # --- methods ---
+
+    def rpc_open(self, problem, id=None):
+        (new, solutions) = problem_from_dict(problem)
+        if id is None:
+            id = uuid.uuid4().hex
+        solver = self._fork(new)
+        self._put(id, solver.problem, solver)
+        return id
+
+    def rpc_close(self, id):
+        self._get(id)
+        del self._cache[id]
+
+    def rpc_set_point(self, id, variable, position):
+        (problem, solver) = self._get(id)
+        problem.set_point(variable_from_json(variable), vector(position))
+
+    def rpc_set_parameter(self, id, constraint, value):
+        (problem, solver) = self._get(id)
+        con = _find_constraint(problem, constraint)
+        if con.__class__.__name__ == "FixConstraint":
+            value = vector(value)
+        con.set_parameter(value)
+
+    def rpc_add_point(self, id, variable, position):
+        (problem, solver) = self._get(id)
+        problem.add_point(variable_from_json(variable), vector(position))
+
+    def rpc_rem_point(self, id, variable):
+        (problem, solver) = self._get(id)
+        problem.rem_point(variable_from_json(variable))
+
+    def rpc_add_constraint(self, id, constraint):
+        (problem, solver) = self._get(id)
+        problem.add_constraint(constraint_from_dict(constraint))
+
+    def rpc_rem_constraint(self, id, constraint):
+        (problem, solver) = self._get(id)
+        problem.rem_constraint(_find_constraint(problem, constraint))
+
+    def rpc_get_result(self, id, max_solutions=None):
+        (problem, solver) = self._get(id)
+        cluster = solver.get_result(max_solutions)
+        variables = list(problem.prototype)
+        return {"constrainedness": solver.get_constrainedness(),
+                "flag": cluster.flag,
+                "incomplete": cluster.incomplete,
+                "variables": variables,
+                "solutions": [[[float(x) for x in solution[v]]
+                               for v in variables]
+                              for solution in cluster.solutions]}
+
+    def rpc_stats(self):
+        return {"solvers": len(self._cache),
+                "warm": len(self._warm),
+                "max_solvers": self.max_solvers,
+                "hits": self._hits,
+                "misses": self._misses}
+
+
+def _error(id_, code, message):
+    return {"jsonrpc": "2.0", "id": id_,
+            "error": {"code": code, "message": message}}
+
+
+def _find_constraint(problem, constraint):
+    type_ = constraint.get("type")
+    variables = [variable_from_json(v)
+                 for v in constraint.get("variables", [])]
+    con = None
+    if type_ == "distance" and len(variables) == 2:
+        con = problem.get_distance(*variables)
+    elif type_ == "angle" and len(variables) == 3:
+        con = problem.get_angle(*variables)
+    elif type_ == "fix" and len(variables) == 1:
+        con = problem.get_fix(*variables)
+    if con is None:
+        raise ServiceError("unknown constraint " + json.dumps(constraint),
+                           -32002)
+    return con
+
+
+def _structure(problem):
+    """the fingerprint of a problem, extended with its selection
+       constraints, which the fingerprint does not distinguish"""
+    selections = [json.dumps(constraint_to_dict(con), sort_keys=True)
+                  for con in problem.cg.constraints()
+                  if isinstance(con, SelectionConstraint)]
+    return (fingerprint(problem), tuple(sorted(selections)))
+
+
+def _copy_values(source, target):
+    """set the prototype points and parameters of target (a problem with
+       the same structure, including selection constraints) to those of
+       source"""
+    for var in source.prototype:
+        point = source.get_point(var)
+        if list(target.get_point(var)) != list(point):
+            target.set_point(var, point)
+    for con in source.cg.constraints():
+        type_ = con.__class__.__name__
+        if type_ == "DistanceConstraint":
+            other = target.get_distance(*con.variables())
+        elif type_ == "AngleConstraint":
+            other = target.get_angle(*con.variables())
+        elif type_ == "FixConstraint":
+            other = target.get_fix(*con.variables())
+        elif type_ == "RigidConstraint":
+            other = [c for c in
+                     target.cg.get_constraints_on_all(con.variables())
+                     if c.__class__.__name__ == type_
+                     and c.variables() == con.variables()][0]
+        else:
+            continue
+        if other.get_parameter() != con.get_parameter():
+            other.set_parameter(con.get_parameter())
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError:
+            response = _error(None, -32700, "parse error")
+        else:
+            response = self.server.service.handle(request)
+        body = b""
+        if response is not None:
+            body = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host="127.0.0.1", port=0, max_solvers=64):
+    """Create an HTTP server for a new SolverService. Port 0 selects a free
+       port (see server.server_address). Call serve_forever on the result,
+       e.g. in a thread, and shutdown to stop."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.service = SolverService(max_solvers)
+    return server
+
+
+class ServiceClient:
+    """A client for a solver service at the given URL. Errors are raised as
+       ServiceError."""
+
+    def __init__(self, url):
+        self.url = url
+        self._count = 0
+
+    def call(self, method, **params):
+        """call a method and return its result"""
+        self._count += 1
+        response = self._post({"jsonrpc": "2.0", "id": self._count,
+                               "method": method, "params": params})
+        return _result(response)
+
+    def batch(self, calls):
+        """call a list of (method, params) tuples in a single request, which
+           is applied as a single update of the edited problems; return the
+           list of results"""
+        requests = []
+        for (method, params) in calls:
+            self._count += 1
+            requests.append({"jsonrpc": "2.0", "id": self._count,
+                             "method": method, "params": params})
+        responses = dict((r["id"], r) for r in self._post(requests))
+        return [_result(responses[r["id"]]) for r in requests]
+
+    def open(self, problem, id=None):
+        return self.call("open", problem=problem, id=id)
+
+    def close(self, id):
+        return self.call("close", id=id)
+
+    def set_point(self, id, variable, position):
+        return self.call("set_point", id=id, variable=variable,
+                         position=list(position))
+
+    def set_parameter(self, id, constraint, value):
+        return self.call("set_parameter", id=id, constraint=constraint,
+                         value=value)
+
+    def add_point(self, id, variable, position):
+        return self.call("add_point", id=id, variable=variable,
+                         position=list(position))
+
+    def rem_point(self, id, variable):
+        return self.call("rem_point", id=id, variable=variable)
+
+    def add_constraint(self, id, constraint):
+        return self.call("add_constraint", id=id, constraint=constraint)
+
+    def rem_constraint(self, id, constraint):
+        return self.call("rem_constraint", id=id, constraint=constraint)
+
+    def get_result(self, id, max_solutions=None):
+        return self.call("get_result", id=id, max_solutions=max_solutions)
+
+    def stats(self):
+        return self.call("stats")
+
+    def _post(self, request):
+        data = json.dumps(request).encode("utf-8")
+        http = Request(self.url, data,
+                       {"Content-Type": "application/json"})
+        with urlopen(http) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+
+def _result(response):
+    if "error" in response:
+        raise ServiceError(response["error"]["message"],
+                           response["error"]["code"])
+    return response["result"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m geosolver.service",
+        description="Run a local JSON-RPC solver service over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765,
+                        help="port to listen on (default 8765)")
+    parser.add_argument("--max-solvers", type=int, default=64,
+                        help="number of problems kept in the cache")
+    args = parser.parse_args(argv)
+    server = serve(args.host, args.port, args.max_solvers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
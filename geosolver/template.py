@@ -0,0 +1,58 @@
+"""Sub-assembly templates.
+
+A Template is a sub-problem, e.g. a bolt, a bracket or a truss cell, that
+is decomposed once. Instances of the template are added to a problem with
+GeometricProblem.add_instance, which renames the variables of the template.
+A GeometricSolver adds the plan of the template for each instance, by 
+cloning its clusters and methods (see ClusterSolver.add_instance), instead
+of searching for it. Only the clusters that result from an instance are 
+searched, to connect the instance to the rest of the problem. So the time
+spent on structural solving grows with the number of templates, rather than
+the number of instances.
+
+Example:
+
+    cell = GeometricProblem(dimension=3)
+    ... add points and constraints to cell
+    template = Template(cell)
+    for i in range(100):
+        mapping = dict([(var, (var, i)) for var in cell.prototype])
+        problem.add_instance(template, mapping)
+    solver = GeometricSolver(problem)    # searches every instance
+    problem.add_instance(template, ...)  # cloned from the template
+
+Instances are ordinary constraints, so they can be edited or removed like
+any other. The plan is only cloned when an instance is added to a problem
+with a solver; a new solver searches all constraints. The template problem
+should not be changed while it has instances being added.
+"""
+
+import copy
+
+from geosolver.geometric import GeometricSolver, ParametricConstraint
+from geosolver.notify import Notifier
+
+
+class Template:
+    """A sub-problem with its plan.
+    
+       instance attributes:
+        problem     - the GeometricProblem of the template
+        solver      - a GeometricSolver for problem
+    """
+
+    def __init__(self, problem):
+        self.problem = problem
+        self.solver = GeometricSolver(problem)
+
+    def copy_constraints(self, mapping):
+        """Return a dictionary mapping the constraints of the template to
+           copies, with the variables renamed by mapping."""
+        copies = {}
+        for con in self.problem.cg.constraints():
+            other = copy.copy(con)
+            if isinstance(con, ParametricConstraint):
+                Notifier.__init__(other)
+            other._variables = [mapping[var] for var in con.variables()]
+            copies[con] = other
+        return copies
@@ -7,7 +7,7 @@ from solvergui.includes import *
 from solvergui.parameters import Settings
 from solvergui.quaternion import *
 from solvergui.singleton import *
-# import geosolver
+import geosolver.prange
 from geosolver.geometric import GeometricCluster, GeometricProblem, FixConstraint, AngleConstraint, DistanceConstraint
 # import delaunay._qhull as qhull
 import delaunay.core as dcore
@@ -0,0 +1,12 @@
+"""The example problems of test.py, for the unit tests (test_*.py).
+
+test.py can not be imported as a module named test, which is a package of
+the standard library, so it is loaded from its file here."""
+
+import os
+import importlib.util
+
+_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test.py")
+_spec = importlib.util.spec_from_file_location("solvertest_examples", _path)
+examples = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(examples)
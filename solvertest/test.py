@@ -172,6 +172,30 @@ def overconstrained_tetra():
     problem.add_constraint(AngleConstraint('v1', 'v2', 'v3', math.pi/4.0))
     return problem
 
+def octahedron_problem():
+    """An octahedral frame: rigid, but not decomposable into triangles, 
+       so it is solved only with the numeric fallback (see
+       GeometricSolver.set_numeric_fallback)"""
+    problem = GeometricProblem(dimension=3)
+    problem.add_point('a', vector([0.75, -0.08, -0.2]))
+    problem.add_point('b', vector([-0.81, 0.21, -0.15]))
+    problem.add_point('c', vector([-0.17, 0.72, 0.11]))
+    problem.add_point('d', vector([0.3, -0.92, 0.18]))
+    problem.add_point('e', vector([0.22, 0.01, 0.92]))
+    problem.add_point('f', vector([0.26, 0.0, -0.76]))
+    # the distances of another octahedron
+    points = {'a': vector([1.22, -0.08, 0.26]), 
+              'b': vector([-0.76, -0.05, 0.23]),
+              'c': vector([-0.2, 0.81, -0.16]), 
+              'd': vector([-0.19, -1.2, 0.01]),
+              'e': vector([-0.08, 0.01, 1.04]), 
+              'f': vector([0.3, -0.03, -1.05])}
+    for (v, w) in ['ac', 'ad', 'ae', 'af', 'bc', 'bd', 'be', 'bf', 
+                   'ce', 'cf', 'de', 'df']:
+        problem.add_constraint(DistanceConstraint(v, w,
+            distance_2p(points[v], points[w])))
+    return problem
+
 # -------- 2D problems
 
 
@@ -0,0 +1,78 @@
+"""Unit tests for solving from asyncio code (geosolver.asyncsolve).
+
+Run from the root of the distribution with:
+    python -m pytest solvertest
+"""
+
+import time
+import random
+import asyncio
+import unittest
+
+from geosolver.asyncsolve import solve_async
+from geosolver.geometric import GeometricSolver
+from geosolver.randomproblem import random_distance_problem_3D
+from examples import examples
+
+
+def _solvers(listeners):
+    return [l for l in listeners if isinstance(l, GeometricSolver)]
+
+
+class SolveAsyncTest(unittest.TestCase):
+
+    def test_solve(self):
+        problem = examples.double_tetrahedron_problem()
+
+        async def solve():
+            return await solve_async(problem)
+
+        solver = asyncio.run(solve())
+        result = solver.get_result()
+        self.assertEqual(result.flag, result.OK)
+        for solution in result.solutions:
+            self.assertTrue(problem.verify(solution))
+
+    def test_progress(self):
+        random.seed(1)
+        problem = random_distance_problem_3D(10, 10.0, 0.0)
+
+        async def solve():
+            task = solve_async(problem, interval=0.0)
+            reports = [report async for report in task.progress()]
+            return (await task, reports)
+
+        (solver, reports) = asyncio.run(solve())
+        self.assertTrue(len(reports) > 1)
+        self.assertEqual(reports[-1].merges, solver.dr.merge_count())
+        self.assertEqual(reports[-1].toplevel, len(solver.dr.top_level()))
+
+    def test_cancel(self):
+        random.seed(1)
+        problem = random_distance_problem_3D(40, 10.0, 0.0)
+
+        async def solve():
+            task = solve_async(problem)
+            waiting = asyncio.ensure_future(task._result())
+            await asyncio.sleep(0.2)
+            waiting.cancel()
+            start = time.time()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            # the solver stops at its next step
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertTrue(task.cancelled())
+            self.assertTrue(task.done())
+            elapsed = time.time() - start
+            # while the task (and its exception) is kept
+            self.assertEqual(_solvers(problem.listeners), [])
+            self.assertEqual(_solvers(problem.cg.listeners), [])
+            return elapsed
+
+        elapsed = asyncio.run(solve())
+        self.assertTrue(elapsed < 0.5, elapsed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""Unit tests for solving many problems from the command line
+(geosolver.batch).
+
+Run from the root of the distribution with:
+    python -m pytest solvertest
+"""
+
+import os
+import io as stdio
+import json
+import random
+import shutil
+import tempfile
+import unittest
+
+from geosolver import io
+from geosolver.batch import solve_all, read_records, main
+from geosolver.geometric import GeometricSolver
+from geosolver.randomproblem import random_distance_problem_3D
+from examples import examples
+
+
+def _problems():
+    return [examples.double_tetrahedron_problem(),
+            examples.double_banana_problem(),
+            examples.double_tetrahedron_problem()]
+
+
+def _results(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _check(self, results, problems):
+        for result in results:
+            problem = problems[result["index"]]
+            solver = GeometricSolver(problem)
+            cluster = solver.get_result()
+            self.assertEqual(result["status"], "ok")
+            self.assertEqual(result["flag"], cluster.flag)
+            self.assertEqual(result["constrainedness"],
+                             solver.get_constrainedness())
+            self.assertEqual(len(result["solutions"]),
+                             len(cluster.solutions))
+            variables = result["variables"]
+            for coordinates in result["solutions"]:
+                solution = io._solution(variables, coordinates)
+                self.assertTrue(problem.verify(solution))
+
+    def test_solve_all(self):
+        problems = _problems()
+        stream = stdio.StringIO()
+        io.write_json(stream, problems)
+        records = read_records(stdio.BufferedReader(
+            stdio.BytesIO(stream.getvalue().encode("utf-8"))))
+        output = stdio.StringIO()
+        count = solve_all(records, output, jobs=2, window=1)
+        self.assertEqual(count, len(problems))
+        results = _results(output.getvalue())
+        self.assertEqual([r["index"] for r in results],
+                         list(range(len(problems))))
+        self._check(results, problems)
+
+    def test_json(self):
+        problems = _problems()
+        io.save(self._path("problems.jsonl"), problems)
+        self.assertEqual(main([self._path("problems.jsonl"),
+                               "-o", self._path("results.jsonl"),
+                               "-j", "2"]), 0)
+        with open(self._path("results.jsonl")) as f:
+            results = _results(f.read())
+        self.assertEqual([r["index"] for r in results],
+                         list(range(len(problems))))
+        self._check(results, problems)
+
+    def test_binary(self):
+        problems = _problems()
+        io.save(self._path("problems.bin"), problems)
+        with open(self._path("problems.bin"), "rb") as f:
+            self.assertEqual(f.read(len(io.MAGIC)), io.MAGIC)
+        main([self._path("problems.bin"), "-o", self._path("results.jsonl"),
+              "-j", "2", "--unordered"])
+        with open(self._path("results.jsonl")) as f:
+            results = _results(f.read())
+        self.assertEqual(sorted(r["index"] for r in results),
+                         list(range(len(problems))))
+        self._check(results, problems)
+
+    def test_timeout_and_error(self):
+        random.seed(1)
+        slow = random_distance_problem_3D(150, 10.0, 0.0)
+        fast = examples.double_tetrahedron_problem()
+        with open(self._path("problems.jsonl"), "w") as f:
+            io.write_json(f, [fast, slow])
+            f.write("{not json\n")
+            io.write_json(f, [fast])
+        main([self._path("problems.jsonl"), "-o", self._path("results.jsonl"),
+              "-j", "2", "-t", "2.0"])
+        with open(self._path("results.jsonl")) as f:
+            results = _results(f.read())
+        self.assertEqual([r["index"] for r in results], [0, 1, 2, 3])
+        self.assertEqual([r["status"] for r in results],
+                         ["ok", "timeout", "error", "ok"])
+        self.assertTrue(results[2]["error"].startswith("JSONDecodeError"))
+        self._check([results[0], results[3]], [fast, slow, None, fast])
+
+
+if __name__ == "__main__":
+    unittest.main()
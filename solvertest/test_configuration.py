@@ -0,0 +1,70 @@
+"""Unit tests for Configuration and aligned_distance, in particular for 
+degenerate point sets: two points, collinear and coincident points."""
+
+import unittest
+
+from geosolver.configuration import Configuration
+from geosolver.clsolver import aligned_distance
+from geosolver.vector import vector
+from geosolver.intersections import distance_2p
+
+
+def _conf(points):
+    return Configuration(dict((var, vector(p)) for (var, p) in points.items()))
+
+
+class MergeTransformTest(unittest.TestCase):
+
+    def _check_aligned(self, reference, other):
+        transformed = other.transform(reference.merge_transform(other))
+        for var in reference.vars():
+            self.assertAlmostEqual(
+                distance_2p(transformed.get(var), reference.get(var)), 0.0)
+
+    def test_two_points(self):
+        reference = _conf({'a': [0.0, 0.0, 0.0], 'b': [0.0, 1.0, 0.0]})
+        for b in ([1.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, 0.0, -1.0],
+                  [0.0, -1.0, 0.0], [0.6, 0.0, 0.8]):
+            other = _conf({'a': [2.0, 3.0, 4.0], 
+                           'b': list(vector([2.0, 3.0, 4.0]) + vector(b))})
+            self._check_aligned(reference, other)
+
+    def test_collinear(self):
+        reference = _conf({'a': [0.0, 0.0, 0.0], 'b': [0.0, 0.0, 1.0], 
+                           'c': [0.0, 0.0, 2.0]})
+        other = _conf({'a': [1.0, 0.0, 0.0], 'b': [2.0, 0.0, 0.0], 
+                       'c': [3.0, 0.0, 0.0]})
+        t = reference.merge_transform(other)
+        self.assertTrue(t.underconstrained)
+        self._check_aligned(reference, other)
+
+    def test_collinear_first_three(self):
+        reference = _conf({'a': [0.0, 0.0, 0.0], 'b': [1.0, 0.0, 0.0], 
+                           'c': [2.0, 0.0, 0.0], 'd': [0.0, 1.0, 0.0]})
+        t = reference.merge_transform(reference)
+        self.assertFalse(t.underconstrained)
+        self._check_aligned(reference, reference)
+
+    def test_coincident(self):
+        reference = _conf({'a': [1.0, 1.0, 1.0], 'b': [1.0, 1.0, 1.0]})
+        other = _conf({'a': [0.0, 0.0, 0.0], 'b': [0.0, 0.0, 0.0]})
+        self._check_aligned(reference, other)
+
+
+class AlignedDistanceTest(unittest.TestCase):
+
+    def test_two_points(self):
+        reference = _conf({'a': [0.0, 0.0, 0.0], 'b': [0.0, 1.0, 0.0]})
+        conf = _conf({'a': [0.0, 0.0, 0.0], 'b': [3.0, 0.0, 0.0]})
+        self.assertAlmostEqual(aligned_distance(conf, reference), 2.0)
+
+    def test_collinear(self):
+        reference = _conf({'a': [0.0, 0.0, 0.0], 'b': [0.0, 0.0, 1.0], 
+                           'c': [0.0, 0.0, 2.0]})
+        conf = _conf({'a': [5.0, 0.0, 0.0], 'b': [6.0, 0.0, 0.0], 
+                      'c': [7.0, 0.0, 0.0]})
+        self.assertAlmostEqual(aligned_distance(conf, reference), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
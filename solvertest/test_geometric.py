@@ -0,0 +1,360 @@
+"""Unit tests for GeometricProblem and GeometricSolver.
+
+Run from the root of the distribution with:
+    python -m pytest solvertest
+"""
+
+import time
+import random
+import unittest
+
+from geosolver.geometric import GeometricProblem, GeometricSolver, \
+    DistanceConstraint, FixConstraint, RigidConstraint
+from geosolver.vector import vector
+from geosolver.intersections import distance_2p
+from geosolver.selconstr import FunctionConstraint
+from geosolver.clsolver import PrototypeMethod
+from geosolver.multimethod import MultiMethod
+from geosolver.cluster import Distance
+from geosolver.intersections import is_right_handed
+from geosolver.randomproblem import random_distance_problem_3D
+from examples import examples
+
+
+def _points_of(problem):
+    """a new problem with the points of problem, without constraints"""
+    other = GeometricProblem(problem.dimension)
+    for var in problem.prototype:
+        other.add_point(var, problem.get_point(var))
+    return other
+
+
+class SelectionConstraintTest(unittest.TestCase):
+
+    def test_add_and_remove_with_solver(self):
+        problem = examples.double_tetrahedron_problem()
+        solver = GeometricSolver(problem)
+        con = FunctionConstraint(is_right_handed, ['v1', 'v2', 'v3', 'v4'])
+        problem.add_constraint(con)
+        self.assertTrue(con in problem.cg.constraints())
+        self.assertEqual(solver.get_constrainedness(), "well-constrained")
+        problem.rem_constraint(con)
+        self.assertFalse(con in problem.cg.constraints())
+
+    def test_bulk_add_and_remove_with_solver(self):
+        problem = examples.double_tetrahedron_problem()
+        solver = GeometricSolver(problem)
+        cons = [FunctionConstraint(is_right_handed, 
+                                   ['v1', 'v2', 'v3', 'v4'])]
+        problem.add_constraints(cons)
+        problem.rem_constraints(cons)
+        self.assertEqual(solver.get_constrainedness(), "well-constrained")
+
+
+class BatchedChangesTest(unittest.TestCase):
+    """Changes in an update or by add_constraints must be solved as fast
+       as the same changes one by one, with the same decomposition."""
+
+    def _add(self, source, mode):
+        problem = _points_of(source)
+        solver = GeometricSolver(problem)
+        cons = list(source.cg.constraints())
+        start = time.time()
+        if mode == "single":
+            for con in cons:
+                problem.add_constraint(con)
+        elif mode == "bulk":
+            problem.add_constraints(cons)
+        else:
+            with problem.update():
+                for con in cons:
+                    problem.add_constraint(con)
+        return (time.time() - start, solver)
+
+    def test_timing(self):
+        random.seed(30)
+        source = random_distance_problem_3D(30, 10.0, 0.0)
+        (single, expected) = self._add(source, "single")
+        for mode in ("bulk", "update"):
+            (elapsed, solver) = self._add(source, mode)
+            self.assertEqual(len(solver.dr.methods()), 
+                             len(expected.dr.methods()))
+            self.assertEqual(solver.get_constrainedness(),
+                             expected.get_constrainedness())
+            self.assertTrue(elapsed < 2.0 * single + 0.5,
+                            "%s took %.2fs, one by one %.2fs" 
+                            % (mode, elapsed, single))
+
+    def test_bulk_remove(self):
+        random.seed(20)
+        source = random_distance_problem_3D(20, 10.0, 0.0)
+        (elapsed, solver) = self._add(source, "bulk")
+        problem = solver.problem
+        cons = list(problem.cg.constraints())[:10]
+        problem.rem_constraints(cons)
+        fresh = GeometricSolver(problem)
+        self.assertEqual(solver.get_constrainedness(),
+                         fresh.get_constrainedness())
+        self.assertEqual(len(solver.dr.top_level()), 
+                         len(fresh.dr.top_level()))
+
+    def test_rollback(self):
+        problem = examples.double_tetrahedron_problem()
+        GeometricSolver(problem)
+        count = len(problem.cg.constraints())
+        new = DistanceConstraint('v4', 'v5', 1.0)
+        self.assertRaises(Exception, problem.add_constraints,
+                          [new, DistanceConstraint('v1', 'v2', 1.0)])
+        self.assertEqual(len(problem.cg.constraints()), count)
+        self.assertTrue(problem.get_distance('v4', 'v5') is None)
+
+
+class RankingTest(unittest.TestCase):
+
+    def test_examples(self):
+        for make in (examples.double_tetrahedron_problem,
+                     examples.dad_tetrahedron_problem):
+            for options in ({"max_solutions": 1}, {"max_solutions": 3},
+                            {"rank_by": "prototype"}, 
+                            {"rank_by": "previous"}):
+                problem = make()
+                solver = GeometricSolver(problem)
+                result = solver.get_result(**options)
+                self.assertTrue(len(result.solutions) > 0)
+                for solution in result.solutions:
+                    self.assertTrue(problem.verify(solution))
+
+    def test_unchanged_setting_is_not_applied_again(self):
+        problem = examples.double_tetrahedron_problem()
+        solver = GeometricSolver(problem)
+        solver.get_result(max_solutions=1)
+        executed = []
+        mg = solver.dr._mg
+        execute = mg._execute
+        mg._execute = lambda met: (executed.append(met), execute(met))
+        solver.get_result(max_solutions=1)
+        solver.get_result(rank_by="prototype")
+        self.assertEqual(executed, [])
+        solver.get_result(max_solutions=2)
+        self.assertTrue(len(executed) > 0)
+
+
+class FixConstraintTest(unittest.TestCase):
+
+    def setUp(self):
+        # a solution of the double tetrahedron, moved away from the origin
+        problem = examples.double_tetrahedron_problem()
+        solution = GeometricSolver(problem).get_result().solutions[0]
+        offset = vector([3.0, -2.0, 5.0])
+        self.positions = dict((var, solution[var] + offset) 
+                              for var in solution)
+
+    def _check(self, problem, solver, fixed):
+        for result in (solver.get_result(), solver.get_result(lazy=True)):
+            self.assertTrue(len(result.solutions) > 0)
+            for solution in result.solutions:
+                self.assertTrue(problem.verify(solution))
+                for var in fixed:
+                    self.assertAlmostEqual(
+                        distance_2p(solution[var], self.positions[var]), 0.0)
+
+    def test_two_fixed_points(self):
+        for fixed in (['v4', 'v5'], ['v1', 'v2']):
+            problem = examples.double_tetrahedron_problem()
+            solver = GeometricSolver(problem)
+            for var in fixed:
+                problem.add_constraint(FixConstraint(var, 
+                                                     self.positions[var]))
+            self._check(problem, solver, fixed)
+
+    def test_remove_one_of_three(self):
+        problem = examples.double_tetrahedron_problem()
+        solver = GeometricSolver(problem)
+        fixes = [FixConstraint(var, self.positions[var]) 
+                 for var in ['v1', 'v2', 'v3']]
+        for con in fixes:
+            problem.add_constraint(con)
+        self._check(problem, solver, ['v1', 'v2', 'v3'])
+        problem.rem_constraint(fixes[2])
+        self._check(problem, solver, ['v1', 'v2'])
+
+    def test_collinear_fixed_points(self):
+        problem = GeometricProblem(3)
+        # any other point would be free to rotate about the line
+        points = {'a': [0.0, 0.0, 0.0], 'b': [1.0, 0.0, 0.0], 
+                  'c': [2.0, 0.0, 0.0]}
+        for (var, point) in points.items():
+            problem.add_point(var, vector(point))
+        for (a, b) in (('a', 'b'), ('b', 'c'), ('a', 'c')):
+            problem.add_constraint(DistanceConstraint(a, b, 
+                distance_2p(problem.get_point(a), problem.get_point(b))))
+        solver = GeometricSolver(problem)
+        self.positions = {}
+        for var in ('a', 'b', 'c'):
+            self.positions[var] = problem.get_point(var) + vector([5.0] * 3)
+            problem.add_constraint(FixConstraint(var, self.positions[var]))
+        self.assertEqual(solver.get_constrainedness(), "well-constrained")
+        self._check(problem, solver, ['a', 'b', 'c'])
+
+
+def _bound_to(function, solver):
+    """True iff a ranking function refers to the given ClusterSolver"""
+    if getattr(function, "__self__", None) is solver:
+        return True
+    cells = function.__closure__ or ()
+    return solver in [cell.cell_contents for cell in cells]
+
+
+class ForkTest(unittest.TestCase):
+    """Snapshots must not share the state of methods with their solver"""
+
+    def test_tracking_state(self):
+        problem = examples.double_tetrahedron_problem()
+        solver = GeometricSolver(problem)
+        solver.set_tracking(0.5)
+        solver.get_result()
+        mg = solver.dr._mg
+        selectors = [m for m in solver.dr.methods() 
+                     if isinstance(m, PrototypeMethod)]
+        self.assertTrue(len(selectors) > 0)
+        before = [mg.get_attribute(m, "previous") for m in selectors]
+        fork = solver.fork()
+        fork.problem.get_distance('v1', 'v4').set_parameter(10.2)
+        fork.get_result()
+        changed = [fork.dr._mg.get_attribute(m, "previous") 
+                   for m in selectors]
+        fork.drop()
+        after = [mg.get_attribute(m, "previous") for m in selectors]
+        for i in range(len(selectors)):
+            self.assertTrue(after[i] is before[i])
+            self.assertFalse(changed[i] is before[i])
+
+    def test_max_solutions(self):
+        problem = examples.double_tetrahedron_problem()
+        solver = GeometricSolver(problem)
+        fork = solver.fork()
+        solver.set_max_solutions(1)
+        methods = [m for m in fork.dr.methods() 
+                   if isinstance(m, MultiMethod)]
+        for method in methods:
+            self.assertEqual(
+                fork.dr._mg.get_attribute(method, "max_values"), None)
+            self.assertEqual(
+                solver.dr._mg.get_attribute(method, "max_values"), 1)
+        other = solver.fork()
+        for method in methods:
+            rank = other.dr._mg.get_attribute(method, "rank")
+            self.assertTrue(_bound_to(rank, other.dr))
+        other.problem.get_distance('v1', 'v4').set_parameter(10.2)
+        other.commit()
+        for method in methods:
+            rank = solver.dr._mg.get_attribute(method, "rank")
+            self.assertTrue(_bound_to(rank, solver.dr))
+        for solution in solver.get_result().solutions:
+            self.assertTrue(problem.verify(solution))
+
+
+class RigidConstraintTest(unittest.TestCase):
+    """RigidConstraint.satisfied on degenerate and mirrored parts"""
+
+    def test_two_points(self):
+        con = RigidConstraint(['a', 'b'], [(0, 0, 0), (0, 1, 0)])
+        self.assertTrue(con.satisfied({'a': vector([0.0, 0.0, 0.0]),
+                                       'b': vector([1.0, 0.0, 0.0])}))
+        self.assertFalse(con.satisfied({'a': vector([0.0, 0.0, 0.0]),
+                                        'b': vector([2.0, 0.0, 0.0])}))
+
+    def test_collinear(self):
+        con = RigidConstraint(['a', 'b', 'c'],
+                              [(0, 0, 0), (0, 1, 0), (0, 2, 0)])
+        self.assertTrue(con.satisfied({'a': vector([1.0, 0.0, 0.0]),
+                                       'b': vector([1.0, 0.0, 1.0]),
+                                       'c': vector([1.0, 0.0, 2.0])}))
+        self.assertFalse(con.satisfied({'a': vector([1.0, 0.0, 0.0]),
+                                        'b': vector([1.0, 0.0, 1.0]),
+                                        'c': vector([1.0, 1.0, 1.0])}))
+
+    def test_mirrored(self):
+        coordinates = [(0, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, 1)]
+        con = RigidConstraint(['a', 'b', 'c', 'd'], coordinates)
+        moved = [(5, 0, 0), (5, 1, 0), (5, 0, 1), (6, 0, 0)]
+        mirrored = [(0, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, -1)]
+        self.assertTrue(con.satisfied(
+            dict(zip('abcd', [vector(p) for p in moved]))))
+        self.assertFalse(con.satisfied(
+            dict(zip('abcd', [vector(p) for p in mirrored]))))
+
+    def test_verify(self):
+        problem = GeometricProblem(dimension=3)
+        points = [(0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (2.0, 0.0, 0.0)]
+        for (name, point) in zip('abc', points):
+            problem.add_point(name, vector(point))
+        problem.add_constraint(RigidConstraint(['a', 'b', 'c'], points))
+        problem.add_constraint(RigidConstraint(['a', 'b'], points[:2]))
+        solution = dict((name, vector(point))
+                        for (name, point) in zip('abc', points))
+        self.assertTrue(problem.verify(solution))
+
+
+class ResultTest(unittest.TestCase):
+    """get_result returns results that later changes do not affect"""
+
+    def test_fresh_result(self):
+        problem = examples.double_tetrahedron_problem()
+        solver = GeometricSolver(problem)
+        result = solver.get_result()
+        solution = result.solutions[0]
+        problem.get_distance('v1', 'v2').set_parameter(12.0)
+        changed = solver.get_result()
+        self.assertFalse(changed is result)
+        self.assertTrue(result.solutions[0] is solution)
+        self.assertAlmostEqual(
+            distance_2p(solution['v1'], solution['v2']), 10.0)
+        solution = changed.solutions[0]
+        self.assertAlmostEqual(
+            distance_2p(solution['v1'], solution['v2']), 12.0)
+        again = solver.get_result()
+        self.assertFalse(again is changed)
+        self.assertFalse(again.subs is changed.subs)
+        for (sub, other) in zip(again.subs, changed.subs):
+            self.assertFalse(sub is other)
+            self.assertEqual(sub.solutions, other.solutions)
+
+
+class SourcesTest(unittest.TestCase):
+    """ClusterSolver3D._all_sources_constraint_in_cluster"""
+
+    def test_sources(self):
+        solver = GeometricSolver(examples.double_tetrahedron_problem())
+        [top] = solver._top_level_rigids()
+        sources = solver.dr._all_sources_constraint_in_cluster(
+            Distance('v1', 'v2'), top)
+        self.assertTrue(len(sources) > 0)
+        for source in sources:
+            self.assertTrue(solver.dr._is_atomic(source))
+            self.assertTrue('v1' in source.vars and 'v2' in source.vars)
+
+
+class LazyRefinementTest(unittest.TestCase):
+    """lazy and eager results agree on refined over-constrained clusters"""
+
+    def test_refined(self):
+        problem = examples.double_tetrahedron_problem()
+        problem.add_constraint(DistanceConstraint('v4', 'v5', 5.0))
+        solver = GeometricSolver(problem)
+        solver.set_refinement(True)
+        eager = solver.get_result()
+        lazy = solver.get_result(lazy=True)
+        self.assertEqual(lazy.flag, eager.flag)
+        self.assertTrue(eager.residual is not None)
+        self.assertAlmostEqual(lazy.residual, eager.residual)
+        self.assertEqual(len(lazy.solutions), len(eager.solutions))
+        for (a, b) in zip(lazy.solutions, eager.solutions):
+            for var in eager.variables:
+                self.assertAlmostEqual(distance_2p(a[var], b[var]), 0.0)
+        for sub in lazy.subs:
+            self.assertEqual(sub.residual, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Unit tests for reading and writing problems (geosolver.io).
+
+Run from the root of the distribution with:
+    python -m pytest solvertest
+"""
+
+import io as stdio
+import unittest
+
+from geosolver import io
+from geosolver.geometric import GeometricProblem, GeometricSolver, \
+    DistanceConstraint, AngleConstraint, FixConstraint
+from geosolver.selconstr import FunctionConstraint, NotClockwiseConstraint, \
+    fnot
+from geosolver.intersections import is_right_handed, is_left_handed
+from geosolver.vector import vector
+from examples import examples
+
+
+def _problem_2D():
+    problem = GeometricProblem(dimension=2)
+    problem.add_point('a', vector([0.0, 0.0]))
+    problem.add_point(('b', 1), vector([1.0, 0.0]))
+    problem.add_point('c', vector([0.0, 1.0]))
+    problem.add_constraint(DistanceConstraint('a', ('b', 1), 1.0))
+    problem.add_constraint(AngleConstraint(('b', 1), 'a', 'c', 1.5))
+    problem.add_constraint(FixConstraint('a', vector([0.0, 0.0])))
+    problem.add_constraint(NotClockwiseConstraint('a', ('b', 1), 'c'))
+    return problem
+
+
+def _problem_3D():
+    problem = examples.double_tetrahedron_problem()
+    problem.add_constraint(FunctionConstraint(
+        is_right_handed, ['v1', 'v2', 'v3', 'v4']))
+    problem.add_constraint(FunctionConstraint(
+        fnot(is_left_handed), ['v1', 'v2', 'v3', 'v5']))
+    return problem
+
+
+def _records():
+    problem = _problem_3D()
+    solutions = GeometricSolver(problem).get_result().solutions
+    return [_problem_2D(), (problem, None), (problem, []),
+            (problem, solutions)]
+
+
+def _json(records):
+    stream = stdio.StringIO()
+    io.write_json(stream, records)
+    stream.seek(0)
+    return list(io.read_json(stream))
+
+
+def _binary(records):
+    stream = stdio.BytesIO()
+    io.write_binary(stream, records, block_size=3)
+    stream.seek(0)
+    return list(io.read_binary(stream))
+
+
+class RoundTripTest(unittest.TestCase):
+
+    def _check(self, read):
+        records = list(io._records(_records()))
+        result = read(records)
+        self.assertEqual(len(result), len(records))
+        for ((problem, solutions), (other, others)) in zip(records, result):
+            self.assertEqual(io.problem_to_dict(other, others),
+                             io.problem_to_dict(problem, solutions))
+            if solutions is None:
+                self.assertTrue(others is None)
+            else:
+                self.assertEqual(len(others), len(solutions))
+
+    def test_json(self):
+        self._check(_json)
+
+    def test_binary(self):
+        self._check(_binary)
+
+    def test_same(self):
+        records = _records()
+        for ((a, sa), (b, sb)) in zip(_json(records), _binary(records)):
+            self.assertEqual(io.problem_to_dict(a, sa),
+                             io.problem_to_dict(b, sb))
+
+
+if __name__ == "__main__":
+    unittest.main()
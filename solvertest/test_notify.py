@@ -0,0 +1,145 @@
+"""Unit tests for notification (geosolver.notify) and batched messages
+of graphs.
+
+Run from the root of the distribution with:
+    python -m pytest solvertest
+"""
+
+import gc
+import unittest
+from unittest import mock
+
+from geosolver.notify import Notifier, Listener
+from geosolver.graph import Graph, FanGraph
+
+
+class Recorder(Listener):
+    """a listener that records received messages and batches"""
+
+    def __init__(self):
+        Listener.__init__(self)
+        self.messages = []
+        self.batches = []
+
+    def receive_notify(self, source, message):
+        self.messages.append(message)
+
+    def receive_batch(self, source, messages):
+        self.batches.append(list(messages))
+        Listener.receive_batch(self, source, messages)
+
+
+class NotifyTest(unittest.TestCase):
+
+    def test_listener(self):
+        notifier = Notifier()
+        listener = Recorder()
+        self.assertFalse(notifier.observed)
+        listener.add_notifier(notifier)
+        self.assertTrue(notifier.observed)
+        notifier.send_notify(("a", 1))
+        self.assertEqual(listener.messages, [("a", 1)])
+        self.assertTrue(notifier in listener.notifiers)
+        listener.rem_notifier(notifier)
+        self.assertFalse(notifier.observed)
+        notifier.send_notify(("a", 2))
+        self.assertEqual(listener.messages, [("a", 1)])
+
+    def test_subscribe(self):
+        notifier = Notifier()
+        received = []
+        all_ = []
+        callback = lambda source, messages: received.extend(messages)
+        notifier.subscribe(callback, "a", "b")
+        notifier.subscribe(lambda source, messages: all_.extend(messages))
+        for message in [("a", 1), ("c", 2), ("b", 3)]:
+            notifier.send_notify(message)
+        self.assertEqual(received, [("a", 1), ("b", 3)])
+        self.assertEqual(all_, [("a", 1), ("c", 2), ("b", 3)])
+        notifier.unsubscribe(callback)
+        notifier.send_notify(("a", 4))
+        self.assertEqual(received, [("a", 1), ("b", 3)])
+
+    def test_batch(self):
+        notifier = Notifier()
+        listener = Recorder()
+        calls = []
+        notifier.add_listener(listener)
+        notifier.subscribe(lambda source, messages: calls.append(messages),
+                           "a")
+        with notifier.notify_batch():
+            notifier.send_notify(("a", 1))
+            notifier.send_notify(("b", 2))
+            notifier.send_notify(("a", 3))
+            self.assertEqual(listener.messages, [])
+        self.assertEqual(listener.batches, [[("a", 1), ("b", 2), ("a", 3)]])
+        self.assertEqual(listener.messages, [("a", 1), ("b", 2), ("a", 3)])
+        self.assertEqual(calls, [[("a", 1), ("a", 3)]])
+        # empty batches deliver nothing
+        with notifier.notify_batch():
+            pass
+        self.assertEqual(len(listener.batches), 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_nested_batches(self):
+        notifier = Notifier()
+        listener = Recorder()
+        notifier.add_listener(listener)
+        notifier.begin_notify_batch()
+        notifier.send_notify(("a", 1))
+        notifier.begin_notify_batch()
+        notifier.send_notify(("a", 2))
+        notifier.end_notify_batch()
+        self.assertEqual(listener.messages, [])
+        notifier.end_notify_batch()
+        self.assertEqual(listener.batches, [[("a", 1), ("a", 2)]])
+        self.assertRaises(Exception, notifier.end_notify_batch)
+        notifier.send_notify(("a", 3))
+        self.assertEqual(listener.messages[-1], ("a", 3))
+
+    def test_observed(self):
+        notifier = Notifier()
+        callback = lambda source, messages: None
+        notifier.subscribe(callback)
+        self.assertTrue(notifier.observed)
+        notifier.unsubscribe(callback)
+        self.assertFalse(notifier.observed)
+        listener = Recorder()
+        notifier.add_listener(listener)
+        self.assertTrue(notifier.observed)
+        del listener
+        gc.collect()
+        notifier.send_notify(("a", 1))
+        self.assertFalse(notifier.observed)
+
+
+class GraphBatchTest(unittest.TestCase):
+
+    def _check(self, graph):
+        listener = Recorder()
+        graph.add_listener(listener)
+        graph.add_edge('a', 'b')
+        graph.add_edge('b', 'c')
+        listener.batches = []
+        graph.rem_vertex('b')
+        self.assertEqual(len(listener.batches), 1)
+        self.assertEqual(listener.batches[0][-1], ("rem_vertex", 'b'))
+        # a failing removal closes the batch
+        graph.add_edge('a', 'b')
+        with mock.patch.object(graph, "rem_edge", side_effect=KeyError):
+            self.assertRaises(KeyError, graph.rem_vertex, 'b')
+        self.assertEqual(graph._batches, 0)
+        listener.messages = []
+        graph.add_edge('c', 'd')
+        self.assertTrue(len(listener.messages) > 0)
+        self.assertEqual(listener.messages[-1][0], "add_edge")
+
+    def test_graph(self):
+        self._check(Graph())
+
+    def test_fangraph(self):
+        self._check(FanGraph())
+
+
+if __name__ == "__main__":
+    unittest.main()
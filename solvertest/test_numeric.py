@@ -0,0 +1,92 @@
+"""Unit tests for the numeric fallback of GeometricSolver (NumericMerge).
+
+Run from the root of the distribution with:
+    python -m pytest solvertest
+"""
+
+import unittest
+from unittest import mock
+
+from geosolver.geometric import GeometricSolver, GeometricCluster
+from geosolver.clsolver import NumericMerge
+from geosolver.vector import vector
+from examples import examples
+
+
+def _merges(solver):
+    return [m for m in solver.dr.methods() if isinstance(m, NumericMerge)]
+
+
+class NumericFallbackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.problem = examples.octahedron_problem()
+        self.solver = GeometricSolver(self.problem)
+
+    def _check_solved(self):
+        result = self.solver.get_result()
+        self.assertEqual(result.flag, GeometricCluster.OK)
+        self.assertEqual(len(result.solutions), 1)
+        self.assertTrue(self.problem.verify(result.solutions[0]))
+        self.assertEqual(len(_merges(self.solver)), 1)
+
+    def test_fallback(self):
+        self.assertEqual(self.solver.get_constrainedness(),
+                         "under-constrained")
+        self.assertEqual(self.solver.get_result().flag,
+                         GeometricCluster.S_UNDER)
+        self.solver.set_numeric_fallback(True)
+        self.assertEqual(self.solver.get_constrainedness(),
+                         "well-constrained")
+        self._check_solved()
+
+    def test_parameter_and_point(self):
+        self.solver.set_numeric_fallback(True)
+        distance = self.problem.get_distance('a', 'c')
+        distance.set_parameter(distance.get_parameter() * 1.05)
+        self._check_solved()
+        # far from the solution, the prototype alone does not converge
+        self.problem.set_point('b', vector([5.0, 5.0, 5.0]))
+        self._check_solved()
+
+    def test_structural_changes(self):
+        self.solver.set_numeric_fallback(True)
+        self.problem.set_point('b', vector([5.0, 5.0, 5.0]))
+        distance = self.problem.get_distance('a', 'c')
+        self.problem.rem_constraint(distance)
+        self.assertEqual(_merges(self.solver), [])
+        self.assertEqual(self.solver.get_result().flag,
+                         GeometricCluster.S_UNDER)
+        self.problem.add_constraint(distance)
+        self._check_solved()
+
+    def test_not_converged(self):
+        self.solver.set_numeric_fallback(True)
+        self._check_solved()
+        distance = self.problem.get_distance('a', 'c')
+        failed = mock.Mock(return_value=({}, 1.0))
+        with mock.patch("geosolver.refine.place_bodies", failed):
+            distance.set_parameter(distance.get_parameter())
+            result = self.solver.get_result()
+            self.assertEqual(result.flag, GeometricCluster.UNSOLVED)
+            self.assertEqual(len(result.solutions), 0)
+            self.assertEqual(self.solver.get_result(lazy=True).flag,
+                             GeometricCluster.UNSOLVED)
+        # from the prototype, the previous solution and the restarts
+        self.assertEqual(failed.call_count, 2 + NumericMerge.restarts)
+        distance.set_parameter(distance.get_parameter())
+        self._check_solved()
+
+    def test_off(self):
+        self.solver.set_numeric_fallback(True)
+        self._check_solved()
+        self.solver.set_numeric_fallback(False)
+        self.assertEqual(_merges(self.solver), [])
+        self.assertEqual(self.solver.get_constrainedness(),
+                         "under-constrained")
+        self.assertEqual(self.solver.get_result().flag,
+                         GeometricCluster.S_UNDER)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Unit tests for parameter ranges (geosolver.prange).
+
+Run from the root of the distribution with:
+    python -m pytest solvertest
+"""
+
+import math
+import unittest
+
+from geosolver.geometric import GeometricSolver
+from geosolver.prange import sample_prange
+from examples import examples
+
+
+class ParameterRangeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.problem = examples.double_tetrahedron_problem()
+        self.constraint = self.problem.get_distance('v1', 'v2')
+
+    def test_intervals(self):
+        # feasible while the circumradius of v1 v2 v3 is at most 10
+        prange = sample_prange(self.problem, self.constraint,
+                               1.0, 30.0, 1.0)
+        self.assertEqual(len(prange.intervals), 1)
+        interval = prange.intervals[0]
+        self.assertEqual(interval.left_value(), 1.0)
+        # close to the bound, solving may fail numerically
+        bound = 10 * math.sqrt(3)
+        self.assertTrue(bound - 0.01 <= interval.right_value()
+                        <= bound + 1.0 / 1024)
+        self.assertTrue(prange.contains(10.0))
+        self.assertFalse(prange.contains(20.0))
+
+    def test_samples(self):
+        prange = sample_prange(self.problem, self.constraint,
+                               0.0, 30.0, 1.0)
+        self.assertEqual([value for (value, count) in prange.samples],
+                         [float(i) for i in range(31)])
+        for (value, count) in prange.samples:
+            if 0.0 < value < 10 * math.sqrt(3):
+                self.assertEqual(count, 1)
+            else:
+                self.assertEqual(count, 0)
+        prange = sample_prange(self.problem, self.constraint,
+                               0.0, 2.5, 1.0)
+        self.assertEqual([value for (value, count) in prange.samples],
+                         [0.0, 1.0, 2.0, 2.5])
+
+    def test_zero(self):
+        # a zero distance is degenerate, and makes a merge fail
+        prange = sample_prange(self.problem, self.constraint,
+                               0.0, 30.0, 1.0)
+        self.assertEqual(prange.samples[0], (0.0, 0))
+        self.assertEqual(len(prange.intervals), 1)
+        self.assertTrue(0.0 < prange.intervals[0].left_value() <= 1.0)
+
+    def test_problem_unchanged(self):
+        solver = GeometricSolver(self.problem)
+        before = solver.get_result().solutions[0]
+        messages = []
+        self.constraint.subscribe(lambda source, sent: messages.extend(sent))
+        sample_prange(self.problem, self.constraint, 0.0, 30.0, 1.0)
+        self.assertEqual(messages, [])
+        self.assertEqual(self.constraint.get_parameter(), 10.0)
+        result = solver.get_result()
+        self.assertEqual(result.flag, result.OK)
+        self.assertEqual(result.solutions[0], before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Unit tests for the solver service, driven by a ServiceClient.
+
+Run from the root of the distribution with:
+    python -m pytest solvertest
+"""
+
+import threading
+import unittest
+
+from geosolver import io
+from geosolver.service import serve, ServiceClient
+from geosolver.intersections import distance_2p, is_right_handed
+from geosolver.selconstr import FunctionConstraint
+from geosolver.vector import vector
+from examples import examples
+
+
+def _distance(result, a, b):
+    """distance between variables a and b in the first solution"""
+    solution = result["solutions"][0]
+    variables = result["variables"]
+    return distance_2p(vector(solution[variables.index(a)]),
+                       vector(solution[variables.index(b)]))
+
+
+class ServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = serve()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        (host, port) = self.server.server_address[:2]
+        self.client = ServiceClient("http://%s:%d/" % (host, port))
+        self.other = ServiceClient("http://%s:%d/" % (host, port))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_clients_do_not_share_problems(self):
+        data = io.problem_to_dict(examples.double_tetrahedron_problem())
+        a = self.client.open(data)
+        b = self.other.open(data)
+        self.assertNotEqual(a, b)
+        self.assertEqual(self.client.stats()["hits"], 1)
+        self.client.set_parameter(
+            a, {"type": "distance", "variables": ["v1", "v2"]}, 12.0)
+        self.assertAlmostEqual(
+            _distance(self.client.get_result(a), "v1", "v2"), 12.0)
+        self.assertAlmostEqual(
+            _distance(self.other.get_result(b), "v1", "v2"), 10.0)
+
+    def test_selection_constraints(self):
+        problem = examples.double_tetrahedron_problem()
+        plain = io.problem_to_dict(problem)
+        problem.add_constraint(FunctionConstraint(
+            is_right_handed, ['v1', 'v2', 'v3', 'v4']))
+        selected = io.problem_to_dict(problem)
+        a = self.client.open(selected)
+        b = self.other.open(plain)
+        self.assertEqual(self.client.stats()["misses"], 2)
+        problems = dict((id, self.server.service._cache[id][0])
+                        for id in (a, b))
+        self.assertEqual(len(list(problems[a].cg.constraints())), 10)
+        self.assertEqual(len(list(problems[b].cg.constraints())), 9)
+        self.other.add_constraint(b, {"type": "function",
+                                      "variables": ["v1", "v2", "v3", "v4"],
+                                      "function": "is_right_handed",
+                                      "negated": False})
+        self.assertEqual(len(list(problems[b].cg.constraints())), 10)
+        result = self.other.get_result(b)
+        self.assertEqual(result["flag"], "well constrained")
+        self.assertEqual(len(result["solutions"]), 1)
+
+    def test_max_solutions(self):
+        data = io.problem_to_dict(examples.double_tetrahedron_problem())
+        a = self.client.open(data)
+        b = self.other.open(data)
+        self.client.get_result(a, 1)
+        self.other.get_result(b)
+        c = self.other.open(data)
+        self.other.get_result(c)
+        solvers = self.server.service._cache
+        self.assertEqual(solvers[a][1]._max_solutions, 1)
+        self.assertEqual(solvers[b][1]._max_solutions, None)
+        self.assertEqual(solvers[c][1]._max_solutions, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""Unit tests for sub-assembly templates (geosolver.template) and
+ClusterSolver.add_instance.
+
+Run from the root of the distribution with:
+    python -m pytest solvertest
+"""
+
+import unittest
+
+from geosolver.geometric import GeometricProblem, GeometricSolver, \
+    DistanceConstraint
+from geosolver.template import Template
+from geosolver.clsolver import ClusterSolver
+from geosolver.clsolver2D import Merge1C
+from geosolver.cluster import Rigid
+from geosolver.intersections import distance_2p
+from geosolver.tolerance import tol_eq
+from examples import examples
+
+
+def _instances(problem, shared):
+    """add three instances of the double tetrahedron, stacked so that the
+       v5 of each instance is at the v4 of the previous one; if shared, it
+       is the same point, and the instance is fixed by distances between
+       the v1 and v2 points. The prototype is a solution."""
+    template = Template(examples.double_tetrahedron_problem())
+    solution = template.solver.get_result().solutions[0]
+    shift = solution['v4'] - solution['v5']
+    for i in range(3):
+        mapping = dict([(var, (var, i)) for var in template.problem.prototype])
+        if shared and i > 0:
+            mapping['v5'] = ('v4', i - 1)
+        prototype = dict([(var, solution[var] + shift * float(i))
+                          for var in solution])
+        problem.add_instance(template, mapping, prototype)
+    if shared:
+        for i in range(1, 3):
+            for (a, b) in [('v1', 'v1'), ('v1', 'v2'), ('v2', 'v1')]:
+                (p, q) = ((a, i), (b, i - 1))
+                problem.add_constraint(DistanceConstraint(p, q, distance_2p(
+                    problem.get_point(p), problem.get_point(q))))
+
+
+def _congruent(solution, other):
+    variables = list(solution)
+    for i in range(len(variables)):
+        for j in range(i + 1, len(variables)):
+            (a, b) = (variables[i], variables[j])
+            if not tol_eq(distance_2p(solution[a], solution[b]),
+                          distance_2p(other[a], other[b])):
+                return False
+    return True
+
+
+class TemplateTest(unittest.TestCase):
+
+    def _check(self, shared):
+        instanced = GeometricProblem(dimension=3)
+        solver = GeometricSolver(instanced)
+        _instances(instanced, shared)
+        searched = GeometricProblem(dimension=3)
+        _instances(searched, shared)
+        result = solver.get_result()
+        other = GeometricSolver(searched).get_result()
+        self.assertEqual(result.flag, other.flag)
+        self.assertEqual(len(result.solutions), len(other.solutions))
+        # solutions are equal up to a rigid transformation
+        for solution in result.solutions:
+            self.assertTrue(instanced.verify(solution))
+            self.assertTrue(True in [_congruent(solution, found)
+                                     for found in other.solutions])
+        return result
+
+    def test_instances(self):
+        result = self._check(False)
+        self.assertEqual(result.flag, result.S_UNDER)
+
+    def test_shared_points(self):
+        result = self._check(True)
+        self.assertEqual(result.flag, result.OK)
+        self.assertEqual(len(result.solutions), 1)
+
+    def test_redundant_merge(self):
+        # the output of the cloned merge is already in a top-level rigid
+        solver = ClusterSolver(2)
+        solver.begin_batch(True)
+        (a, b) = (Rigid(['x', 'y']), Rigid(['y', 'z']))
+        solver.add(a)
+        solver.add(b)
+        (ta, tb, out) = (Rigid(['p', 'q']), Rigid(['q', 'r']),
+                         Rigid(['p', 'q', 'r']))
+        variables = {'p': 'x', 'q': 'y', 'r': 'z'}
+        clusters = {ta: a, tb: b}
+        solver.add(Rigid(['x', 'y', 'z']))
+        solver.add_instance([Merge1C(ta, tb, out)], clusters, variables)
+        self.assertFalse(out in clusters)
+        self.assertEqual(solver.methods(), [])
+        self.assertTrue(solver.is_top_level(a))
+        # else it is added
+        solver = ClusterSolver(2)
+        solver.begin_batch(True)
+        solver.add(a)
+        solver.add(b)
+        clusters = {ta: a, tb: b}
+        solver.add_instance([Merge1C(ta, tb, out)], clusters, variables)
+        self.assertTrue(solver.is_top_level(clusters[out]))
+        self.assertEqual(set(clusters[out].vars), set(['x', 'y', 'z']))
+        self.assertFalse(solver.is_top_level(a))
+
+
+if __name__ == "__main__":
+    unittest.main()